@@ -2,7 +2,9 @@
 The functions are divided into 4 categories:
 1) Class Specific to XNAT and Spiders:
 InterfaceTemp to create an interface with XNAT using a tempfolder
+ConcurrentInterface to run many independent REST calls to XNAT concurrently
 AssessorHandler to handle assessor label string and access object
+ScanRecord/AssessorRecord compact rows for the project listings
 SpiderProcessHandler to handle results at the end of any spider
 
 2) Methods to query XNAT database and get XNAT object :
@@ -22,14 +24,26 @@ import re
 import os
 import sys
 import csv
+import json
+import time
 import xlrd
 import glob
 import gzip
+import fcntl
 import dicom
+import hashlib
 import shutil
+import atexit
+import urllib
 import random
+import socket
+import httplib
+import requests
+import zlib
+import struct
 import zipfile
 import tempfile
+import threading
 import dicom.UID
 import subprocess
 import collections
@@ -37,12 +51,57 @@ import numpy as np
 import nibabel as nib
 from lxml import etree
 from pyxnat import Interface
+from pyxnat.core.errors import is_xnat_error, catch_error
 from datetime import datetime
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from dicom.dataset import Dataset, FileDataset
 
 import task
 from dax_settings import DAX_Settings
 DAX_SETTINGS = DAX_Settings()
+CACHE_DIR = DAX_SETTINGS.get_cache_dir()
+DATATYPES_CACHE_TTL = DAX_SETTINGS.get_datatypes_cache_ttl()
+# Listing cache (opt-in, see enable_listing_cache): TTL in seconds per endpoint
+LISTING_CACHE_TTL = {'projects': 3600,
+                     'subjects': 600,
+                     'sessions': 300,
+                     'scans': 600,
+                     'assessors': 600}
+LISTING_CACHE = {'enabled': False, 'directory': None, 'ttl': LISTING_CACHE_TTL,
+                 'responses': dict()}
+# Start of the rows in a JSON listing from XNAT and separators between the rows
+JSON_RESULT_START = re.compile(r'"Result"\s*:\s*\[')
+JSON_ROW_SEPARATOR = re.compile(r'[\s,]*')
+# Errors of the connection to XNAT worth retrying (not the HTTP errors)
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError, httplib.HTTPException,
+                    socket.error)
+# Interfaces shared by the helpers (see get_pooled_interface)
+INTERFACE_POOL = dict()
+INTERFACE_POOL_LOCK = threading.Lock()
+# Concurrent clients shared by the helpers (see get_pooled_concurrent_interface)
+CONCURRENT_POOL = dict()
+# Download of the resources file by file (see download_files_from_obj):
+# used if the resource has at most PARALLEL_DL_MAX_FILES files and if they are
+# bigger than PARALLEL_DL_MIN_AVG_SIZE in average, zip otherwise
+PARALLEL_DL_WORKERS = 4
+PARALLEL_DL_MAX_FILES = 100
+PARALLEL_DL_MIN_AVG_SIZE = 1024*1024
+# Resumable downloads (see download_file_resume): with resume, the resources
+# with a file bigger than RESUME_DL_MIN_SIZE are downloaded file by file
+RESUME_DL_RETRIES = 5
+RESUME_DL_CHUNK_SIZE = 1024*1024
+RESUME_DL_MIN_SIZE = 100*1024*1024
+# Inputs shared by the spiders on a node (see download_cached_files)
+INPUT_CACHE_DIR = DAX_SETTINGS.get_input_cache_dir()
+INPUT_CACHE_SIZE = DAX_SETTINGS.get_input_cache_size()*1024**3
+# In-process gzip (see gzip_files): level 6 like the gzip command for the
+#  data archived on XNAT (level 1 is enough for scratch files), files bigger
+#  than GZIP_BLOCK_SIZE are compressed by blocks in parallel
+GZIP_LEVEL = 6
+GZIP_WORKERS = min(cpu_count(), 8)
+GZIP_BLOCK_SIZE = 8*1024*1024
 
 import xml.etree.cElementTree as ET
 
@@ -86,6 +145,7 @@ A_RESOURCE_URI   = '/REST/projects/{project}/subjects/{subject}/experiments/{ses
 SUBJECT_POST_URI = '''?columns=ID,project,label,URI,last_modified,src,handedness,gender,yob,dob'''
 SESSION_POST_URI = '''?xsiType={stype}&columns=ID,URI,subject_label,subject_ID,modality,project,date,xsiType,{stype}/age,label,{stype}/meta/last_modified,{stype}/original'''
 NO_MOD_SESSION_POST_URI = '''?xsiType={stype}&columns=ID,URI,subject_label,subject_ID,project,date,xsiType,{stype}/age,label,{stype}/meta/last_modified,{stype}/original'''
+ALL_TYPES_SESSION_POST_URI = '''?columns=ID,URI,subject_label,subject_ID,modality,project,date,xsiType,label,xnat:subjectassessordata/age,xnat:experimentdata/meta/last_modified,xnat:experimentdata/original'''
 SCAN_POST_URI = '''?columns=ID,URI,label,subject_label,project,xnat:imagesessiondata/scans/scan/id,xnat:imagesessiondata/scans/scan/type,xnat:imagesessiondata/scans/scan/quality,xnat:imagesessiondata/scans/scan/note,xnat:imagesessiondata/scans/scan/frames,xnat:imagesessiondata/scans/scan/series_description,xnat:imagesessiondata/subject_id'''
 SCAN_PROJ_POST_URI = '''?project={project}&xsiType=xnat:imageSessionData&columns=ID,URI,label,subject_label,project,xnat:imagesessiondata/subject_id,xnat:imagescandata/id,xnat:imagescandata/type,xnat:imagescandata/quality,xnat:imagescandata/note,xnat:imagescandata/frames,xnat:imagescandata/series_description,xnat:imagescandata/file/label'''
 SCAN_PROJ_INCLUDED_POST_URI = '''?xnat:imagesessiondata/sharing/share/project={project}&xsiType=xnat:imageSessionData&columns=ID,URI,label,subject_label,project,xnat:imagesessiondata/subject_id,xnat:imagescandata/id,xnat:imagescandata/type,xnat:imagescandata/quality,xnat:imagescandata/note,xnat:imagescandata/frames,xnat:imagescandata/series_description,xnat:imagescandata/file/label'''
@@ -130,6 +190,9 @@ class InterfaceTemp(Interface):
         if not os.path.exists(temp_dir):
             os.mkdir(temp_dir)
         self.temp_dir = temp_dir
+        # Datatypes installed on XNAT (see get_datatypes)
+        self.datatypes = None
+        self.closed = False
         super(InterfaceTemp, self).__init__(server=self.host,
                                             user=self.user,
                                             password=self.pwd,
@@ -154,6 +217,8 @@ class InterfaceTemp(Interface):
         if not os.path.exists(temp_dir):
             os.mkdir(temp_dir)
         self.temp_dir = temp_dir
+        self.datatypes = None
+        self.closed = False
         super(InterfaceTemp, self).__init__(server=self.host,
                                             user=self.user,
                                             password=self.pwd,
@@ -171,6 +236,163 @@ class InterfaceTemp(Interface):
         """
         self._exec('/data/JSESSION', method='DELETE')
         shutil.rmtree(self.temp_dir)
+        self.closed = True
+
+class ConcurrentInterface(object):
+    """
+    Run independent REST calls to XNAT concurrently (listings, attributes,
+     files download/upload) with a bounded number of threads and retries.
+     Each thread uses its own interface (pyxnat is not thread safe), opened
+     on its first request and disconnected by close().
+     The results are returned in the order of the requests.
+    """
+    def __init__(self, xnat_host=None, xnat_user=None, xnat_pass=None,
+                 max_workers=8, retries=3, retry_delay=1, interface_factory=None):
+        """
+        Entry point for the ConcurrentInterface class.
+
+        :param xnat_host: XNAT Host url
+        :param xnat_user: XNAT User ID
+        :param xnat_pass: XNAT Password
+        :param max_workers: maximum number of requests running at the same time
+        :param retries: number of times a request failing on the connection
+         is tried again (HTTP errors are not retried)
+        :param retry_delay: delay in seconds before the first retry (doubled
+         at each retry)
+        :param interface_factory: function returning a new interface for a
+         thread (default: get_interface with host/user/password), e.g. to
+         test against a mock XNAT
+        :return: None
+        """
+        self.host = xnat_host
+        self.user = xnat_user
+        self.pwd = xnat_pass
+        self.retries = retries
+        self.retry_delay = retry_delay
+        if interface_factory:
+            self.interface_factory = interface_factory
+        else:
+            self.interface_factory = lambda: get_interface(self.host, self.user, self.pwd)
+        self.interfaces = dict()
+        self.lock = threading.Lock()
+        self.pool = ThreadPool(max_workers)
+
+    def __enter__(self):
+        """Enter method for with statement."""
+        return self
+
+    def __exit__(self, type, value, traceback):
+        """Exit method for with statement."""
+        self.close()
+
+    def close(self):
+        """
+        Stop the threads and disconnect their interfaces
+
+        :return: None
+        """
+        self.pool.close()
+        self.pool.join()
+        with self.lock:
+            for intf in self.interfaces.values():
+                try:
+                    intf.disconnect()
+                except Exception:
+                    # XNAT not reachable anymore: the JSESSION will expire
+                    pass
+            self.interfaces.clear()
+
+    def get_thread_interface(self):
+        """
+        Get the interface of the current thread, opening it if needed
+
+        :return: interface object
+        """
+        ident = threading.current_thread().ident
+        intf = self.interfaces.get(ident)
+        if intf is None:
+            intf = self.interface_factory()
+            with self.lock:
+                self.interfaces[ident] = intf
+        return intf
+
+    def _call(self, args):
+        """
+        Run a request in a thread, retrying if the connection fails
+
+        :param args: tuple (function, item): function(intf, item) to call
+        :return: result of the function
+        """
+        func, item = args
+        attempt = 0
+        while True:
+            try:
+                return func(self.get_thread_interface(), item)
+            except TRANSPORT_ERRORS:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.retry_delay * 2 ** attempt)
+                attempt += 1
+
+    def map(self, func, items):
+        """
+        Call func(intf, item) for each item concurrently
+
+        :param func: function taking a pyxnat Interface and an item
+        :param items: list of items
+        :return: list of the results (same order as items)
+        """
+        return self.pool.map(self._call, [(func, item) for item in items])
+
+    def get_json(self, uris):
+        """
+        Get the JSON results for a list of listing URIs
+
+        :param uris: list of URIs (e.g. SC_RESOURCES_URI formatted)
+        :return: list of results for each URI (list of dictionaries)
+        """
+        return self.map(lambda intf, uri: intf._get_json(uri), uris)
+
+    def get_attrs(self, requests):
+        """
+        Get attributes of objects on XNAT
+
+        :param requests: list of tuples (object URI, attribute path)
+        :return: list of values
+        """
+        return self.map(lambda intf, req: intf.select(req[0]).attrs.get(req[1]),
+                        requests)
+
+    def set_attrs(self, requests):
+        """
+        Set attributes of objects on XNAT
+
+        :param requests: list of tuples (object URI, attribute path, value)
+        :return: None
+        """
+        self.map(lambda intf, req: intf.select(req[0]).attrs.set(req[1], req[2]),
+                 requests)
+
+    def get_files(self, requests):
+        """
+        Download files from XNAT
+
+        :param requests: list of tuples (file URI, local path)
+        :return: list of local paths
+        """
+        return self.map(lambda intf, req: intf.select(req[0]).get(req[1]),
+                        requests)
+
+    def put_files(self, requests, overwrite=True):
+        """
+        Upload files to XNAT
+
+        :param requests: list of tuples (local path, file URI)
+        :param overwrite: overwrite the files already on XNAT
+        :return: None
+        """
+        self.map(lambda intf, req: intf.select(req[1]).put(req[0], overwrite=overwrite),
+                 requests)
 
 class AssessorHandler:
     """
@@ -263,11 +485,308 @@ class AssessorHandler:
         string_obj = '''/project/{project}/subject/{subject}/experiment/{session}/assessor/{label}'''.format(project=self.project_id, subject=self.subject_label, session=self.session_label, label=self.assessor_label)
         return intf.select(string_obj)
 
+# Value of a key removed from a listing record
+_MISSING = object()
+
+class ListingRecord(object):
+    """
+    Compact row for the listings of a project. Each field is stored once in a
+     slot and the session information (demographics/dates) is shared between
+     all the rows of a session. The row can still be used as a dictionary with
+     the keys of the previous listing dictionaries (e.g. scan['ID']).
+    """
+    __slots__ = ('_session', '_extra')
+    # Fields stored in the slots of the subclasses
+    FIELDS = ()
+    # Other keys for the same fields (key: field)
+    ALIASES = {}
+    # Keys of the session information shared by the rows of a session
+    SESSION_KEYS = ('handedness', 'gender', 'yob', 'age', 'last_modified',
+                    'last_updated')
+    _SESSION_INDEX = dict((key, index) for index, key in enumerate(SESSION_KEYS))
+
+    def __init__(self, session_info, **fields):
+        """
+        Entry point for the ListingRecord class
+
+        :param session_info: tuple of the session information (SESSION_KEYS)
+        :param fields: values for FIELDS
+        :return: None
+        """
+        self._session = session_info
+        self._extra = None
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+
+    def __getitem__(self, key):
+        field = self.ALIASES.get(key, key)
+        if field in self.FIELDS:
+            value = getattr(self, field, _MISSING)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        if self._extra and key in self._extra:
+            if self._extra[key] is _MISSING:
+                raise KeyError(key)
+            return self._extra[key]
+        if key in self._SESSION_INDEX:
+            return self._session[self._SESSION_INDEX[key]]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        field = self.ALIASES.get(key, key)
+        if field in self.FIELDS:
+            setattr(self, field, value)
+        else:
+            # Never modify the session information shared with other rows
+            if self._extra is None:
+                self._extra = dict()
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        field = self.ALIASES.get(key, key)
+        if field in self.FIELDS:
+            # the aliases of the field are removed as well
+            delattr(self, field)
+        elif key in self._SESSION_INDEX:
+            # hide the shared session information for this row only
+            self[key] = _MISSING
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, ListingRecord)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, dict(self.items()))
+
+    def __getstate__(self):
+        fields = dict((field, getattr(self, field)) for field in self.FIELDS
+                      if hasattr(self, field))
+        extra = dict((key, value) for key, value in (self._extra or {}).iteritems()
+                     if value is not _MISSING)
+        hidden = [key for key, value in (self._extra or {}).iteritems()
+                  if value is _MISSING]
+        return (self._session, fields, extra, hidden)
+
+    def __setstate__(self, state):
+        self._session, fields, extra, hidden = state
+        self._extra = extra or None
+        for field, value in fields.iteritems():
+            setattr(self, field, value)
+        for key in hidden:
+            self[key] = _MISSING
+
+    def get(self, key, default=None):
+        """
+        Get the value for a key, default if the key does not exist
+
+        :param key: key to get
+        :param default: value to return if the key does not exist
+        :return: value for the key
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def has_key(self, key):
+        """
+        Check if the key exists (same as dictionary)
+
+        :param key: key to check
+        :return: True if it exists, False otherwise
+        """
+        return key in self
+
+    def keys(self):
+        """
+        Get the keys of the row (same keys as the listing dictionaries)
+
+        :return: list of keys
+        """
+        keys = [field for field in self.FIELDS if hasattr(self, field)]
+        keys.extend([key for key, field in self.ALIASES.iteritems() if hasattr(self, field)])
+        keys.extend([key for key in self.SESSION_KEYS
+                     if not self._extra or self._extra.get(key) is not _MISSING])
+        if self._extra:
+            keys.extend([key for key, value in self._extra.iteritems()
+                         if key not in keys and value is not _MISSING])
+        return keys
+
+    def values(self):
+        """
+        Get the values of the row
+
+        :return: list of values
+        """
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        """
+        Get the (key, value) pairs of the row
+
+        :return: list of tuples (key, value)
+        """
+        return [(key, self[key]) for key in self.keys()]
+
+    def iterkeys(self):
+        """
+        Iterate over the keys of the row
+
+        :return: iterator over the keys
+        """
+        return iter(self.keys())
+
+    def itervalues(self):
+        """
+        Iterate over the values of the row
+
+        :return: iterator over the values
+        """
+        return iter(self.values())
+
+    def iteritems(self):
+        """
+        Iterate over the (key, value) pairs of the row
+
+        :return: iterator over the tuples (key, value)
+        """
+        return iter(self.items())
+
+    def update(self, *args, **kwargs):
+        """
+        Update the row from a dictionary/list of pairs and keywords
+         (same as dictionary)
+
+        :return: None
+        """
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def pop(self, key, *default):
+        """
+        Remove a key and return its value (same as dictionary)
+
+        :param key: key to remove
+        :param default: value to return if the key does not exist
+        :return: value for the key
+        """
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        """
+        Remove and return a (key, value) pair (same as dictionary)
+
+        :return: tuple (key, value)
+        """
+        keys = self.keys()
+        if not keys:
+            raise KeyError('popitem(): record is empty')
+        return keys[-1], self.pop(keys[-1])
+
+    def setdefault(self, key, default=None):
+        """
+        Get the value for a key, setting it to default if it does not exist
+
+        :param key: key to get
+        :param default: value to set if the key does not exist
+        :return: value for the key
+        """
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def copy(self):
+        """
+        Get a dictionary copy of the row
+
+        :return: dictionary
+        """
+        return dict(self.items())
+
+def json_default(obj):
+    """
+    Encode the listing records with json (json.dumps(obj, default=json_default)
+     or cls=ListingJSONEncoder)
+
+    :param obj: object json can not encode
+    :except TypeError: not a listing record
+    :return: dictionary for the record
+    """
+    if isinstance(obj, ListingRecord):
+        return obj.copy()
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+class ListingJSONEncoder(json.JSONEncoder):
+    """
+    JSON encoder for the listings (plain dictionaries and listing records)
+    """
+    def default(self, obj):
+        return json_default(obj)
+
+class ScanRecord(ListingRecord):
+    """
+    Compact row for a scan from list_project_scans
+    """
+    FIELDS = ('ID', 'quality', 'note', 'frames', 'series_description', 'type',
+              'project_id', 'subject_id', 'subject_label', 'session_type',
+              'session_id', 'session_label', 'session_uri', 'resources')
+    __slots__ = FIELDS
+    ALIASES = {'scan_id': 'ID', 'scan_label': 'ID', 'label': 'ID',
+               'scan_quality': 'quality', 'scan_note': 'note',
+               'scan_frames': 'frames', 'scan_description': 'series_description',
+               'scan_type': 'type', 'project_label': 'project_id'}
+
+class AssessorRecord(ListingRecord):
+    """
+    Compact row for an assessor from list_project_assessors
+    """
+    FIELDS = ('ID', 'label', 'uri', 'project_id', 'subject_id', 'subject_label',
+              'session_type', 'session_id', 'session_label', 'procstatus',
+              'qcstatus', 'proctype', 'version', 'xsiType', 'jobid',
+              'jobstartdate', 'memused', 'walltimeused', 'jobnode', 'resources')
+    __slots__ = FIELDS
+    ALIASES = {'assessor_id': 'ID', 'assessor_label': 'label',
+               'assessor_uri': 'uri', 'project_label': 'project_id'}
+
 class SpiderProcessHandler:
     """
     Class to handle the uploading of results from a spider to the upload directory
     """
-    def __init__(self, script_name, suffix, project, subject, experiment, scan=None, time_writer=None):
+    def __init__(self, script_name, suffix, project, subject, experiment, scan=None, time_writer=None,
+                 handoff='move'):
         """
         Entry point to the SpiderProcessHandler Class
 
@@ -278,6 +797,12 @@ class SpiderProcessHandler:
         :param experiment: Session on XNAT
         :param scan: Scan (if needed) On Xnat
         :param time_writer: TimedWriter object if wanted
+        :param handoff: how the results go to the upload directory when it is on
+         the same file system: 'move' (rename, the results leave the job
+         directory: add each result once it is final), 'copy' or 'link'
+         (hardlinks sharing the data with the job files: only if they are
+         never written again, a change would also change the upload).
+         Otherwise the results are copied with a checksum.
         :return: None
 
         """
@@ -285,6 +810,7 @@ class SpiderProcessHandler:
         self.error = 0
         self.has_pdf = 0
         self.time_writer = time_writer
+        self.handoff = handoff
         # Get the process name and the version
         if len(script_name.split('/')) > 1:
             script_name = os.path.basename(script_name)
@@ -407,6 +933,54 @@ class SpiderProcessHandler:
         """
         self.print_msg('''  -Copying {label}: {src} to {dest}'''.format(label=label, src=src, dest=dest))
 
+    def handoff_file(self, src, dest):
+        """
+        Put a file in the upload directory: move/hardlink it if on the same
+         file system (see handoff), copy it with a checksum otherwise
+
+        :param src: Full path to the file in the job directory
+        :param dest: Full path to the file in the upload directory
+        :return: None
+
+        """
+        if os.path.exists(dest):
+            os.remove(dest)
+        if self.handoff != 'copy' and not os.path.islink(src):
+            try:
+                if self.handoff == 'move':
+                    os.rename(src, dest)
+                else:
+                    os.link(src, dest)
+                return
+            except OSError:
+                # not on the same file system
+                pass
+        copy_file_checksum(src, dest)
+
+    def handoff_folder(self, src, dest):
+        """
+        Put a folder in the upload directory (see handoff_file)
+
+        :param src: Full path to the folder in the job directory
+        :param dest: Full path to the folder in the upload directory (must not exist)
+        :except OSError: dest already exists
+        :return: None
+
+        """
+        if os.path.exists(dest):
+            raise OSError('Destination %s already exists' % dest)
+        if self.handoff == 'move':
+            try:
+                os.rename(src, dest)
+                return
+            except OSError:
+                pass
+        for root, _, files in os.walk(src, followlinks=True):
+            dest_root = os.path.join(dest, os.path.relpath(root, src))
+            os.makedirs(dest_root)
+            for fname in files:
+                self.handoff_file(os.path.join(root, fname), os.path.join(dest_root, fname))
+
     def add_pdf(self, filepath):
         """
         Add the PDF and run ps2pdf on the file if it ends with .ps
@@ -452,12 +1026,12 @@ class SpiderProcessHandler:
             respath = os.path.join(self.directory, resource)
             if not os.path.exists(respath):
                 os.mkdir(respath)
-            #mv the file
+            #hand off the file
             self.print_copying_statement(resource, filepath, respath)
-            shutil.copy(filepath, respath)
+            self.handoff_file(filepath, os.path.join(respath, os.path.basename(filepath)))
             #if it's a nii or a rec file, gzip it:
             if filepath.lower().endswith('.nii') or filepath.lower().endswith('.rec'):
-                os.system('gzip '+os.path.join(respath, os.path.basename(filepath)))
+                gzip_files([os.path.join(respath, os.path.basename(filepath))])
 
     def add_folder(self, folderpath, resource_name=None):
         """
@@ -478,10 +1052,10 @@ class SpiderProcessHandler:
             dest = os.path.join(self.directory, res)
 
             try:
-                shutil.copytree(folderpath, dest)
+                self.handoff_folder(folderpath, dest)
                 self.print_copying_statement(res, folderpath, dest)
-            # Directories are the same
-            except shutil.Error as excep:
+            # Copy not matching the source
+            except IOError as excep:
                 self.print_err('Directory not copied. Error: %s' % excep)
             # Any error saying that the directory doesn't exist
             except OSError as excep:
@@ -577,15 +1151,299 @@ def get_interface(host=None, user=None, pwd=None):
     # Don't sys.exit, let callers catch KeyErrors
     return InterfaceTemp(host, user, pwd)
 
-def list_projects(intf):
+def get_concurrent_interface(intf, max_workers=8):
+    """
+    Get a ConcurrentInterface connected to the same XNAT as an interface
+
+    :param intf: pyxnat.Interface object
+    :param max_workers: maximum number of requests running at the same time
+    :return: ConcurrentInterface object
+    """
+    host = getattr(intf, 'host', None) or intf._server
+    user = getattr(intf, 'user', None) or intf._user
+    pwd = getattr(intf, 'pwd', None) or intf._pwd
+    return ConcurrentInterface(host, user, pwd, max_workers=max_workers)
+
+def get_pooled_concurrent_interface(intf, max_workers=8):
+    """
+    Get the ConcurrentInterface of the process for the XNAT of an interface,
+     opening it if needed. Like get_pooled_interface, its threads and their
+     connections are reused by the next calls for the same host/user and it
+     is closed when the process exits. Do not close it.
+
+    :param intf: pyxnat.Interface object
+    :param max_workers: maximum number of requests running at the same time
+    :return: ConcurrentInterface object
+    """
+    host = getattr(intf, 'host', None) or intf._server
+    user = getattr(intf, 'user', None) or intf._user
+    key = (host, user, max_workers)
+    with INTERFACE_POOL_LOCK:
+        client = CONCURRENT_POOL.get(key)
+        if client is None:
+            client = get_concurrent_interface(intf, max_workers=max_workers)
+            CONCURRENT_POOL[key] = client
+    return client
+
+def get_pooled_interface(host=None, user=None, pwd=None):
+    """
+    Get a connection to XNAT from the pool of the process, opening it if
+     needed. The interface is kept open (keep-alive HTTP connection and
+     JSESSION) to be reused by the next calls for the same host/user and
+     is closed when the process exits. Do not disconnect it.
+     Each thread gets its own interface (pyxnat is not thread safe).
+
+    :param host: URL to connect to XNAT
+    :param user: XNAT username
+    :param pwd: XNAT password
+    :return: InterfaceTemp object which extends functionaly of pyxnat.Interface
+
+    """
+    if user == None:
+        user = os.environ['XNAT_USER']
+    if host == None:
+        host = os.environ['XNAT_HOST']
+    key = (host, user, threading.current_thread().ident)
+    with INTERFACE_POOL_LOCK:
+        intf = INTERFACE_POOL.get(key)
+        if intf is None or intf.closed:
+            intf = get_interface(host, user, pwd)
+            INTERFACE_POOL[key] = intf
+    return intf
+
+def close_interface_pool():
+    """
+    Disconnect all the interfaces and concurrent clients from the pools
+     (called when the process exits)
+
+    :return: None
+    """
+    with INTERFACE_POOL_LOCK:
+        for client in CONCURRENT_POOL.values():
+            client.close()
+        CONCURRENT_POOL.clear()
+        for intf in INTERFACE_POOL.values():
+            if not intf.closed:
+                try:
+                    intf.disconnect()
+                except Exception:
+                    # XNAT not reachable anymore: the JSESSION will expire
+                    pass
+        INTERFACE_POOL.clear()
+
+atexit.register(close_interface_pool)
+
+def enable_listing_cache(directory=None, ttl=None):
+    """
+    Enable the cache for the listing functions (list_projects, list_subjects,
+     list_sessions, list_project_scans and list_project_assessors).
+     The responses from XNAT are kept in memory and, if a directory is given
+     (default: cache_dir from the settings), on disk to be shared between
+     processes. Use it for tools where data a few minutes old is fine.
+
+    :param directory: folder to store the responses (None for cache_dir)
+    :param ttl: dictionary of TTL in seconds per endpoint to override
+     LISTING_CACHE_TTL (keys: projects/subjects/sessions/scans/assessors)
+    :return: None
+    """
+    LISTING_CACHE['enabled'] = True
+    LISTING_CACHE['directory'] = directory if directory else CACHE_DIR
+    LISTING_CACHE['ttl'] = dict(LISTING_CACHE_TTL)
+    if ttl:
+        LISTING_CACHE['ttl'].update(ttl)
+    prune_listing_cache()
+
+def prune_listing_cache():
+    """
+    Remove the files of the listing cache older than the longest TTL
+     (never valid anymore)
+
+    :return: None
+    """
+    if not LISTING_CACHE['directory']:
+        return
+    listing_dir = os.path.join(LISTING_CACHE['directory'], 'listing')
+    if not os.path.isdir(listing_dir):
+        return
+    max_age = max(LISTING_CACHE['ttl'].values())
+    for fname in os.listdir(listing_dir):
+        fpath = os.path.join(listing_dir, fname)
+        try:
+            if time.time() - os.path.getmtime(fpath) > max_age:
+                os.remove(fpath)
+        except OSError:
+            # removed by another process
+            pass
+
+def disable_listing_cache():
+    """
+    Disable the cache for the listing functions and clear the responses
+     kept in memory (the files on disk are kept).
+
+    :return: None
+    """
+    LISTING_CACHE['enabled'] = False
+    LISTING_CACHE['responses'].clear()
+
+def get_listing_cache_file(key):
+    """
+    Get the path of the file caching a response on disk
+
+    :param key: key of the response (host, user and URI)
+    :return: path to the file, None if no directory for the cache
+    """
+    if not LISTING_CACHE['directory']:
+        return None
+    return os.path.join(LISTING_CACHE['directory'], 'listing',
+                        hashlib.sha1('\n'.join(key)).hexdigest()+'.json')
+
+def get_json(intf, uri, endpoint, stamp=None, nocache=False):
+    """
+    Get the JSON results for a listing URI on XNAT, using the listing cache
+     if enabled. A cached response older than the TTL of the endpoint or
+     recorded with a different stamp is requested again.
+
+    :param intf: pyxnat.Interface object
+    :param uri: URI to query
+    :param endpoint: endpoint of the URI to get the TTL (see LISTING_CACHE_TTL)
+    :param stamp: value describing the state of the data on XNAT when the
+     response is valid (e.g. last_modified of the sessions)
+    :param nocache: True to bypass the cache and query XNAT
+    :return: list of dictionaries from the JSON results
+    """
+    if nocache or not LISTING_CACHE['enabled']:
+        return intf._get_json(uri)
+
+    host = getattr(intf, 'host', None) or intf._server
+    # the listings depend on the access rights of the user
+    user = getattr(intf, 'user', None) or getattr(intf, '_user', None) or ''
+    key = (host, user, uri)
+    entry = LISTING_CACHE['responses'].get(key)
+    cache_file = get_listing_cache_file(key)
+    if not entry and cache_file and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'r') as f_obj:
+                entry = json.load(f_obj)
+        except ValueError:
+            entry = None
+
+    if entry and time.time() - entry['time'] < LISTING_CACHE['ttl'][endpoint] \
+       and entry['stamp'] == stamp:
+        # New objects each time: the listing functions modify the results
+        return json.loads(entry['results'])
+
+    results = intf._get_json(uri)
+    entry = {'host': host, 'user': user, 'uri': uri, 'time': time.time(),
+             'stamp': stamp, 'results': json.dumps(results)}
+    LISTING_CACHE['responses'][key] = entry
+    if cache_file:
+        if not os.path.exists(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file))
+        tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+        # only readable by the user writing it
+        f_desc = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(f_desc, 'w') as f_obj:
+            json.dump(entry, f_obj)
+        os.rename(tmp_file, cache_file)
+    return results
+
+def get_sessions_stamp(session_list):
+    """
+    Get a stamp describing the state of a list of sessions on XNAT
+     (changes if a session is modified, added or removed)
+
+    :param session_list: list of sessions from list_sessions
+    :return: string for the stamp
+    """
+    last_modified = [sess['last_modified'] for sess in session_list if sess['last_modified']]
+    return '%d-%s' % (len(session_list), max(last_modified) if last_modified else '')
+
+def iter_json(intf, uri, endpoint=None, stamp=None, nocache=False):
+    """
+    Iterate over the JSON results for a listing URI on XNAT. The rows are
+     decoded one at a time from the response instead of loading the full list
+     of results in memory (uses the listing cache if enabled).
+
+    :param intf: pyxnat.Interface object
+    :param uri: URI to query
+    :param endpoint: endpoint of the URI for the listing cache (see get_json)
+    :param stamp: stamp for the listing cache (see get_json)
+    :param nocache: True to bypass the listing cache
+    :return: generator of dictionaries from the JSON results
+    """
+    if endpoint and LISTING_CACHE['enabled'] and not nocache:
+        for row in get_json(intf, uri, endpoint, stamp):
+            yield row
+        return
+
+    # same request as pyxnat _get_json
+    if '?' in uri:
+        json_uri = uri+'&format=json'
+    else:
+        json_uri = uri+'?format=json'
+    content = intf._exec(json_uri, 'GET')
+    if is_xnat_error(content):
+        catch_error(content)
+    match = JSON_RESULT_START.search(content)
+    if not match:
+        # Unexpected layout: decode the full response
+        for row in json.loads(content)['ResultSet']['Result']:
+            yield row
+        return
+
+    decoder = json.JSONDecoder()
+    index = match.end()
+    while True:
+        index = JSON_ROW_SEPARATOR.match(content, index).end()
+        if index >= len(content) or content[index] == ']':
+            break
+        row, index = decoder.raw_decode(content, index)
+        yield row
+
+def iter_merged_rows(rows, key_func, group_func, row_func, resource_func, resources):
+    """
+    Merge the rows of a listing from XNAT (one row per object and file label)
+     into one row per object with the list of resources. XNAT returns the rows
+     of a session together: the rows are yielded once the session is done.
+
+    :param rows: iterator over the rows from XNAT
+    :param key_func: function giving the key of the object from a row
+    :param group_func: function giving the session of the object from a row
+    :param row_func: function giving the new row for the object from a row
+    :param resource_func: function giving the resource label from a row
+    :param resources: dictionary of the resources lists of the objects
+     already found (key: object key) shared between the listings of a project
+    :return: generator of the merged rows
+    """
+    merged = collections.OrderedDict()
+    group = None
+    for row in rows:
+        if group_func(row) != group:
+            for new_row in merged.itervalues():
+                yield new_row
+            merged.clear()
+            group = group_func(row)
+        key = key_func(row)
+        if key in resources:
+            # resource list shared with the row already created
+            resources[key].append(resource_func(row))
+        else:
+            new_row = row_func(row)
+            merged[key] = new_row
+            resources[key] = new_row['resources']
+    for new_row in merged.itervalues():
+        yield new_row
+
+def list_projects(intf, nocache=False):
     """
     Gets a list of all of the projects that you have access to
 
     :param intf: pyxnat.Interface object
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
     :return: list of dictionaries of projects you have access to
 
     """
-    projects_list = intf._get_json(PROJECTS_URI)
+    projects_list = get_json(intf, PROJECTS_URI, 'projects', nocache=nocache)
     return projects_list
 
 def list_project_resources(intf, projectid):
@@ -600,13 +1458,14 @@ def list_project_resources(intf, projectid):
     resource_list = intf._get_json(post_uri)
     return resource_list
 
-def list_subjects(intf, projectid=None):
+def list_subjects(intf, projectid=None, nocache=False):
     """
     List all the subjects that you have access to. Or, alternatively, list
      the subjects in a single project based on passed project ID
 
     :param intf: pyxnat.Interface object
     :param projectid: ID of a project on XNAT
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
     :return: list of dictionaries of subjects in the project or projects.
 
     """
@@ -617,7 +1476,7 @@ def list_subjects(intf, projectid=None):
 
     post_uri += SUBJECT_POST_URI
 
-    subject_list = intf._get_json(post_uri)
+    subject_list = get_json(intf, post_uri, 'subjects', nocache=nocache)
 
     for subj in subject_list:
         if projectid:
@@ -647,7 +1506,7 @@ def list_subject_resources(intf, projectid, subjectid):
     resource_list = intf._get_json(post_uri)
     return resource_list
 
-def list_sessions(intf, projectid=None, subjectid=None):
+def list_sessions(intf, projectid=None, subjectid=None, nocache=False):
     """
     List all the sessions that you have access to. Or, alternatively, list the session
      in a single project (and single subject) based on passed project ID (/subject ID)
@@ -655,11 +1514,9 @@ def list_sessions(intf, projectid=None, subjectid=None):
     :param intf: pyxnat.Interface object
     :param projectid: ID of a project on XNAT
     :param subjectid: ID/label of a subject
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
     :return: List of sessions
     """
-    type_list = []
-    full_sess_list = []
-
     if projectid and subjectid:
         post_uri = SESSIONS_URI.format(project=projectid, subject=subjectid)
     elif projectid == None and subjectid == None:
@@ -669,55 +1526,110 @@ def list_sessions(intf, projectid=None, subjectid=None):
     else:
         return None
 
+    # Get all the sessions with their last_modified in one request if possible
+    full_sess_list = list_sessions_all_types(intf, post_uri, nocache)
+    if full_sess_list is None:
+        full_sess_list = list_sessions_by_type(intf, post_uri, nocache)
+
+    #Get the subjects list to get the demographics:
+    subj_list = list_subjects(intf, projectid, nocache)
+    subj_id2lab = dict((subj['ID'], [subj['handedness'], subj['gender'], subj['yob'], subj['dob']]) for subj in subj_list)
+    no_subj = [None, None, None, None]
+
+    for sess in full_sess_list:
+        # Override the project returned to be the one we queried
+        if projectid:
+            sess['project'] = projectid
+        sess['project_id'] = sess['project']
+        sess['project_label'] = sess['project']
+        sess['subject_id'] = sess['subject_ID']
+        sess['session_id'] = sess['ID']
+        sess['session_label'] = sess['label']
+        sess['handedness'], sess['gender'], sess['yob'], sess['dob'] = \
+            subj_id2lab.get(sess['subject_ID'], no_subj)
+
+    # Return list sorted by label
+    return sorted(full_sess_list, key=lambda k: k['session_label'])
+
+def get_session_type(sess_type):
+    """
+    Get the session type from the xsiType (MR for xnat:mrSessionData)
+
+    :param sess_type: xsiType of the session in lower case
+    :return: session type
+    """
+    if sess_type.startswith('xnat:') and 'session' in sess_type:
+        return sess_type.split('xnat:')[1].split('session')[0].upper()
+    else:
+        return sess_type
+
+def list_sessions_all_types(intf, post_uri, nocache=False):
+    """
+    List the sessions of all types with one request, using the columns
+     common to all experiments for last_modified/original/age.
+
+    :param intf: pyxnat.Interface object
+    :param post_uri: URI for the experiments to list
+    :param nocache: True to bypass the listing cache
+    :return: List of sessions, None if the XNAT server does not support it
+    """
+    try:
+        sess_list = get_json(intf, post_uri+ALL_TYPES_SESSION_POST_URI,
+                             'sessions', nocache=nocache)
+    except Exception:
+        return None
+    if sess_list and 'xnat:experimentdata/meta/last_modified' not in sess_list[0]:
+        return None
+
+    for sess in sess_list:
+        sess_type = sess['xsiType'].lower()
+        sess['session_type'] = get_session_type(sess_type)
+        sess['type'] = sess['session_type']
+        sess['last_modified'] = sess.get('xnat:experimentdata/meta/last_modified', None)
+        sess['last_updated'] = sess.get('xnat:experimentdata/original', None)
+        sess['age'] = sess.get('xnat:subjectassessordata/age', None)
+    return sess_list
+
+def list_sessions_by_type(intf, post_uri, nocache=False):
+    """
+    List the sessions with one request per xsiType
+     (older XNAT not supporting the common columns)
+
+    :param intf: pyxnat.Interface object
+    :param post_uri: URI for the experiments to list
+    :param nocache: True to bypass the listing cache
+    :return: List of sessions
+    """
+    type_list = []
+    full_sess_list = []
+
     # First get a list of all experiment types
     post_uri_types = post_uri+'?columns=xsiType'
-    sess_list = intf._get_json(post_uri_types)
+    sess_list = get_json(intf, post_uri_types, 'sessions', nocache=nocache)
     for sess in sess_list:
         sess_type = sess['xsiType'].lower()
         if sess_type not in type_list:
             type_list.append(sess_type)
 
-    #Get the subjects list to get the subject ID:
-    subj_list = list_subjects(intf, projectid)
-    subj_id2lab = dict((subj['ID'], [subj['handedness'], subj['gender'], subj['yob'], subj['dob']]) for subj in subj_list)
-
     # Get list of sessions for each type since we have to specific about last_modified field
     for sess_type in type_list:
         if sess_type.startswith('xnat:') and 'session' in sess_type:
             post_uri_type = post_uri + SESSION_POST_URI.format(stype=sess_type)
         else:
             post_uri_type = post_uri + NO_MOD_SESSION_POST_URI.format(stype=sess_type)
-        sess_list = intf._get_json(post_uri_type)
+        sess_list = get_json(intf, post_uri_type, 'sessions', nocache=nocache)
 
         for sess in sess_list:
-            # Override the project returned to be the one we queried
-            if projectid:
-                sess['project'] = projectid
-
-            sess['project_id'] = sess['project']
-            sess['project_label'] = sess['project']
-            sess['subject_id'] = sess['subject_ID']
-            sess['session_id'] = sess['ID']
-            sess['session_label'] = sess['label']
-            if sess_type.startswith('xnat:') and 'session' in sess_type:
-                sess['session_type'] = sess_type.split('xnat:')[1].split('session')[0].upper()
-                sess['type'] = sess_type.split('xnat:')[1].split('session')[0].upper()
-            else:
-                sess['session_type'] = sess_type
-                sess['type'] = sess_type
+            sess['session_type'] = get_session_type(sess_type)
+            sess['type'] = sess['session_type']
             sess['last_modified'] = sess.get(sess_type+'/meta/last_modified', None)
             sess['last_updated'] = sess.get(sess_type+'/original', None)
             sess['age'] = sess.get(sess_type+'/age', None)
-            sess['handedness'] = subj_id2lab[sess['subject_ID']][0]
-            sess['gender'] = subj_id2lab[sess['subject_ID']][1]
-            sess['yob'] = subj_id2lab[sess['subject_ID']][2]
-            sess['dob'] = subj_id2lab[sess['subject_ID']][3]
 
         # Add sessions of this type to full list
         full_sess_list.extend(sess_list)
 
-    # Return list sorted by label
-    return sorted(full_sess_list, key=lambda k: k['session_label'])
+    return full_sess_list
 
 def list_session_resources(intf, projectid, subjectid, sessionid):
     """
@@ -778,107 +1690,76 @@ def list_scans(intf, projectid, subjectid, sessionid):
 
     return sorted(new_list, key=lambda k: k['label'])
 
-def list_project_scans(intf, projectid, include_shared=True):
+def get_scan_row(scan, projectid, sess_id2mod):
     """
-    List all the scans that you have access to based on passed project.
+    Get the scan record from a row of the scans listing for a project
+
+    :param scan: row from the JSON listing
+    :param projectid: ID of a project on XNAT
+    :param sess_id2mod: dictionary of the sessions information (key: session ID)
+    :return: ScanRecord for the scan
+    """
+    return ScanRecord(sess_id2mod[scan['ID']],
+                      ID=scan['xnat:imagescandata/id'],
+                      quality=scan['xnat:imagescandata/quality'],
+                      note=scan['xnat:imagescandata/note'],
+                      frames=scan['xnat:imagescandata/frames'],
+                      series_description=scan['xnat:imagescandata/series_description'],
+                      type=scan['xnat:imagescandata/type'],
+                      project_id=projectid,
+                      subject_id=scan['xnat:imagesessiondata/subject_id'],
+                      subject_label=scan['subject_label'],
+                      session_type=intern(str(scan['xsiType'].split('xnat:')[1].split('Session')[0].upper())),
+                      session_id=scan['ID'],
+                      session_label=scan['label'],
+                      session_uri=scan['URI'],
+                      resources=[scan['xnat:imagescandata/file/label']])
+
+def iter_project_scans(intf, projectid, include_shared=True, nocache=False):
+    """
+    Iterate over all the scans that you have access to based on passed project.
+     The response from XNAT is decoded as the scans are yielded.
 
     :param intf: pyxnat.Interface object
     :param projectid: ID of a project on XNAT
     :param include_shared: include the shared data in this project
-    :return: List of all the scans for the project
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
+    :return: generator of the scans for the project (not sorted)
     """
-    scans_dict = dict()
-
     #Get the sessions list to get the modality:
-    session_list = list_sessions(intf, projectid)
-    sess_id2mod = dict((sess['session_id'], [sess['handedness'], sess['gender'], sess['yob'], sess['age'], sess['last_modified'], sess['last_updated']]) for sess in session_list)
+    session_list = list_sessions(intf, projectid, nocache=nocache)
+    stamp = get_sessions_stamp(session_list)
+    sess_id2mod = dict((sess['session_id'], tuple([sess[key] for key in ListingRecord.SESSION_KEYS]))
+                       for sess in session_list)
+    del session_list
 
-    post_uri = SE_ARCHIVE_URI
-    post_uri += SCAN_PROJ_POST_URI.format(project=projectid)
-    scan_list = intf._get_json(post_uri)
+    post_uris = [SE_ARCHIVE_URI+SCAN_PROJ_POST_URI.format(project=projectid)]
+    if include_shared:
+        post_uris.append(SE_ARCHIVE_URI+SCAN_PROJ_INCLUDED_POST_URI.format(project=projectid))
 
-    for scan in scan_list:
-        key = scan['ID']+'-x-'+scan['xnat:imagescandata/id']
-        if scans_dict.get(key):
-            scans_dict[key]['resources'].append(scan['xnat:imagescandata/file/label'])
-        else:
-            snew = {}
-            snew['scan_id'] = scan['xnat:imagescandata/id']
-            snew['scan_label'] = scan['xnat:imagescandata/id']
-            snew['scan_quality'] = scan['xnat:imagescandata/quality']
-            snew['scan_note'] = scan['xnat:imagescandata/note']
-            snew['scan_frames'] = scan['xnat:imagescandata/frames']
-            snew['scan_description'] = scan['xnat:imagescandata/series_description']
-            snew['scan_type'] = scan['xnat:imagescandata/type']
-            snew['ID'] = scan['xnat:imagescandata/id']
-            snew['label'] = scan['xnat:imagescandata/id']
-            snew['quality'] = scan['xnat:imagescandata/quality']
-            snew['note'] = scan['xnat:imagescandata/note']
-            snew['frames'] = scan['xnat:imagescandata/frames']
-            snew['series_description'] = scan['xnat:imagescandata/series_description']
-            snew['type'] = scan['xnat:imagescandata/type']
-            snew['project_id'] = projectid
-            snew['project_label'] = projectid
-            snew['subject_id'] = scan['xnat:imagesessiondata/subject_id']
-            snew['subject_label'] = scan['subject_label']
-            snew['session_type'] = scan['xsiType'].split('xnat:')[1].split('Session')[0].upper()
-            snew['session_id'] = scan['ID']
-            snew['session_label'] = scan['label']
-            snew['session_uri'] = scan['URI']
-            snew['handedness'] = sess_id2mod[scan['ID']][0]
-            snew['gender'] = sess_id2mod[scan['ID']][1]
-            snew['yob'] = sess_id2mod[scan['ID']][2]
-            snew['age'] = sess_id2mod[scan['ID']][3]
-            snew['last_modified'] = sess_id2mod[scan['ID']][4]
-            snew['last_updated'] = sess_id2mod[scan['ID']][5]
-            snew['resources'] = [scan['xnat:imagescandata/file/label']]
-            # make a dictionary of dictionaries
-            scans_dict[key] = (snew)
+    resources = dict()
+    for post_uri in post_uris:
+        scan_rows = iter_json(intf, post_uri, 'scans', stamp, nocache)
+        for snew in iter_merged_rows(scan_rows,
+                                     lambda scan: scan['ID']+'-x-'+scan['xnat:imagescandata/id'],
+                                     lambda scan: scan['ID'],
+                                     lambda scan: get_scan_row(scan, projectid, sess_id2mod),
+                                     lambda scan: scan['xnat:imagescandata/file/label'],
+                                     resources):
+            yield snew
 
-    if include_shared:
-        post_uri = SE_ARCHIVE_URI
-        post_uri += SCAN_PROJ_INCLUDED_POST_URI.format(project=projectid)
-        scan_list = intf._get_json(post_uri)
+def list_project_scans(intf, projectid, include_shared=True, nocache=False):
+    """
+    List all the scans that you have access to based on passed project.
 
-        for scan in scan_list:
-            key = scan['ID']+'-x-'+scan['xnat:imagescandata/id']
-            if scans_dict.get(key):
-                scans_dict[key]['resources'].append(scan['xnat:imagescandata/file/label'])
-            else:
-                snew = {}
-                snew['scan_id'] = scan['xnat:imagescandata/id']
-                snew['scan_label'] = scan['xnat:imagescandata/id']
-                snew['scan_quality'] = scan['xnat:imagescandata/quality']
-                snew['scan_note'] = scan['xnat:imagescandata/note']
-                snew['scan_frames'] = scan['xnat:imagescandata/frames']
-                snew['scan_description'] = scan['xnat:imagescandata/series_description']
-                snew['scan_type'] = scan['xnat:imagescandata/type']
-                snew['ID'] = scan['xnat:imagescandata/id']
-                snew['label'] = scan['xnat:imagescandata/id']
-                snew['quality'] = scan['xnat:imagescandata/quality']
-                snew['note'] = scan['xnat:imagescandata/note']
-                snew['frames'] = scan['xnat:imagescandata/frames']
-                snew['series_description'] = scan['xnat:imagescandata/series_description']
-                snew['type'] = scan['xnat:imagescandata/type']
-                snew['project_id'] = projectid
-                snew['project_label'] = projectid
-                snew['subject_id'] = scan['xnat:imagesessiondata/subject_id']
-                snew['subject_label'] = scan['subject_label']
-                snew['session_type'] = scan['xsiType'].split('xnat:')[1].split('Session')[0].upper()
-                snew['session_id'] = scan['ID']
-                snew['session_label'] = scan['label']
-                snew['session_uri'] = scan['URI']
-                snew['handedness'] = sess_id2mod[scan['ID']][0]
-                snew['gender'] = sess_id2mod[scan['ID']][1]
-                snew['yob'] = sess_id2mod[scan['ID']][2]
-                snew['age'] = sess_id2mod[scan['ID']][3]
-                snew['last_modified'] = sess_id2mod[scan['ID']][4]
-                snew['last_updated'] = sess_id2mod[scan['ID']][5]
-                snew['resources'] = [scan['xnat:imagescandata/file/label']]
-                # make a dictionary of dictionaries
-                scans_dict[key] = (snew)
-
-    return sorted(scans_dict.values(), key=lambda k: k['scan_label'])
+    :param intf: pyxnat.Interface object
+    :param projectid: ID of a project on XNAT
+    :param include_shared: include the shared data in this project
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
+    :return: List of all the scans for the project (ScanRecord, used as dictionaries)
+    """
+    return sorted(iter_project_scans(intf, projectid, include_shared, nocache),
+                  key=lambda k: k['scan_label'])
 
 def list_scan_resources(intf, projectid, subjectid, sessionid, scanid):
     """
@@ -968,120 +1849,128 @@ def list_assessors(intf, projectid, subjectid, sessionid):
 
     return sorted(new_list, key=lambda k: k['label'])
 
-def list_project_assessors(intf, projectid):
+def get_fs_assessor_row(asse, projectid, sess_id2mod):
     """
-    List all the assessors that you have access to based on passed project.
+    Get the assessor record from a row of the FreeSurfer listing for a project
+
+    :param asse: row from the JSON listing
+    :param projectid: ID of a project on XNAT
+    :param sess_id2mod: dictionary of the sessions information (key: session ID)
+    :return: AssessorRecord for the assessor
+    """
+    sess_info = sess_id2mod[asse['session_ID']]
+    proctype = 'FreeSurfer'
+    if len(asse['label'].rsplit('-x-FS')) > 1:
+        proctype = proctype+asse['label'].rsplit('-x-FS')[1]
+    return AssessorRecord(sess_info[2],
+                          ID=asse['ID'],
+                          label=asse['label'],
+                          uri=asse['URI'],
+                          project_id=projectid,
+                          subject_id=asse['xnat:imagesessiondata/subject_id'],
+                          subject_label=asse['subject_label'],
+                          session_type=sess_info[1],
+                          session_id=asse['session_ID'],
+                          session_label=asse['session_label'],
+                          procstatus=asse['fs:fsdata/procstatus'],
+                          qcstatus=asse['fs:fsdata/validation/status'],
+                          proctype=proctype,
+                          version=asse.get('fs:fsdata/procversion'),
+                          xsiType=asse['xsiType'],
+                          jobid=asse.get('fs:fsdata/jobid'),
+                          jobstartdate=asse.get('fs:fsdata/jobstartdate'),
+                          memused=asse.get('fs:fsdata/memused'),
+                          walltimeused=asse.get('fs:fsdata/walltimeused'),
+                          jobnode=asse.get('fs:fsdata/jobnode'),
+                          resources=[asse['fs:fsdata/out/file/label']])
+
+def get_genproc_assessor_row(asse, projectid, sess_id2mod):
+    """
+    Get the assessor record from a row of the genProcData listing for a project
+
+    :param asse: row from the JSON listing
+    :param projectid: ID of a project on XNAT
+    :param sess_id2mod: dictionary of the sessions information (key: session ID)
+    :return: AssessorRecord for the assessor
+    """
+    sess_info = sess_id2mod[asse['session_ID']]
+    return AssessorRecord(sess_info[2],
+                          ID=asse['ID'],
+                          label=asse['label'],
+                          uri=asse['URI'],
+                          project_id=projectid,
+                          subject_id=asse['xnat:imagesessiondata/subject_id'],
+                          subject_label=sess_info[0],
+                          session_type=sess_info[1],
+                          session_id=asse['session_ID'],
+                          session_label=asse['session_label'],
+                          procstatus=asse['proc:genprocdata/procstatus'],
+                          qcstatus=asse['proc:genprocdata/validation/status'],
+                          proctype=asse['proc:genprocdata/proctype'],
+                          version=asse['proc:genprocdata/procversion'],
+                          xsiType=asse['xsiType'],
+                          jobid=asse.get('proc:genprocdata/jobid'),
+                          jobstartdate=asse.get('proc:genprocdata/jobstartdate'),
+                          memused=asse.get('proc:genprocdata/memused'),
+                          walltimeused=asse.get('proc:genprocdata/walltimeused'),
+                          jobnode=asse.get('proc:genprocdata/jobnode'),
+                          resources=[asse['proc:genprocdata/out/file/label']])
+
+def iter_project_assessors(intf, projectid, nocache=False):
+    """
+    Iterate over all the assessors that you have access to based on passed
+     project. The response from XNAT is decoded as the assessors are yielded.
 
     :param intf: pyxnat.Interface object
     :param projectid: ID of a project on XNAT
-    :return: List of all the assessors for the project
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
+    :return: generator of the assessors for the project (not sorted)
     """
-    assessors_dict = dict()
-
     #Get the sessions list to get the different variables needed:
-    session_list = list_sessions(intf, projectid)
-    sess_id2mod = dict((sess['session_id'], [sess['subject_label'],
-                        sess['type'], sess['handedness'], sess['gender'],
-                        sess['yob'], sess['age'], sess['last_modified'],
-                        sess['last_updated']]) for sess in session_list)
-
+    session_list = list_sessions(intf, projectid, nocache=nocache)
+    stamp = get_sessions_stamp(session_list)
+    sess_id2mod = dict((sess['session_id'], (sess['subject_label'], sess['type'],
+                        tuple([sess[key] for key in ListingRecord.SESSION_KEYS])))
+                       for sess in session_list)
+    del session_list
+
+    listings = list()
     if has_fs_datatypes(intf):
         # First get FreeSurfer
         post_uri = SE_ARCHIVE_URI
         post_uri += ASSESSOR_FS_PROJ_POST_URI.format(project=projectid,
                                                      fstype=DEFAULT_FS_DATATYPE)
-        assessor_list = intf._get_json(post_uri)
-
-        for asse in assessor_list:
-            if asse['label']:
-                key = asse['label']
-                if assessors_dict.get(key):
-                    assessors_dict[key]['resources'].append(asse['fs:fsdata/out/file/label'])
-                else:
-                    anew = {}
-                    anew['ID'] = asse['ID']
-                    anew['label'] = asse['label']
-                    anew['uri'] = asse['URI']
-                    anew['assessor_id'] = asse['ID']
-                    anew['assessor_label'] = asse['label']
-                    anew['assessor_uri'] = asse['URI']
-                    anew['project_id'] = projectid
-                    anew['project_label'] = projectid
-                    anew['subject_id'] = asse['xnat:imagesessiondata/subject_id']
-                    anew['subject_label'] = asse['subject_label']
-                    anew['session_type'] = sess_id2mod[asse['session_ID']][1]
-                    anew['session_id'] = asse['session_ID']
-                    anew['session_label'] = asse['session_label']
-                    anew['procstatus'] = asse['fs:fsdata/procstatus']
-                    anew['qcstatus'] = asse['fs:fsdata/validation/status']
-                    anew['proctype'] = 'FreeSurfer'
-
-                    if len(asse['label'].rsplit('-x-FS')) > 1:
-                        anew['proctype'] = anew['proctype']+asse['label'].rsplit('-x-FS')[1]
-
-                    anew['version'] = asse.get('fs:fsdata/procversion')
-                    anew['xsiType'] = asse['xsiType']
-                    anew['jobid'] = asse.get('fs:fsdata/jobid')
-                    anew['jobstartdate'] = asse.get('fs:fsdata/jobstartdate')
-                    anew['memused'] = asse.get('fs:fsdata/memused')
-                    anew['walltimeused'] = asse.get('fs:fsdata/walltimeused')
-                    anew['jobnode'] = asse.get('fs:fsdata/jobnode')
-                    anew['handedness'] = sess_id2mod[asse['session_ID']][2]
-                    anew['gender'] = sess_id2mod[asse['session_ID']][3]
-                    anew['yob'] = sess_id2mod[asse['session_ID']][4]
-                    anew['age'] = sess_id2mod[asse['session_ID']][5]
-                    anew['last_modified'] = sess_id2mod[asse['session_ID']][6]
-                    anew['last_updated'] = sess_id2mod[asse['session_ID']][7]
-                    anew['resources'] = [asse['fs:fsdata/out/file/label']]
-                    assessors_dict[key] = anew
-
+        listings.append((post_uri, get_fs_assessor_row, 'fs:fsdata/out/file/label'))
     if has_genproc_datatypes(intf):
         # Then add genProcData
         post_uri = SE_ARCHIVE_URI
         post_uri += ASSESSOR_PR_PROJ_POST_URI.format(project=projectid,
                                                      pstype=DEFAULT_DATATYPE)
-        assessor_list = intf._get_json(post_uri)
+        listings.append((post_uri, get_genproc_assessor_row, 'proc:genprocdata/out/file/label'))
+
+    resources = dict()
+    for post_uri, row_func, resource_key in listings:
+        assessor_rows = (asse for asse in iter_json(intf, post_uri, 'assessors', stamp, nocache)
+                         if asse['label'])
+        for anew in iter_merged_rows(assessor_rows,
+                                     lambda asse: asse['label'],
+                                     lambda asse: asse['session_ID'],
+                                     lambda asse: row_func(asse, projectid, sess_id2mod),
+                                     lambda asse: asse[resource_key],
+                                     resources):
+            yield anew
+
+def list_project_assessors(intf, projectid, nocache=False):
+    """
+    List all the assessors that you have access to based on passed project.
 
-        for asse in assessor_list:
-            if asse['label']:
-                key = asse['label']
-                if assessors_dict.get(key):
-                    assessors_dict[key]['resources'].append(asse['proc:genprocdata/out/file/label'])
-                else:
-                    anew = {}
-                    anew['ID'] = asse['ID']
-                    anew['label'] = asse['label']
-                    anew['uri'] = asse['URI']
-                    anew['assessor_id'] = asse['ID']
-                    anew['assessor_label'] = asse['label']
-                    anew['assessor_uri'] = asse['URI']
-                    anew['project_id'] = projectid
-                    anew['project_label'] = projectid
-                    anew['subject_id'] = asse['xnat:imagesessiondata/subject_id']
-                    anew['subject_label'] = sess_id2mod[asse['session_ID']][0]
-                    anew['session_type'] = sess_id2mod[asse['session_ID']][1]
-                    anew['session_id'] = asse['session_ID']
-                    anew['session_label'] = asse['session_label']
-                    anew['procstatus'] = asse['proc:genprocdata/procstatus']
-                    anew['proctype'] = asse['proc:genprocdata/proctype']
-                    anew['qcstatus'] = asse['proc:genprocdata/validation/status']
-                    anew['version'] = asse['proc:genprocdata/procversion']
-                    anew['xsiType'] = asse['xsiType']
-                    anew['jobid'] = asse.get('proc:genprocdata/jobid')
-                    anew['jobnode'] = asse.get('proc:genprocdata/jobnode')
-                    anew['jobstartdate'] = asse.get('proc:genprocdata/jobstartdate')
-                    anew['memused'] = asse.get('proc:genprocdata/memused')
-                    anew['walltimeused'] = asse.get('proc:genprocdata/walltimeused')
-                    anew['handedness'] = sess_id2mod[asse['session_ID']][2]
-                    anew['gender'] = sess_id2mod[asse['session_ID']][3]
-                    anew['yob'] = sess_id2mod[asse['session_ID']][4]
-                    anew['age'] = sess_id2mod[asse['session_ID']][5]
-                    anew['last_modified'] = sess_id2mod[asse['session_ID']][6]
-                    anew['last_updated'] = sess_id2mod[asse['session_ID']][7]
-                    anew['resources'] = [asse['proc:genprocdata/out/file/label']]
-                    assessors_dict[key] = anew
-
-    return sorted(assessors_dict.values(), key=lambda k: k['label'])
+    :param intf: pyxnat.Interface object
+    :param projectid: ID of a project on XNAT
+    :param nocache: True to bypass the listing cache (see enable_listing_cache)
+    :return: List of all the assessors for the project (AssessorRecord, used as dictionaries)
+    """
+    return sorted(iter_project_assessors(intf, projectid, nocache),
+                  key=lambda k: k['label'])
 
 def list_assessor_out_resources(intf, projectid, subjectid, sessionid, assessorid):
     """
@@ -1253,6 +2142,54 @@ def generate_assessor_handler(project, subject, session, proctype, scan=None):
         assessor_label = '-x-'.join([project, subject, session, proctype])
     return AssessorHandler(assessor_label)
 
+def get_datatypes_cache_file(intf):
+    """
+    Get the path of the file caching on disk the datatypes of an XNAT host
+
+    :param intf: pyxnat.Interface object
+    :return: path to the cache file, None if no cache_dir in the settings
+    """
+    if not CACHE_DIR:
+        return None
+    host = getattr(intf, 'host', None) or intf._server
+    return os.path.join(CACHE_DIR, 'datatypes',
+                        re.sub(r'[^\w.-]', '_', host)+'.json')
+
+def get_datatypes(intf):
+    """
+    Get the datatypes installed on XNAT. The list is cached on the interface
+     and, if cache_dir is set in the settings, on disk for
+     datatypes_cache_ttl seconds to only inspect XNAT once.
+
+    :param intf: pyxnat.Interface object
+    :return: list of datatypes
+    """
+    datatypes = getattr(intf, 'datatypes', None)
+    if datatypes is not None:
+        return datatypes
+
+    cache_file = get_datatypes_cache_file(intf)
+    if cache_file and os.path.isfile(cache_file) and \
+       time.time() - os.path.getmtime(cache_file) < DATATYPES_CACHE_TTL:
+        try:
+            with open(cache_file, 'r') as f_obj:
+                datatypes = json.load(f_obj)
+        except ValueError:
+            datatypes = None
+
+    if datatypes is None:
+        datatypes = intf.inspect.datatypes()
+        if cache_file and DATATYPES_CACHE_TTL > 0:
+            if not os.path.exists(os.path.dirname(cache_file)):
+                os.makedirs(os.path.dirname(cache_file))
+            tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+            with open(tmp_file, 'w') as f_obj:
+                json.dump(datatypes, f_obj)
+            os.rename(tmp_file, cache_file)
+
+    intf.datatypes = datatypes
+    return datatypes
+
 def has_dax_datatypes(intf):
     """
     Check if Xnat instance has the datatypes for DAX
@@ -1260,7 +2197,7 @@ def has_dax_datatypes(intf):
     :param intf: pyxnat.Interface object
     :return: True if it does, False otherwise
     """
-    xnat_datatypes = intf.inspect.datatypes()
+    xnat_datatypes = get_datatypes(intf)
     for dax_datatype in DAX_SETTINGS.get_xsitype_include():
         if dax_datatype not in xnat_datatypes:
             return False
@@ -1273,7 +2210,7 @@ def has_fs_datatypes(intf):
     :param intf: pyxnat.Interface object
     :return: True if it does, False otherwise
     """
-    if DEFAULT_FS_DATATYPE not in intf.inspect.datatypes():
+    if DEFAULT_FS_DATATYPE not in get_datatypes(intf):
         return False
     return True
 
@@ -1284,7 +2221,7 @@ def has_genproc_datatypes(intf):
     :param intf: pyxnat.Interface object
     :return: True if it does, False otherwise
     """
-    if DEFAULT_DATATYPE not in intf.inspect.datatypes():
+    if DEFAULT_DATATYPE not in get_datatypes(intf):
         return False
     return True
 
@@ -1602,13 +2539,15 @@ def islist(argument, argname):
         argument = list()
     return argument
 
-def download_file_from_obj(directory, resource_obj, fname=None):
+def download_file_from_obj(directory, resource_obj, fname=None, resume=False):
     """
     Downloads a file from a Pyxnat EObject
 
     :param directory: Full path to the download directory
     :param resource_obj: Pyxnat EObject to download a file from
     :param fname: Name of the file that you want to download
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: File path to the file downloaded. Or None if the file doesn't exist
 
     """
@@ -1616,6 +2555,13 @@ def download_file_from_obj(directory, resource_obj, fname=None):
         return None
 
     if fname:
+        if INPUT_CACHE_DIR or resume:
+            files_list = get_resource_catalog(resource_obj)
+            for file_dict in files_list:
+                if file_dict['path'] == fname:
+                    fpath = os.path.join(directory, os.path.basename(fname))
+                    return download_catalog_file(resource_obj, files_list, file_dict, fpath,
+                                                 resume=resume)
         if resource_obj.file(fname).exists():
             fpath = os.path.join(directory, os.path.basename(fname))
             resource_obj.file(fname).get(fpath)
@@ -1624,9 +2570,117 @@ def download_file_from_obj(directory, resource_obj, fname=None):
             print '''ERROR: download_resource in XnatUtils: file {name} does not exist for resource {label}.'''.format(name=fname, label=resource_obj.label())
             return None
     else:
-        return download_biggest_file_from_obj(directory, resource_obj)
+        return download_biggest_file_from_obj(directory, resource_obj, resume)
+
+def download_catalog_file(resource_obj, files_list, file_dict, fpath, resume=False):
+    """
+    Download a file of a resource, through the input cache if it is set
+
+    :param resource_obj: Pyxnat EObject of the resource
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :param file_dict: dictionary of the file to download from files_list
+    :param fpath: local path for the file
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
+    :return: local path of the file
+    """
+    if use_input_cache(files_list):
+        try:
+            return download_cached_files(resource_obj, files_list, [(file_dict, fpath)],
+                                         resume=resume)[0]
+        except Exception as err:
+            print 'WARNING: download_catalog_file in XnatUtils: input cache failed (%s).' % err
+    if os.path.dirname(fpath) and not os.path.isdir(os.path.dirname(fpath)):
+        os.makedirs(os.path.dirname(fpath))
+    if resume:
+        download_file_resume(resource_obj._intf, file_dict, fpath)
+    else:
+        resource_obj.file(file_dict['path']).get(fpath)
+    return fpath
 
-def download_file(directory, resource, project_id=None, subject_id=None, session_id=None, scan_id=None, assessor_id=None, fname=None):
+def download_file_resume(intf, file_dict, fpath, retries=RESUME_DL_RETRIES, retry_delay=1):
+    """
+    Download a file to fpath.part, resuming it with an HTTP Range request
+     from the size already downloaded if the connection drops. The file is
+     checked against the size/digest from the catalog and renamed to fpath.
+
+    :param intf: pyxnat.Interface object
+    :param file_dict: dictionary of the file (see get_resource_catalog)
+    :param fpath: local path for the file
+    :param retries: number of times the download is tried again (HTTP client
+     errors like 401/403/404 are not retried)
+    :param retry_delay: delay in seconds before the first retry (doubled
+     at each retry)
+    :return: local path of the file
+    """
+    part_path = fpath+'.part'
+    attempt = 0
+    while True:
+        try:
+            offset = 0
+            if os.path.exists(part_path):
+                offset = os.path.getsize(part_path)
+            if file_dict['size'] and offset >= file_dict['size']:
+                # complete (or bigger, checked below)
+                response = None
+            else:
+                headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+                response = intf._http.get(intf._server+file_dict['uri'],
+                                          headers=headers, stream=True)
+            if response is not None and response.status_code != 416:
+                response.raise_for_status()
+                # 200: the server ignored the range, start from zero
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                with open(part_path, mode) as f_part:
+                    for data in response.iter_content(RESUME_DL_CHUNK_SIZE):
+                        f_part.write(data)
+
+            if not check_downloaded_file(part_path, file_dict):
+                os.remove(part_path)
+                raise IOError('size or digest of %s does not match the catalog' % fpath)
+            os.rename(part_path, fpath)
+            return fpath
+        except Exception as err:
+            if attempt >= retries or is_http_client_error(err):
+                raise
+            print 'WARNING: download of %s interrupted (%s), resuming...' % (fpath, err)
+            time.sleep(retry_delay * 2 ** attempt)
+            attempt += 1
+
+def is_http_client_error(err):
+    """
+    Check if an exception is an HTTP client error (4xx: unauthorized,
+     forbidden, not found, ...) that would fail again if retried. Timeouts
+     (408) and throttling (429) are not client errors here.
+
+    :param err: exception raised by a request
+    :return: True if the request must not be retried, False otherwise
+    """
+    if not isinstance(err, requests.exceptions.HTTPError) or err.response is None:
+        return False
+    return 400 <= err.response.status_code < 500 and \
+           err.response.status_code not in [408, 429]
+
+def check_downloaded_file(fpath, file_dict):
+    """
+    Check a downloaded file against the size and digest (MD5) from the catalog
+
+    :param fpath: local path of the file
+    :param file_dict: dictionary of the file (see get_resource_catalog)
+    :return: True if the file matches (or nothing to compare), False otherwise
+    """
+    if file_dict['size'] and os.path.getsize(fpath) != file_dict['size']:
+        return False
+    if file_dict['digest']:
+        md5 = hashlib.md5()
+        with open(fpath, 'rb') as f_data:
+            for data in iter(lambda: f_data.read(RESUME_DL_CHUNK_SIZE), ''):
+                md5.update(data)
+        return md5.hexdigest() == file_dict['digest']
+    return True
+
+def download_file(directory, resource, project_id=None, subject_id=None, session_id=None, scan_id=None, assessor_id=None, fname=None,
+                  resume=False):
     """
     Download a file from an arbitrarily defined pyxnat EObject at any
      hierarchy of the URI tree
@@ -1639,21 +2693,389 @@ def download_file(directory, resource, project_id=None, subject_id=None, session
     :param scan_id:  Scan ID to download from
     :param assessor_id: Assessor ID/label to download from
     :param fname: File name that you want to download from the selected EObject
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: Path to the file downloaded.
 
     """
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     resource_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id, resource)
-    fpath = download_file_from_obj(directory, resource_obj, fname)
-    xnat.disconnect()
+    fpath = download_file_from_obj(directory, resource_obj, fname, resume)
     return fpath
 
-def download_files_from_obj(directory, resource_obj):
+def get_resource_catalog(resource_obj):
+    """
+    Get the list of the files in a resource from its catalog (one request)
+
+    :param resource_obj: Pyxnat EObject of the resource
+    :return: list of dictionaries (path relative to the resource, size in
+     bytes, digest if computed by XNAT, URI, format, content, tags)
+    """
+    files_list = list()
+    for file_dict in resource_obj._intf._get_json(resource_obj._uri+'/files'):
+        uri = file_dict['URI']
+        files_list.append({'path': urllib.unquote(uri.split('/files/', 1)[1]),
+                           'size': int(file_dict.get('Size') or 0),
+                           'digest': file_dict.get('digest') or '',
+                           'uri': uri,
+                           'format': file_dict.get('file_format') or '',
+                           'content': file_dict.get('file_content') or '',
+                           'tags': file_dict.get('file_tags') or ''})
+    return files_list
+
+def get_biggest_catalog_file(files_list):
+    """
+    Get the largest file (based on file size in bytes) of a resource catalog
+
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :return: dictionary of the largest file, None if no file with a size > 0
+    """
+    biggest = None
+    for file_dict in files_list:
+        if file_dict['size'] > 0 and \
+           (biggest is None or biggest['size'] < file_dict['size']):
+            biggest = file_dict
+    return biggest
+
+def get_download_engine(files_list):
+    """
+    Choose how to download a resource: file by file concurrently ('files',
+     for a few large files) or as a zip generated by XNAT ('zip', better for
+     many files or small files)
+
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :return: 'files' or 'zip'
+    """
+    if not files_list or len(files_list) > PARALLEL_DL_MAX_FILES:
+        return 'zip'
+    total_size = sum(file_dict['size'] for file_dict in files_list)
+    if total_size/len(files_list) >= PARALLEL_DL_MIN_AVG_SIZE:
+        return 'files'
+    return 'zip'
+
+def has_large_file(files_list):
+    """
+    Check if a resource has a file too big to be downloaded again from the
+     start if the connection drops (see RESUME_DL_MIN_SIZE)
+
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :return: True if a file is bigger than RESUME_DL_MIN_SIZE, False otherwise
+    """
+    return any(file_dict['size'] >= RESUME_DL_MIN_SIZE for file_dict in files_list)
+
+def download_catalog_files(res_dir, resource_obj, files_list,
+                           max_workers=PARALLEL_DL_WORKERS, resume=False):
+    """
+    Download the files of a resource concurrently in res_dir, keeping their
+     path in the resource. Each file is written to a temporary name and
+     renamed when complete.
+
+    :param res_dir: Full path to the folder for the resource files
+    :param resource_obj: Pyxnat EObject of the resource
+    :param files_list: list of files to download (see get_resource_catalog)
+    :param max_workers: maximum number of files downloaded at the same time
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
+    :return: list of the files downloaded
+    """
+    res_uri = resource_obj._uri
+
+    def get_file(xnat, file_dict):
+        """Download a file of the resource with a temporary name."""
+        fpath = os.path.join(res_dir, file_dict['path'])
+        try:
+            os.makedirs(os.path.dirname(fpath))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(fpath)):
+                raise
+        if resume:
+            return download_file_resume(xnat, file_dict, fpath)
+        tmp_path = fpath+'.part'
+        try:
+            xnat.select(res_uri).file(file_dict['path']).get(tmp_path)
+            os.rename(tmp_path, fpath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return fpath
+
+    # threads and connections shared by the downloads of all the resources
+    client = get_pooled_concurrent_interface(resource_obj._intf, max_workers=max_workers)
+    return client.map(get_file, files_list)
+
+def lock_file(path, blocking=True):
+    """
+    Open a file and lock it (exclusive lock, released when the file is closed)
+
+    :param path: path to the lock file
+    :param blocking: wait for the lock if True, otherwise return None if the
+     file is already locked
+    :return: file object to close to release the lock
+    """
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    while True:
+        f_lock = open(path, 'a')
+        try:
+            fcntl.flock(f_lock, flags)
+        except IOError:
+            f_lock.close()
+            if blocking:
+                raise
+            return None
+        # the file may have been removed by its previous owner (see
+        # evict_input_cache) while we were waiting: lock the new one
+        try:
+            if os.fstat(f_lock.fileno()).st_ino == os.stat(path).st_ino:
+                return f_lock
+        except OSError:
+            pass
+        f_lock.close()
+
+def use_input_cache(files_list):
+    """
+    Check if the files of a resource can go through the input cache: XNAT must
+     have computed the digest of every file, otherwise a file uploaded again
+     with the same size would keep the same cache entry and the old content
+     would be served
+
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :return: True if the input cache is set and can be used, False otherwise
+    """
+    if not INPUT_CACHE_DIR or not files_list:
+        return False
+    return all(file_dict['digest'] for file_dict in files_list)
+
+def get_input_cache_entry(resource_obj, files_list):
+    """
+    Get the folder of a resource in the input cache: the key is the resource
+     URI and the digest of its catalog (any change on XNAT gives a new entry)
+
+    :param resource_obj: Pyxnat EObject of the resource
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :return: path to the folder in INPUT_CACHE_DIR
+    """
+    intf = resource_obj._intf
+    key = hashlib.sha1(getattr(intf, 'host', None) or intf._server)
+    key.update(resource_obj._uri)
+    for file_dict in sorted(files_list, key=lambda x: x['path']):
+        key.update(u'\n{path}:{size}:{digest}'.format(**file_dict).encode('utf-8'))
+    return os.path.join(INPUT_CACHE_DIR, key.hexdigest())
+
+def link_input_file(src, dst):
+    """
+    Hardlink a file from the input cache (copy it on another file system)
+
+    :param src: path to the file in the input cache
+    :param dst: path to the link to create
+    :return: None
+    """
+    if not os.path.isdir(os.path.dirname(dst)):
+        os.makedirs(os.path.dirname(dst))
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+def reflink_copy(src, dst):
+    """
+    Copy a file/folder with a copy-on-write clone (btrfs, xfs, ...): no data
+     is duplicated on disk and a change on one copy does not affect the other
+
+    :param src: path to the file/folder to copy
+    :param dst: path to the copy (must not exist)
+    :return: True if the clone succeeded, False if not supported
+    """
+    with open(os.devnull, 'w') as devnull:
+        try:
+            ret = subprocess.call(['cp', '-R', '--reflink=always', src, dst],
+                                  stdout=devnull, stderr=devnull)
+        except OSError:
+            ret = 1
+    if ret != 0 and os.path.lexists(dst):
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        else:
+            os.remove(dst)
+    return ret == 0
+
+def link_or_copy(src, dst, hardlink=False):
+    """
+    Copy a file/folder with the cheapest method the file system allows:
+     reflink (copy-on-write clone) or a full copy. Hardlinks are only used
+     if asked: the data is shared with the source, so a change in place on
+     the copy would change the source too.
+
+    :param src: path to the file/folder to copy
+    :param dst: path to the copy (must not exist)
+    :param hardlink: hardlink the files if the reflink is not supported
+     (only if the copy is never modified in place)
+    :return: method used ('reflink', 'hardlink' or 'copy')
+    """
+    if reflink_copy(src, dst):
+        return 'reflink'
+    if hardlink:
+        try:
+            if os.path.isdir(src):
+                for root, dirs, files in os.walk(src):
+                    dst_root = os.path.join(dst, os.path.relpath(root, src))
+                    os.makedirs(dst_root)
+                    for fname in files:
+                        os.link(os.path.join(root, fname), os.path.join(dst_root, fname))
+            else:
+                os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            # other file system or links not allowed
+            if os.path.isdir(dst):
+                shutil.rmtree(dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+    return 'copy'
+
+def download_cached_files(resource_obj, files_list, targets, resume=False):
+    """
+    Get files of a resource through the input cache shared by the jobs on
+     the node: the files missing in the cache are downloaded (only once
+     thanks to a lock per resource) then linked to the local paths.
+     The files in the cache are read-only. Every file must have a digest
+     (see use_input_cache).
+
+    :param resource_obj: Pyxnat EObject of the resource
+    :param files_list: list of files in the resource (see get_resource_catalog)
+    :param targets: list of tuples (file dictionary from files_list, local path)
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
+    :return: list of the local paths
+    """
+    entry = get_input_cache_entry(resource_obj, files_list)
+    f_lock = lock_file(entry+'.lock')
+    try:
+        if not os.path.isdir(entry):
+            os.makedirs(entry)
+        missing = [file_dict for file_dict, _ in targets
+                   if not os.path.isfile(os.path.join(entry, file_dict['path']))]
+        cache_size = 0
+        if missing:
+            added_size = 0
+            for fpath in download_catalog_files(entry, resource_obj, missing, resume=resume):
+                os.chmod(fpath, 0444)
+                added_size += os.path.getsize(fpath)
+            cache_size = add_input_cache_size(added_size)
+        # last use of the entry for the eviction
+        os.utime(entry, None)
+        for file_dict, fpath in targets:
+            link_input_file(os.path.join(entry, file_dict['path']), fpath)
+    finally:
+        f_lock.close()
+
+    # only walk the cache to evict when it grew over the limit (or its size
+    # is not known yet)
+    if cache_size is None or cache_size > INPUT_CACHE_SIZE:
+        evict_input_cache()
+    return [fpath for _, fpath in targets]
+
+def add_input_cache_size(size):
+    """
+    Add to the size of the input cache recorded in its folder (updated by the
+     downloads and measured by evict_input_cache)
+
+    :param size: number of bytes added to the cache
+    :return: new size of the cache in bytes, None if it was not recorded yet
+    """
+    with open(os.path.join(INPUT_CACHE_DIR, '.size'), 'a+') as f_size:
+        fcntl.flock(f_size, fcntl.LOCK_EX)
+        f_size.seek(0)
+        try:
+            cache_size = int(f_size.read())
+        except ValueError:
+            cache_size = None
+        f_size.truncate(0)
+        f_size.write(str((cache_size or 0)+size))
+    if cache_size is None:
+        return None
+    return cache_size+size
+
+def set_input_cache_size(size):
+    """
+    Record the size of the input cache measured by evict_input_cache
+
+    :param size: size of the cache in bytes
+    :return: None
+    """
+    with open(os.path.join(INPUT_CACHE_DIR, '.size'), 'a+') as f_size:
+        fcntl.flock(f_size, fcntl.LOCK_EX)
+        f_size.truncate(0)
+        f_size.write(str(size))
+
+def evict_input_cache(max_size=None):
+    """
+    Remove the least recently used resources from the input cache when it
+     is bigger than max_size. The resources in use are skipped. The size
+     measured is recorded for the next downloads (see add_input_cache_size).
+
+    :param max_size: maximum size in bytes (default: input_cache_size setting)
+    :return: None
+    """
+    if max_size is None:
+        max_size = INPUT_CACHE_SIZE
+    f_lock = lock_file(os.path.join(INPUT_CACHE_DIR, '.evict.lock'), blocking=False)
+    if not f_lock:
+        # another job is already cleaning the cache
+        return
+    try:
+        entries = list()
+        for name in os.listdir(INPUT_CACHE_DIR):
+            entry = os.path.join(INPUT_CACHE_DIR, name)
+            if os.path.isdir(entry):
+                size = sum(os.path.getsize(os.path.join(root, fname))
+                           for root, _, fnames in os.walk(entry) for fname in fnames)
+                entries.append((os.path.getmtime(entry), size, entry))
+            elif name.endswith('.lock') and name != '.evict.lock' and \
+                 not os.path.isdir(entry[:-5]):
+                # lock left by an entry removed before the locks were cleaned
+                entry_lock = lock_file(entry, blocking=False)
+                if entry_lock:
+                    try:
+                        os.remove(entry)
+                    finally:
+                        entry_lock.close()
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= max_size:
+                break
+            entry_lock = lock_file(entry+'.lock', blocking=False)
+            if not entry_lock:
+                continue
+            try:
+                shutil.rmtree(entry)
+                os.remove(entry+'.lock')
+                total_size -= size
+            finally:
+                entry_lock.close()
+        set_input_cache_size(total_size)
+    finally:
+        f_lock.close()
+
+def download_files_from_obj(directory, resource_obj, engine=None, resume=False):
     """
     Download ALL of the files from a Pyxnat EObject
 
     :param directory: Full path to the download directory
     :param resource_obj: Pyxnat EObject to download all the files from
+    :param engine: 'files' to download file by file concurrently, 'zip' to
+     download the zip generated by XNAT, None to choose from the catalog
+     (see get_download_engine). Ignored if the input cache is used.
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume). The zip can
+     not be resumed: it is still used if get_download_engine chooses it,
+     unless a file is bigger than RESUME_DL_MIN_SIZE.
     :return: List of all the files downloaded, or empty list if no files
      downloaded
 
@@ -1662,15 +3084,32 @@ def download_files_from_obj(directory, resource_obj):
     if not check_dl_inputs(directory, resource_obj, 'download_files_from_obj'):
         return fpaths #return empty list without anything being download
 
+    res_dir = os.path.join(directory, resource_obj.label())
+    if engine != 'zip' or INPUT_CACHE_DIR:
+        files_list = get_resource_catalog(resource_obj)
+        if use_input_cache(files_list):
+            try:
+                targets = [(file_dict, os.path.join(res_dir, file_dict['path']))
+                           for file_dict in files_list]
+                return download_cached_files(resource_obj, files_list, targets, resume=resume)
+            except Exception as err:
+                print 'WARNING: download_files_from_obj in XnatUtils: input cache failed (%s).' % err
+        if engine != 'zip' and \
+           (engine == 'files' or get_download_engine(files_list) == 'files' or
+            (resume and has_large_file(files_list))):
+            try:
+                return download_catalog_files(res_dir, resource_obj, files_list, resume=resume)
+            except Exception as err:
+                print 'WARNING: download_files_from_obj in XnatUtils: file by file download failed (%s). Downloading the zip.' % err
+
     resource_obj.get(directory, extract=True)
-    resource_dir = os.path.join(directory, resource_obj.label())
-    for root, _, filenames in os.walk(resource_dir):
+    for root, _, filenames in os.walk(res_dir):
         fpaths.extend([os.path.join(root, filename) for filename in filenames])
 
     return fpaths
 
 def download_files(directory, resource, project_id=None, subject_id=None,
-                   session_id=None, scan_id=None, assessor_id=None):
+                   session_id=None, scan_id=None, assessor_id=None, resume=False):
     """
     Download a file from an arbitrarily defined pyxnat EObject at any
      hierarcy of the URI tree
@@ -1682,51 +3121,44 @@ def download_files(directory, resource, project_id=None, subject_id=None,
     :param session_id: Session ID/label to download from
     :param scan_id:  Scan ID to download from
     :param assessor_id: Assessor ID/label to download from
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: List of all the files downloaded
 
     """
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     resource_obj = select_obj(xnat, project_id, subject_id, session_id,
                               scan_id, assessor_id, resource)
-    fpaths = download_files_from_obj(directory, resource_obj)
-    xnat.disconnect()
+    fpaths = download_files_from_obj(directory, resource_obj, resume=resume)
     return fpaths
 
-def download_biggest_file_from_obj(directory, resource_obj):
+def download_biggest_file_from_obj(directory, resource_obj, resume=False):
     """
     Downloads the largest file (based on file size in bytes) from a Pyxnat EObject
 
     :param directory: Full path to the download directory
     :param resource_obj: Pyxnat EObject to download from
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: None if the file was not downloaded. None if the file size is <=0,
      and None if XnatUtils.check_dl_inputs fails. Otherwise, the file path is
      returned for the file downloaded
 
     """
-    file_index = 0
-    biggest_size = 0
-    fpath = None
     if not check_dl_inputs(directory, resource_obj, 'download_biggest_file_from_obj'):
         return None
 
-    for index, file_obj in enumerate(resource_obj.files()):
-        fsize = int(file_obj.size())
-        if biggest_size < fsize:
-            biggest_size = fsize
-            file_index = index
-            fpath = file_obj._urn
-    if biggest_size > 0 and fpath:
-        resource_fname = resource_obj.files().get()[file_index]
-        if not os.path.isdir(directory):
-            os.makedirs(directory)
-        resource_obj.file(fpath).get(os.path.join(directory, resource_fname))
-        return os.path.join(directory, resource_fname)
+    files_list = get_resource_catalog(resource_obj)
+    file_dict = get_biggest_catalog_file(files_list)
+    if file_dict:
+        fpath = os.path.join(directory, os.path.basename(file_dict['path']))
+        return download_catalog_file(resource_obj, files_list, file_dict, fpath, resume)
     else:
         return None
 
 def download_biggest_file(directory, resource, project_id=None,
                           subject_id=None, session_id=None,
-                          scan_id=None, assessor_id=None):
+                          scan_id=None, assessor_id=None, resume=False):
     """
     Download the larged file (based on file size in bytes) from an arbitrarily
      defined URI based on project/subject/session etc.
@@ -1738,16 +3170,17 @@ def download_biggest_file(directory, resource, project_id=None,
     :param session_id: XNAT session ID/label to download from
     :param scan_id: XNAT scan ID to download from
     :param assessor_id: XNAT assessor label/ID to download from
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: File path of the file downloaded
 
     """
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     resource_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id, resource)
-    fpath = download_biggest_file_from_obj(directory, resource_obj)
-    xnat.disconnect()
+    fpath = download_biggest_file_from_obj(directory, resource_obj, resume)
     return fpath
 
-def download_from_obj(directory, xnat_obj, resources, all_files=False):
+def download_from_obj(directory, xnat_obj, resources, all_files=False, resume=False):
     """
     Download files from resource(s) on XNAT.
 
@@ -1757,6 +3190,8 @@ def download_from_obj(directory, xnat_obj, resources, all_files=False):
      download from
     :param all_files: If True download all of the files, if False, download
      the biggest
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: List of filepaths downloaded
 
     """
@@ -1783,14 +3218,15 @@ def download_from_obj(directory, xnat_obj, resources, all_files=False):
         else:
             resource_obj = xnat_obj.resource(resource)
         if all_files:
-            fpath = download_files_from_obj(directory, resource_obj)
+            fpath = download_files_from_obj(directory, resource_obj, resume=resume)
             fpaths.append(fpath)
         else:
-            fpath = download_biggest_file_from_obj(directory, resource_obj)
+            fpath = download_biggest_file_from_obj(directory, resource_obj, resume)
             fpaths.append(fpath)
     return fpaths
 
-def download(directory, resources, project_id=None, subject_id=None, session_id=None, scan_id=None, assessor_id=None, all_files=False):
+def download(directory, resources, project_id=None, subject_id=None, session_id=None, scan_id=None, assessor_id=None, all_files=False,
+             resume=False):
     """
     General downloader from arbitrary URI based on inputs.
 
@@ -1803,16 +3239,18 @@ def download(directory, resources, project_id=None, subject_id=None, session_id=
     :param assessor_id: XNAT assessor ID/label
     :param all_files: If True, download all of the files, if False, download
      the biggest file
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: List of filepaths for the downloaded files
 
     """
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     xnat_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id)
-    fpaths = download_from_obj(directory, xnat_obj, resources, all_files)
-    xnat.disconnect()
+    fpaths = download_from_obj(directory, xnat_obj, resources, all_files, resume)
     return fpaths
 
-def download_scan_types(directory, project_id, subject_id, session_id, scantypes, resources, all_files=False):
+def download_scan_types(directory, project_id, subject_id, session_id, scantypes, resources, all_files=False,
+                        resume=False):
     """
     Downloads resources from a scan given a scan type, rather than a scan ID
 
@@ -1823,6 +3261,8 @@ def download_scan_types(directory, project_id, subject_id, session_id, scantypes
     :param scantypes: List of scan types to download resources from.
     :param resources: List of resources to download data from.
     :param all_files: If 1, download from all resources for the scan object, otherwise use the list.
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: list of filepaths for the files downloaded
 
     """
@@ -1830,15 +3270,15 @@ def download_scan_types(directory, project_id, subject_id, session_id, scantypes
     scantypes = islist(scantypes, 'scantypes')
     if not scantypes:
         return fpaths
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     for scan in list_scans(xnat, project_id, subject_id, session_id):
         if scan['type'] in scantypes:
             scan_obj = select_obj(xnat, project_id, subject_id, session_id, scan['ID'])
-            fpaths.extend(download_from_obj(directory, scan_obj, resources, all_files))
-    xnat.disconnect()
+            fpaths.extend(download_from_obj(directory, scan_obj, resources, all_files, resume))
     return fpaths
 
-def download_scan_seriesdescriptions(directory, project_id, subject_id, session_id, seriesdescriptions, resources, all_files=False):
+def download_scan_seriesdescriptions(directory, project_id, subject_id, session_id, seriesdescriptions, resources, all_files=False,
+                                     resume=False):
     """
     Downloads resources from a scan given a series type, rather than a scan ID
 
@@ -1851,6 +3291,8 @@ def download_scan_seriesdescriptions(directory, project_id, subject_id, session_
     :param resources: List of resources to download data from.
     :param all_files: If 1, download from all resources for the scan object,
      otherwise use the list.
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: list of filepaths for the files downloaded
 
     """
@@ -1858,15 +3300,15 @@ def download_scan_seriesdescriptions(directory, project_id, subject_id, session_
     seriesdescriptions = islist(seriesdescriptions, 'seriesdescription')
     if not seriesdescriptions:
         return fpaths
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     for scan in list_scans(xnat, project_id, subject_id, session_id):
         if scan['series_description'] in seriesdescriptions:
             scan_obj = select_obj(xnat, project_id, subject_id, session_id, scan['ID'])
-            fpaths.extend(download_from_obj(directory, scan_obj, resources, all_files))
-    xnat.disconnect()
+            fpaths.extend(download_from_obj(directory, scan_obj, resources, all_files, resume))
     return fpaths
 
-def download_assessor_proctypes(directory, project_id, subject_id, session_id, proctypes, resources, all_files=False):
+def download_assessor_proctypes(directory, project_id, subject_id, session_id, proctypes, resources, all_files=False,
+                                resume=False):
     """
     Download resources from an assessor based on a list of proctypes
 
@@ -1877,6 +3319,8 @@ def download_assessor_proctypes(directory, project_id, subject_id, session_id, p
     :param proctypes: list of proctypes to download from
     :param resources: list of resources to download from
     :param all_files: True if download all the files, False if download the biggest file
+    :param resume: download the files to .part files resumed with HTTP Range
+     requests if the connection drops (see download_file_resume)
     :return: List of filepaths for the files downloaded
 
     """
@@ -1885,12 +3329,11 @@ def download_assessor_proctypes(directory, project_id, subject_id, session_id, p
     if not proctypes:
         return fpaths
     proctypes = set([proctype.replace('FreeSurfer', 'FS') for proctype in proctypes])
-    xnat = get_interface()
+    xnat = get_pooled_interface()
     for assessor in list_assessors(xnat, project_id, subject_id, session_id):
         if assessor['proctype'] in proctypes:
             assessor_obj = select_obj(xnat, project_id, subject_id, session_id, assessor_id=assessor['label'])
-            fpaths.extend(download_from_obj(directory, assessor_obj, resources, all_files))
-    xnat.disconnect()
+            fpaths.extend(download_from_obj(directory, assessor_obj, resources, all_files, resume))
     return fpaths
 
 def upload_file_to_obj(filepath, resource_obj, remove=False, removeall=False, fname=None):
@@ -1947,10 +3390,9 @@ def upload_file(filepath, project_id=None, subject_id=None, session_id=None, sca
     if not resource:
         print "ERROR: upload_file in XnatUtils: resource argument not provided."
     else:
-        xnat = get_interface()
+        xnat = get_pooled_interface()
         resource_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id, resource)
         status = upload_file_to_obj(filepath, resource_obj, remove, removeall, fname)
-        xnat.disconnect()
     return status
 
 def upload_files_to_obj(filepaths, resource_obj, remove=False, removeall=False):
@@ -1992,10 +3434,9 @@ def upload_files(filepaths, project_id=None, subject_id=None, session_id=None, s
     if not resource:
         print "ERROR: upload_files in XnatUtils: resource argument not provided."
     else:
-        xnat = get_interface()
+        xnat = get_pooled_interface()
         resource_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id, resource)
         status = upload_files_to_obj(filepaths, resource_obj, remove, removeall)
-        xnat.disconnect()
     return status
 
 def upload_folder_to_obj(directory, resource_obj, resource_label, remove=False, removeall=False):
@@ -2056,10 +3497,9 @@ def upload_folder(directory, project_id=None, subject_id=None, session_id=None,
     if not resource:
         print "ERROR: upload_folder in XnatUtils: no resource argument provided."
     else:
-        xnat = get_interface()
+        xnat = get_pooled_interface()
         resource_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id, resource)
         status = upload_folder_to_obj(directory, resource_obj, resource, remove, removeall)
-        xnat.disconnect()
     return status
 
 def copy_resource_from_obj(directory, xnat_obj, old_res, new_res):
@@ -2108,10 +3548,9 @@ def copy_resource(directory, project_id=None, subject_id=None, session_id=None,
     if not old_res or not new_res:
         print "ERROR: copy_resource in XnatUtils: resource argument (old_res or new_res) not provided."
     else:
-        xnat = get_interface()
+        xnat = get_pooled_interface()
         xnat_obj = select_obj(xnat, project_id, subject_id, session_id, scan_id, assessor_id)
         status = copy_resource_from_obj(directory, xnat_obj, old_res, new_res)
-        xnat.disconnect()
     return status
 
 def upload_assessor_snapshots(assessor_obj, original, thumbnail):
@@ -2132,6 +3571,33 @@ def upload_assessor_snapshots(assessor_obj, original, thumbnail):
     assessor_obj.out_resource('SNAPSHOTS').file(os.path.basename(original)).put(original, original.split('.')[1].upper(), 'ORIGINAL', overwrite=True)
     return True
 
+def copy_file_checksum(src, dst):
+    """
+    Copy a file by chunks to a temporary file, check the copy against the
+     MD5 of the data read and rename it (the copy is complete or absent)
+
+    :param src: path to the file to copy
+    :param dst: path to the copy
+    :except IOError: the copy does not match the source
+    :return: MD5 of the file
+    """
+    tmp_path = dst+'.part'
+    md5 = hashlib.md5()
+    try:
+        with open(src, 'rb') as f_src, open(tmp_path, 'wb') as f_dst:
+            for data in iter(lambda: f_src.read(RESUME_DL_CHUNK_SIZE), ''):
+                md5.update(data)
+                f_dst.write(data)
+        if not check_downloaded_file(tmp_path, {'size': os.path.getsize(src),
+                                                'digest': md5.hexdigest()}):
+            raise IOError('copy of %s does not match the source' % src)
+        shutil.copymode(src, tmp_path)
+        os.rename(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return md5.hexdigest()
+
 def clean_directory(directory):
     """
     Remove a directory tree or file
@@ -2148,27 +3614,164 @@ def clean_directory(directory):
         else:
             os.remove(fpath)
 
-def gzip_nii(directory):
+def gzip_header(fpath, level):
+    """
+    Header of a gzip file (same fields as the gzip command)
+
+    :param fpath: path to the file compressed
+    :param level: compression level
+    :return: string of the header
+    """
+    fname = os.path.basename(fpath)
+    if isinstance(fname, unicode):
+        fname = fname.encode('latin-1', 'replace')
+    xfl = 2 if level == 9 else 4 if level == 1 else 0
+    return '\x1f\x8b\x08\x08' + struct.pack('<LBB', int(os.path.getmtime(fpath)), xfl, 3) \
+           + fname + '\x00'
+
+def compress_block(block, level, last):
+    """
+    Compress a block of a file as raw deflate data (run in the gzip threads,
+     zlib releases the GIL). The blocks end on a byte boundary so that they
+     can be concatenated, only the last one ends the deflate stream.
+
+    :param block: data to compress
+    :param level: compression level
+    :param last: True for the last block of the file
+    :return: compressed data
     """
-    Gzip all the NIfTI files in a directory via system call.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(block)
+    return data + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def compress_file(fpath, level=GZIP_LEVEL, pool=None):
+    """
+    Gzip a file in-process: written to a temporary file renamed to .gz when
+     complete, then the original file is removed (like the gzip command)
+
+    :param fpath: path to the file to compress
+    :param level: compression level (1 fastest to 9 smallest)
+    :param pool: ThreadPool to compress the blocks of the file in parallel
+     (None to compress it in the current thread)
+    :return: path to the gzipped file
+    """
+    gz_path = fpath+'.gz'
+    tmp_path = gz_path+'.part'
+    batch_size = pool._processes*2 if pool else 1
+    crc = 0
+    size = 0
+    try:
+        with open(fpath, 'rb') as f_in, open(tmp_path, 'wb') as f_out:
+            f_out.write(gzip_header(fpath, level))
+            block = f_in.read(GZIP_BLOCK_SIZE)
+            while True:
+                # read a batch of blocks ahead to know which one is the last
+                blocks = [block]
+                while len(blocks) <= batch_size:
+                    blocks.append(f_in.read(GZIP_BLOCK_SIZE))
+                    if not blocks[-1]:
+                        break
+                block = blocks.pop()
+                last = not block
+                args = [(data, level, last and i == len(blocks)-1) for i, data in enumerate(blocks)]
+                if pool:
+                    compressed = pool.map(lambda arg: compress_block(*arg), args)
+                else:
+                    compressed = [compress_block(*arg) for arg in args]
+                for data, comp in zip(blocks, compressed):
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    f_out.write(comp)
+                if last:
+                    break
+            f_out.write(struct.pack('<LL', crc & 0xffffffff, size & 0xffffffff))
+        shutil.copymode(fpath, tmp_path)
+        os.rename(tmp_path, gz_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    os.remove(fpath)
+    return gz_path
+
+def decompress_file(fpath):
+    """
+    Gunzip a file in-process: written to a temporary file renamed without
+     .gz when complete, then the gzipped file is removed
+
+    :param fpath: path to the .gz file
+    :return: path to the decompressed file
+    """
+    out_path = fpath[:-3] if fpath.endswith('.gz') else fpath+'.out'
+    tmp_path = out_path+'.part'
+    try:
+        with gzip.open(fpath, 'rb') as f_in, open(tmp_path, 'wb') as f_out:
+            for data in iter(lambda: f_in.read(GZIP_BLOCK_SIZE), ''):
+                f_out.write(data)
+        shutil.copymode(fpath, tmp_path)
+        os.rename(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    os.remove(fpath)
+    return out_path
+
+def gzip_files(files_list, level=GZIP_LEVEL, max_workers=GZIP_WORKERS):
+    """
+    Gzip files in-process and concurrently: the small files are compressed
+     at the same time, the big ones one after the other by blocks in parallel.
+
+    :param files_list: list of paths to the files to compress
+    :param level: compression level (1 fastest to 9 smallest)
+    :param max_workers: number of threads compressing
+    :return: list of the paths to the gzipped files
+    """
+    pool = ThreadPool(max_workers)
+    try:
+        big_files = [f for f in files_list if os.path.getsize(f) > GZIP_BLOCK_SIZE]
+        small_files = [f for f in files_list if f not in big_files]
+        gz_paths = dict(zip(small_files, pool.map(lambda f: compress_file(f, level), small_files)))
+        for fpath in big_files:
+            gz_paths[fpath] = compress_file(fpath, level, pool=pool)
+    finally:
+        pool.close()
+        pool.join()
+    return [gz_paths[f] for f in files_list]
+
+def gunzip_files(files_list, max_workers=GZIP_WORKERS):
+    """
+    Gunzip files in-process and concurrently
+
+    :param files_list: list of paths to the .gz files
+    :param max_workers: number of threads decompressing
+    :return: list of the paths to the decompressed files
+    """
+    pool = ThreadPool(max_workers)
+    try:
+        return pool.map(decompress_file, files_list)
+    finally:
+        pool.close()
+        pool.join()
+
+def gzip_nii(directory, level=GZIP_LEVEL):
+    """
+    Gzip all the NIfTI files in a directory (in-process, see gzip_files).
 
     :param directory: The directory to filter for *.nii files
+    :param level: compression level (1 fastest to 9 smallest)
     :return: None
 
     """
-    for fpath in glob.glob(os.path.join(directory, '*.nii')):
-        os.system('gzip '+fpath)
+    gzip_files(glob.glob(os.path.join(directory, '*.nii')), level=level)
 
 def ungzip_nii(directory):
     """
-    Gunzip all of the NIfTI files in a directory via system call.
+    Gunzip all of the NIfTI files in a directory (in-process, see gunzip_files).
 
     :param directory: The directory to filter for *.nii.gz files
     :return: None
 
     """
-    for fpath in glob.glob(os.path.join(directory, '*.nii.gz')):
-        os.system('gzip -d '+fpath)
+    gunzip_files(glob.glob(os.path.join(directory, '*.nii.gz')))
 
 def run_matlab(matlab_script, verbose=False):
     """
@@ -2287,17 +3890,21 @@ def get_files_in_folder(folder, label=''):
             f_list.extend(get_files_in_folder(ffpath, label))
     return f_list
 
-def check_image_format(fpath):
+def check_image_format(fpath, level=GZIP_LEVEL):
     """
-    Check to see if a NIfTI file or REC file are uncompress and runs gzip via
-     system command if not compressed
+    Check to see if a NIfTI file or REC file are uncompress and gzip them
+     (in-process, see gzip_files) if not compressed
 
     :param fpath: Filepath of a NIfTI or REC file
+    :param level: compression level (1 fastest to 9 smallest)
     :return: the new file path of the gzipped file.
 
     """
     if fpath.endswith('.nii') or fpath.endswith('.rec'):
-        os.system('gzip '+fpath)
+        if os.path.isfile(fpath):
+            gzip_files([fpath], level=level)
+        else:
+            print 'ERROR: %s: No such file or directory' % fpath
         fpath = fpath+'.gz'
     return fpath
 
@@ -2362,6 +3969,40 @@ def get_input_str(input_val, default_val):
     else:
         return default_val
 
+def get_config_value(value):
+    """
+    Get a value of an object configuration that can be serialized in a
+     stable way (strings, numbers, lists and dictionaries of them)
+
+    :param value: value of an attribute
+    :return: the value, None if it can not be serialized
+    """
+    if value is None or isinstance(value, (basestring, bool, int, long, float)):
+        return value
+    elif isinstance(value, (list, tuple)):
+        return [get_config_value(val) for val in value]
+    elif isinstance(value, (set, frozenset)):
+        return sorted(get_config_value(val) for val in value)
+    elif isinstance(value, dict):
+        return dict((str(key), get_config_value(val)) for key, val in value.items())
+    else:
+        return None
+
+def get_config_fingerprint(obj, exclude=None):
+    """
+    Get a fingerprint of the configuration of an object (processor, module):
+     hash of its class and of its attributes (only strings, numbers, lists
+     and dictionaries are used, other objects are ignored)
+
+    :param obj: object
+    :param exclude: list of attributes to ignore (e.g. runtime state)
+    :return: hex string of the fingerprint
+    """
+    config = dict((key, get_config_value(val)) for key, val in vars(obj).items()
+                  if not exclude or key not in exclude)
+    config['__class__'] = '%s.%s' % (obj.__class__.__module__, obj.__class__.__name__)
+    return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()
+
 def get_random_sessions(xnat, project_id, num_sessions):
     """
     Get a random list of session labels from an XNAT project
@@ -2385,7 +4026,7 @@ class CachedImageSession():
     """
     Class to cache the XML information for a session on XNAT
     """
-    def __init__(self, xnat, proj, subj, sess):
+    def __init__(self, xnat, proj, subj, sess, xml_str=None):
         """
         Entry point for the CachedImageSession class
 
@@ -2393,11 +4034,14 @@ class CachedImageSession():
         :param proj: XNAT project ID
         :param subj: XNAT subject ID/label
         :param sess: XNAT session ID/label
+        :param xml_str: XML of the session already downloaded from XNAT
+         (see load_cached_sessions), downloaded if None
         :return: None
 
         """
         #self.sess_element = ET.fromstring(xnat.session_xml(proj,sess))
-        xml_str = xnat.select('/project/'+proj+'/subject/'+subj+'/experiment/'+sess).get()
+        if xml_str is None:
+            xml_str = xnat.select('/project/'+proj+'/subject/'+subj+'/experiment/'+sess).get()
         self.sess_element = ET.fromstring(xml_str)
         self.project = proj
         self.subject = subj
@@ -2545,6 +4189,183 @@ class CachedImageSession():
         """
         return get_full_object(self.xnat, self.info())
 
+def load_cached_sessions(intf, sessions_list, max_workers=8, client=None):
+    """
+    Fetch the XML of many sessions concurrently and build the
+     CachedImageSession objects from them
+
+    :param intf: pyxnat.Interface object
+    :param sessions_list: list of sessions dictionaries (see list_sessions)
+    :param max_workers: maximum number of XML downloaded at the same time
+    :param client: ConcurrentInterface to use (e.g. one for all the batches
+     of a project build, closed by the caller), a new one if None
+    :return: list of CachedImageSession (same order as sessions_list), None
+     for the sessions that could not be fetched
+    """
+    def get_xml(xnat, sess_info):
+        """Download the XML of a session, None if it fails."""
+        sess_uri = '/project/{project}/subject/{subject}/experiment/{session}'
+        try:
+            return xnat.select(sess_uri.format(project=sess_info['project_label'],
+                                               subject=sess_info['subject_label'],
+                                               session=sess_info['session_label'])).get()
+        except Exception as err:
+            print 'WARNING: failed to fetch the XML for session %s: %s' % \
+                  (sess_info['session_label'], err)
+            return None
+
+    if not sessions_list:
+        return list()
+
+    if client:
+        xml_list = client.map(get_xml, sessions_list)
+    else:
+        with get_concurrent_interface(intf, max_workers=max_workers) as client:
+            xml_list = client.map(get_xml, sessions_list)
+
+    csess_list = list()
+    for sess_info, xml_str in zip(sessions_list, xml_list):
+        if xml_str is None:
+            csess_list.append(None)
+        else:
+            csess_list.append(CachedImageSession(intf,
+                                                 sess_info['project_label'],
+                                                 sess_info['subject_label'],
+                                                 sess_info['session_label'],
+                                                 xml_str=xml_str))
+    return csess_list
+
+def get_session_xml_file(host, sess_info):
+    """
+    Get the path of the file caching on disk the XML of a session from the
+     last build
+
+    :param host: XNAT host url
+    :param sess_info: dictionary of session information (see list_sessions)
+    :return: path to the cache file, None if no cache_dir in the settings
+    """
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, 'sessions', re.sub(r'[^\w.-]', '_', host),
+                        sess_info['project_label'], sess_info['session_label']+'.xml')
+
+def save_session_xml(csess, filepath):
+    """
+    Save the XML of a CachedImageSession on disk
+
+    :param csess: CachedImageSession object
+    :param filepath: path to the file to write
+    :return: None
+    """
+    if not os.path.isdir(os.path.dirname(filepath)):
+        os.makedirs(os.path.dirname(filepath))
+    tmp_path = filepath+'.tmp'
+    with open(tmp_path, 'w') as f_xml:
+        f_xml.write(ET.tostring(csess.sess_element))
+    os.rename(tmp_path, filepath)
+
+# Fields of the assessors updated by dax while the job runs (see
+# diff_cached_sessions)
+ASSESSOR_JOB_TAGS = set('{%s}%s' % (NS[prefix], field)
+                        for prefix in ['proc', 'fs']
+                        for field in ['procstatus', 'jobid', 'jobstartdate',
+                                      'memused', 'walltimeused', 'jobnode'])
+
+def get_assessor_content(cassr):
+    """
+    Get the XML of an assessor without the fields updated by dax while the
+     job runs (status, job ID, node, memory, walltime, start date)
+
+    :param cassr: CachedImageAssessor object
+    :return: tuple (attributes, list of the XML strings of the other fields)
+    """
+    return (sorted(cassr.assr_element.items()),
+            [ET.tostring(child) for child in cassr.assr_element
+             if child.tag not in ASSESSOR_JOB_TAGS])
+
+def diff_cached_sessions(old_csess, new_csess):
+    """
+    Compare two versions of a session (e.g. from the last build and now)
+
+    :param old_csess: CachedImageSession object of the previous version
+    :param new_csess: CachedImageSession object of the new version
+    :return: dictionary with the changes:
+      session: True if the session attributes or resources changed
+      scans: set of the IDs of the scans added, removed or modified
+      scantypes: set of the types of these scans
+      assessors: set of the labels of the assessors added, removed or modified
+      proctypes: set of the proctypes of these assessors
+      status: set of the labels of the assessors from assessors where only
+       the job status/information changed (the assessor did not become
+       COMPLETE and nothing else changed, e.g. JOB_RUNNING to READY_TO_UPLOAD)
+    """
+    changes = {'session': False, 'scans': set(), 'scantypes': set(),
+               'assessors': set(), 'proctypes': set(), 'status': set()}
+
+    # Session attributes without the last update date set by dax
+    old_info = old_csess.info()
+    new_info = new_csess.info()
+    for key in ['original', 'last_updated']:
+        old_info.pop(key)
+        new_info.pop(key)
+    if old_info != new_info or \
+       old_csess.get_resources() != new_csess.get_resources():
+        changes['session'] = True
+
+    # Scans and assessors: any change in their XML
+    old_scans = dict((cscan.label(), (cscan.get('type'), ET.tostring(cscan.scan_element)))
+                     for cscan in old_csess.scans())
+    for cscan in new_csess.scans():
+        old_scan = old_scans.pop(cscan.label(), None)
+        if old_scan is None or old_scan[1] != ET.tostring(cscan.scan_element):
+            changes['scans'].add(cscan.label())
+            changes['scantypes'].add(cscan.get('type'))
+            if old_scan is not None:
+                changes['scantypes'].add(old_scan[0])
+    for label, (scan_type, _) in old_scans.items():
+        changes['scans'].add(label)
+        changes['scantypes'].add(scan_type)
+
+    old_assrs = dict((cassr.label(), cassr) for cassr in old_csess.assessors())
+    for cassr in new_csess.assessors():
+        old_cassr = old_assrs.pop(cassr.label(), None)
+        if old_cassr is not None and \
+           ET.tostring(old_cassr.assr_element) == ET.tostring(cassr.assr_element):
+            continue
+        assr_info = cassr.info()
+        changes['assessors'].add(cassr.label())
+        changes['proctypes'].add(assr_info.get('proctype'))
+        if old_cassr is not None and \
+           task.COMPLETE not in [assr_info['procstatus'], old_cassr.info()['procstatus']] and \
+           get_assessor_content(old_cassr) == get_assessor_content(cassr):
+            changes['status'].add(cassr.label())
+    for label, cassr in old_assrs.items():
+        changes['assessors'].add(label)
+        changes['proctypes'].add(cassr.info().get('proctype'))
+
+    return changes
+
+def update_cached_assessors(csess, new_csess, labels):
+    """
+    Copy the XML of some assessors from a new version of a session to a
+     CachedImageSession (e.g. the assessors created or updated by a build)
+
+    :param csess: CachedImageSession object to update
+    :param new_csess: CachedImageSession object of the new version
+    :param labels: labels of the assessors to copy (removed from csess if
+     they are not in new_csess)
+    :return: None
+    """
+    assrs_element = csess.sess_element.find('xnat:assessors', NS)
+    if assrs_element is None:
+        assrs_element = ET.SubElement(csess.sess_element, '{%s}assessors' % NS['xnat'])
+    for assr_element in list(assrs_element):
+        if assr_element.get('label') in labels:
+            assrs_element.remove(assr_element)
+    for cassr in new_csess.assessors():
+        if cassr.label() in labels:
+            assrs_element.append(cassr.assr_element)
+
 class CachedImageScan():
     """
     Class to cache the XML information for a scan on XNAT
@@ -3596,20 +5417,14 @@ def download_biggest_resources(Resource,directory,filename='0'):
 
     """
     if os.path.exists(directory):
-        number=0
-        Bigger_file_size=0
-        for index,fname in enumerate(Resource.files().get()[:]):
-            size=int(Resource.file(fname).size())
-            if Bigger_file_size<size:
-                Bigger_file_size=size
-                number=index
-
-        if Bigger_file_size==0:
+        file_dict = get_biggest_catalog_file(get_resource_catalog(Resource))
+
+        if not file_dict:
             return 0,'nan'
         else:
-            Input_res_label_fname = Resource.files().get()[number]
+            Input_res_label_fname = file_dict['path']
             if filename=='0':
-                DLFileName = os.path.join(directory,Input_res_label_fname)
+                DLFileName = os.path.join(directory,os.path.basename(Input_res_label_fname))
             else:
                 DLFileName = os.path.join(directory,filename)
             Resource.file(Input_res_label_fname).get(DLFileName)
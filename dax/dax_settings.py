@@ -298,6 +298,34 @@ class DAX_Settings(object):
         else:
             return []
 
+    def get_cache_dir(self):
+        """Get the cache_dir value from the admin section.
+
+        Optional option: no warning if it is not in the settings file.
+
+        :return: String of the cache_dir value, None if empty
+        """
+        if not self.config_parser.has_option('admin', 'cache_dir'):
+            return None
+        cache_dir = self.get('admin', 'cache_dir')
+        if cache_dir and cache_dir.startswith('~'):
+            return os.path.expanduser(cache_dir)
+        return cache_dir
+
+    def get_datatypes_cache_ttl(self):
+        """Get the datatypes_cache_ttl value from the admin section.
+
+        Optional option: no warning if it is not in the settings file.
+
+        :return: int of the datatypes_cache_ttl value in seconds, 0 if empty
+        """
+        if not self.config_parser.has_option('admin', 'datatypes_cache_ttl'):
+            return 0
+        if self.get('admin', 'datatypes_cache_ttl'):
+            return int(self.get('admin', 'datatypes_cache_ttl'))
+        else:
+            return 0
+
     # Begin cluster section
     def get_cmd_submit(self):
         """Get the cmd_submit value from the cluster section.
@@ -524,6 +552,34 @@ class DAX_Settings(object):
         """
         return self.get('cluster', 'launcher_type')
 
+    def get_input_cache_dir(self):
+        """Get the input_cache_dir value from the cluster section.
+
+        Optional option: no warning if it is not in the settings file.
+
+        :return: String of the input_cache_dir value, None if empty
+        """
+        if not self.config_parser.has_option('cluster', 'input_cache_dir'):
+            return None
+        input_cache_dir = self.get('cluster', 'input_cache_dir')
+        if input_cache_dir and input_cache_dir.startswith('~'):
+            return os.path.expanduser(input_cache_dir)
+        return input_cache_dir
+
+    def get_input_cache_size(self):
+        """Get the input_cache_size value from the cluster section.
+
+        Optional option: no warning if it is not in the settings file.
+
+        :return: int of the input_cache_size value in GB, 50 if empty
+        """
+        if not self.config_parser.has_option('cluster', 'input_cache_size'):
+            return 50
+        if self.get('cluster', 'input_cache_size'):
+            return int(self.get('cluster', 'input_cache_size'))
+        else:
+            return 50
+
     def get_api_url(self):
         """Get the api_url value from the dax_manager section.
 
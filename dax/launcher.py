@@ -6,6 +6,7 @@ __copyright__ = 'Copyright 2013 Vanderbilt University. All Rights Reserved'
 
 import os
 import sys
+import json
 import logging
 from datetime import datetime, timedelta
 
@@ -24,6 +25,8 @@ UPDATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 BUILD_SUFFIX = 'BUILD_RUNNING.txt'
 UPDATE_SUFFIX = 'UPDATE_RUNNING.txt'
 LAUNCH_SUFFIX = 'LAUNCHER_RUNNING.txt'
+# Number of sessions XML fetched at once from XNAT before building them
+BUILD_BATCH_SIZE = 50
 
 #Logger to print logs
 LOGGER = logging.getLogger('dax')
@@ -112,6 +115,13 @@ class Launcher(object):
             if proj not in self.project_process_dict:
                 self.project_process_dict[proj] = list()
 
+        # Fingerprints of the processors/modules configuration per project
+        # (computed before any run to not include runtime state)
+        self.project_fingerprints = dict()
+        for proj in self.project_process_dict.keys():
+            self.project_fingerprints[proj] = get_fingerprints(self.project_process_dict[proj],
+                                                               self.project_modules_dict[proj])
+
         try:
             if xnat_user == None:
                 self.xnat_user = os.environ['XNAT_USER']
@@ -393,55 +403,57 @@ class Launcher(object):
         else:
             lastmod_delta = None
 
-        # Check for new processors
-        has_new = self.has_new_processors(xnat, project_id, exp_procs, scan_procs)
+        fingerprints = self.project_fingerprints[project_id]
+        if XnatUtils.CACHE_DIR:
+            # New or modified processors found per session with the fingerprints
+            has_new = False
+        else:
+            # Check for new processors
+            has_new = self.has_new_processors(xnat, project_id, exp_procs, scan_procs)
 
         # Get the list of sessions:
         sessions = self.get_sessions_list(xnat, project_id, sessions_local)
 
-        # Update each session from the list:
-        for sess_info in sessions:
-            if not self.skip_lastupdate and not has_new and not sessions_local:
-                last_mod = datetime.strptime(sess_info['last_modified'][0:19], UPDATE_FORMAT)
-                now_date = datetime.today()
-                last_up = self.get_lastupdated(sess_info)
-                if last_up != None and \
-                    last_mod < last_up and \
-                    now_date < last_mod + timedelta(days=int(self.max_age)):
-                    mess = """  +Session:{sess}: skipping, last_mod={mod},last_up={up}"""
-                    mess_str = mess.format(sess=sess_info['label'], mod=str(last_mod), up=str(last_up))
-                    LOGGER.info(mess_str)
-                    continue
-                
-            elif lastmod_delta:
-                last_mod = datetime.strptime(sess_info['last_modified'][0:19], UPDATE_FORMAT)
-                now_date = datetime.today()
-                if now_date > last_mod + lastmod_delta:
-                    mess = """+Session:{sess}:skipping not modified within delta, last_mod={mod}"""
-                    mess_str = mess.format(sess=sess_info['label'], mod=str(last_mod))
-                    LOGGER.info(mess_str)
-                    continue
-                else:
-                    print('lastmod='+str(last_mod))
-                    
-            mess = """  +Session:{sess}: building..."""
-            LOGGER.info(mess.format(sess=sess_info['label']))
+        sessions = [sess_info for sess_info in sessions
+                    if self.should_build_session(sess_info, has_new, sessions_local, lastmod_delta,
+                                                 fingerprints)]
+        # Only rebuild what changed since the last build when possible
+        full_build = has_new or sessions_local or self.skip_lastupdate
 
-            if not self.skip_lastupdate:
+        # Update the sessions from the list by batch, fetching the XML of
+        # the sessions of the batch concurrently:
+        # (one concurrent client and its connections for all the batches)
+        client = XnatUtils.get_concurrent_interface(xnat)
+        try:
+            for index in range(0, len(sessions), BUILD_BATCH_SIZE):
+                batch = sessions[index:index+BUILD_BATCH_SIZE]
+                # NOTE: start time taken before fetching the XML so a change made
+                # on XNAT after the fetch is not marked as updated
                 update_start_time = datetime.now()
+                csess_list = XnatUtils.load_cached_sessions(xnat, batch, client=client)
 
-            try:
-                self.build_session(xnat, sess_info, exp_procs, scan_procs, exp_mods, scan_mods)
-            except Exception as E:
-                LOGGER.critical('Caught exception building sessions %s' % sess_info['session_label'])
-                LOGGER.critical('Exception class %s caught with message %s' %(E.__class__, E.message))
-            
-            try:
-                if not self.skip_lastupdate:
-                    self.set_session_lastupdated(xnat, sess_info, update_start_time)
-            except Exception as E:
-                LOGGER.critical('Caught exception setting session timestamp %s' % sess_info['session_label'])
-                LOGGER.critical('Exception class %s caught with message %s' %(E.__class__, E.message))
+                for sess_info, csess in zip(batch, csess_list):
+                    mess = """  +Session:{sess}: building..."""
+                    LOGGER.info(mess.format(sess=sess_info['label']))
+
+                    try:
+                        self.build_session(xnat, sess_info, exp_procs, scan_procs, exp_mods, scan_mods,
+                                           csess=csess, full_build=full_build,
+                                           fingerprints=fingerprints)
+                    except Exception as E:
+                        # next build of the session will be a full build
+                        self.remove_build_index(sess_info)
+                        LOGGER.critical('Caught exception building sessions %s' % sess_info['session_label'])
+                        LOGGER.critical('Exception class %s caught with message %s' %(E.__class__, E.message))
+
+                    try:
+                        if not self.skip_lastupdate:
+                            self.set_session_lastupdated(xnat, sess_info, update_start_time)
+                    except Exception as E:
+                        LOGGER.critical('Caught exception setting session timestamp %s' % sess_info['session_label'])
+                        LOGGER.critical('Exception class %s caught with message %s' %(E.__class__, E.message))
+        finally:
+            client.close()
 
         if not sessions_local or sessions_local.lower() == 'all':
             # Modules after run
@@ -452,8 +464,51 @@ class Launcher(object):
                 LOGGER.critical('Caught exception after running modules %s')
                 LOGGER.critical('Exception class %s caught with message %s' %(E.__class__, E.message))
 
+    def should_build_session(self, sess_info, has_new, sessions_local, lastmod_delta,
+                             fingerprints=None):
+        """
+        Check if a session needs to be built (modified since the last update
+         or processors/modules configuration changed)
+
+        :param sess_info: python ditionary from XnatUtils.list_sessions method
+        :param has_new: True if the project has new processors
+        :param sessions_local: list of sessions selected by the user
+        :param lastmod_delta: timedelta, only build sessions modified within it
+        :param fingerprints: dictionary of the processors/modules fingerprints
+         (see get_fingerprints)
+        :return: True if the session needs to be built, False otherwise
+        """
+        if not self.skip_lastupdate and not has_new and not sessions_local:
+            last_mod = datetime.strptime(sess_info['last_modified'][0:19], UPDATE_FORMAT)
+            now_date = datetime.today()
+            last_up = self.get_lastupdated(sess_info)
+            if fingerprints and self.get_changed_fingerprints(sess_info, fingerprints):
+                mess = """  +Session:{sess}: processors/modules configuration changed"""
+                LOGGER.info(mess.format(sess=sess_info['label']))
+            elif last_up != None and \
+                last_mod < last_up and \
+                now_date < last_mod + timedelta(days=int(self.max_age)):
+                mess = """  +Session:{sess}: skipping, last_mod={mod},last_up={up}"""
+                mess_str = mess.format(sess=sess_info['label'], mod=str(last_mod), up=str(last_up))
+                LOGGER.info(mess_str)
+                return False
+
+        elif lastmod_delta:
+            last_mod = datetime.strptime(sess_info['last_modified'][0:19], UPDATE_FORMAT)
+            now_date = datetime.today()
+            if now_date > last_mod + lastmod_delta:
+                mess = """+Session:{sess}:skipping not modified within delta, last_mod={mod}"""
+                mess_str = mess.format(sess=sess_info['label'], mod=str(last_mod))
+                LOGGER.info(mess_str)
+                return False
+            else:
+                print('lastmod='+str(last_mod))
+
+        return True
+
     def build_session(self, xnat, sess_info, sess_proc_list,
-                      scan_proc_list, sess_mod_list, scan_mod_list):
+                      scan_proc_list, sess_mod_list, scan_mod_list, csess=None,
+                      full_build=True, fingerprints=None):
         """
         Build a session
 
@@ -463,12 +518,26 @@ class Launcher(object):
         :param scan_proc_list: list of processors running on a scan
         :param sess_mod_list: list of modules running on a session
         :param scan_mod_list: list of modules running on a scan
+        :param csess: CachedImageSession already loaded for the session
+         (see XnatUtils.load_cached_sessions), fetched from XNAT if None
+        :param full_build: evaluate all the processors, otherwise only the ones
+         affected by the changes since the last build of the session or with
+         a new configuration
+        :param fingerprints: dictionary of the processors/modules fingerprints
+         (see get_fingerprints) saved with the session build
         :return: None
         """
-        csess = XnatUtils.CachedImageSession(xnat,
-                                             sess_info['project_label'],
-                                             sess_info['subject_label'],
-                                             sess_info['session_label'])
+        if csess is None:
+            csess = XnatUtils.CachedImageSession(xnat,
+                                                 sess_info['project_label'],
+                                                 sess_info['subject_label'],
+                                                 sess_info['session_label'])
+        changes = None
+        changed_procs = set()
+        if not full_build:
+            changes = self.get_session_changes(sess_info, csess)
+            if fingerprints:
+                changed_procs = self.get_changed_fingerprints(sess_info, fingerprints)
         session_info = csess.info()
         sess_obj = None
 
@@ -490,19 +559,158 @@ class Launcher(object):
                 break
 
             csess.reload()
+            # modules changed the session: evaluate all the processors
+            changes = None
             mod_count += 1
 
+        # proctypes of the project to recognize the assessors used as inputs
+        proctypes = set(proc.name for proc in sess_proc_list + scan_proc_list)
+        # labels of the assessors the processors built could create or update
+        built_labels = set()
+
         # Scan Processors
         LOGGER.debug('== Build scan processors ==')
         if scan_proc_list:
             for cscan in csess.scans():
                 LOGGER.debug('+SCAN: ' + cscan.info()['scan_id'])
-                self.build_scan_processors(xnat, cscan, scan_proc_list)
+                if changes is None:
+                    procs = scan_proc_list
+                else:
+                    procs = [proc for proc in scan_proc_list
+                             if proc.should_rebuild(cscan, changes, proctypes) or
+                             'processor:'+proc.name in changed_procs]
+                if procs:
+                    self.build_scan_processors(xnat, cscan, procs)
+                    built_labels.update(proc.get_assessor_name(cscan) for proc in procs)
 
         # Session Processors
         LOGGER.debug('== Build session processors ==')
         if sess_proc_list:
-            self.build_session_processors(xnat, csess, sess_proc_list)
+            if changes is None:
+                procs = sess_proc_list
+            else:
+                procs = [proc for proc in sess_proc_list
+                         if proc.should_rebuild(csess, changes, proctypes) or
+                         'processor:'+proc.name in changed_procs]
+            if procs:
+                self.build_session_processors(xnat, csess, procs)
+                built_labels.update(proc.get_assessor_name(csess) for proc in procs)
+
+        self.save_build_index(sess_info, csess, fingerprints, built_labels)
+
+    def get_session_changes(self, sess_info, csess):
+        """
+        Compare the session with its XML cached at the end of the last build
+
+        :param sess_info: python ditionary from XnatUtils.list_sessions method
+        :param csess: CachedImageSession of the session
+        :return: dictionary of changes (see XnatUtils.diff_cached_sessions),
+         None if there is no previous XML to compare with
+        """
+        xml_path = XnatUtils.get_session_xml_file(self.xnat_host, sess_info)
+        if not xml_path or not os.path.isfile(xml_path):
+            return None
+        try:
+            with open(xml_path, 'r') as f_xml:
+                old_csess = XnatUtils.CachedImageSession(None,
+                                                         sess_info['project_label'],
+                                                         sess_info['subject_label'],
+                                                         sess_info['session_label'],
+                                                         xml_str=f_xml.read())
+            changes = XnatUtils.diff_cached_sessions(old_csess, csess)
+        except Exception as E:
+            LOGGER.warn('failed to compare session %s with its previous build: %s'
+                        % (sess_info['session_label'], E))
+            return None
+        mess = """  +Session:{sess}: changes: session={sess_ch}, scans={scans}, assessors={assrs}"""
+        LOGGER.debug(mess.format(sess=sess_info['label'], sess_ch=changes['session'],
+                                 scans=','.join(sorted(changes['scans'])),
+                                 assrs=','.join(sorted(changes['assessors']))))
+        return changes
+
+    def get_fingerprints_file(self, sess_info):
+        """
+        Get the path of the file storing the processors/modules fingerprints
+         of the last build of a session (next to the session XML)
+
+        :param sess_info: python ditionary from XnatUtils.list_sessions method
+        :return: path to the file, None if no cache_dir in the settings
+        """
+        xml_path = XnatUtils.get_session_xml_file(self.xnat_host, sess_info)
+        if not xml_path:
+            return None
+        return os.path.splitext(xml_path)[0]+'.json'
+
+    def get_changed_fingerprints(self, sess_info, fingerprints):
+        """
+        Get the processors/modules whose configuration changed since the last
+         build of the session
+
+        :param sess_info: python ditionary from XnatUtils.list_sessions method
+        :param fingerprints: dictionary of the processors/modules fingerprints
+         (see get_fingerprints)
+        :return: set of the keys of fingerprints that changed (all of them if
+         the session was never built with the fingerprints)
+        """
+        fp_path = self.get_fingerprints_file(sess_info)
+        if not fp_path:
+            return set()
+        try:
+            with open(fp_path, 'r') as f_fp:
+                old_fingerprints = json.load(f_fp)
+        except (IOError, ValueError):
+            return set(fingerprints.keys())
+        return set(key for key, value in fingerprints.items()
+                   if old_fingerprints.get(key) != value)
+
+    def save_build_index(self, sess_info, csess, fingerprints=None, built_labels=None):
+        """
+        Cache the XML of the session built and the fingerprints of the
+         processors/modules used to compare them at the next build
+
+        :param sess_info: python ditionary from XnatUtils.list_sessions method
+        :param csess: CachedImageSession of the session loaded before the build
+        :param fingerprints: dictionary of the processors/modules fingerprints
+        :param built_labels: labels of the assessors of the processors built:
+         their XML after the build is saved so the assessors created are not
+         seen as changes at the next build. The other changes made since
+         csess was loaded are left for the next build.
+        :return: None
+        """
+        xml_path = XnatUtils.get_session_xml_file(self.xnat_host, sess_info)
+        if not xml_path:
+            return
+        try:
+            if built_labels:
+                new_csess = XnatUtils.CachedImageSession(csess.xnat,
+                                                         sess_info['project_label'],
+                                                         sess_info['subject_label'],
+                                                         sess_info['session_label'])
+                XnatUtils.update_cached_assessors(csess, new_csess, built_labels)
+            XnatUtils.save_session_xml(csess, xml_path)
+            if fingerprints is not None:
+                fp_path = self.get_fingerprints_file(sess_info)
+                with open(fp_path+'.tmp', 'w') as f_fp:
+                    json.dump(fingerprints, f_fp)
+                os.rename(fp_path+'.tmp', fp_path)
+        except (IOError, OSError) as E:
+            LOGGER.warn('failed to save the build index of session %s: %s'
+                        % (sess_info['session_label'], E))
+
+    def remove_build_index(self, sess_info):
+        """
+        Remove the XML and fingerprints cached for a session (the next build
+         will be a full build)
+
+        :param sess_info: python ditionary from XnatUtils.list_sessions method
+        :return: None
+        """
+        xml_path = XnatUtils.get_session_xml_file(self.xnat_host, sess_info)
+        if not xml_path:
+            return
+        for path in [xml_path, self.get_fingerprints_file(sess_info)]:
+            if os.path.isfile(path):
+                os.remove(path)
 
     def build_session_processors(self, xnat, csess, sess_proc_list):
         sess_info = csess.info()
@@ -1023,6 +1231,21 @@ The project is not part of the settings."""
         # Are there any?
         return len(diff_list) > 0
 
+def get_fingerprints(proc_list, mod_list):
+    """
+    Get the fingerprints of the configuration of processors and modules
+
+    :param proc_list: list of processors
+    :param mod_list: list of modules
+    :return: dictionary of fingerprints keyed by 'processor:name' / 'module:name'
+    """
+    fingerprints = dict()
+    for proc in proc_list:
+        fingerprints['processor:'+proc.name] = proc.get_fingerprint()
+    for mod in mod_list:
+        fingerprints['module:'+mod.mod_name] = mod.get_fingerprint()
+    return fingerprints
+
 def load_task_queue(status=None):
     task_list = list()
     diskq_dir = os.path.join(DAX_SETTINGS.get_results_dir(), 'DISKQ')
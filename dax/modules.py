@@ -59,6 +59,15 @@ class Module(object):
         """
         raise NotImplementedError()
 
+    def get_fingerprint(self):
+        """
+        Get the fingerprint of the module configuration (the report is ignored).
+         It changes when the configuration changes.
+
+        :return: hex string of the fingerprint
+        """
+        return XnatUtils.get_config_fingerprint(self, exclude=['text_report', 'send_an_email'])
+
     def report(self, string):
         """
         Add report to an email and send it at the end of the module 
@@ -8,6 +8,9 @@ import XnatUtils
 #Logger for logs
 LOGGER = logging.getLogger('dax')
 
+# Attributes of the processors not describing their inputs (see get_input_types)
+NOT_INPUT_ATTRS = ['xsitype', 'input_scan_types', 'input_proctypes']
+
 class Processor(object):
     """ Base class for processor """
     def __init__(self, walltime_str, memreq_mb, spider_path,
@@ -47,6 +50,10 @@ class Processor(object):
         self.spider_path = spider_path
         self.ppn = ppn
         self.xsitype = xsitype
+        # scan types/proctypes used by has_inputs, None to derive them from
+        # the processor attributes (see get_input_types)
+        self.input_scan_types = None
+        self.input_proctypes = None
         #getting name and version from spider_path
         self.set_spider_settings(spider_path, version)
         #if suffix_proc is empty, set it to "" for the spider call:
@@ -127,6 +134,91 @@ class Processor(object):
         """
         raise NotImplementedError()
 
+    def get_fingerprint(self):
+        """
+        Get the fingerprint of the processor configuration (class, version,
+         parameters, scan types...). It changes when the configuration changes.
+
+        :return: hex string of the fingerprint
+        """
+        return XnatUtils.get_config_fingerprint(self)
+
+    def get_input_types(self, proctypes=None):
+        """
+        Get the scan types and the proctypes of the inputs of the processor.
+         By default, they are derived from its attributes named *type or
+         *types (e.g. scan_types='T1,MPRAGE', fs_proctype='FreeSurfer'): a
+         value is a proctype if it is the proctype of a processor of the
+         project or if the attribute name has 'proc' in it, a scan type
+         otherwise. Set input_scan_types/input_proctypes to override them.
+
+        :param proctypes: set of the proctypes of the processors of the project
+        :return: tuple (set of scan types, set of proctypes), None instead of
+         a set if any type can be an input ('all' or the processor has no
+         attribute describing its inputs)
+        """
+        proctypes = proctypes or set()
+        scan_types = set()
+        input_proctypes = set()
+        found = False
+        for name, value in vars(self).items():
+            if not name.endswith(('type', 'types')) or name in NOT_INPUT_ATTRS or \
+               name in self.get_own_type_attrs():
+                continue
+            if isinstance(value, basestring):
+                values = value.split(',')
+            elif isinstance(value, (list, tuple, set)):
+                values = [val for val in value if isinstance(val, basestring)]
+            else:
+                continue
+            found = True
+            for val in [val.strip() for val in values if val.strip()]:
+                if 'proc' in name or is_proctype(val, proctypes):
+                    input_proctypes.add(val)
+                else:
+                    scan_types.add(val)
+
+        if not found:
+            scan_types, input_proctypes = None, None
+        if scan_types is not None and 'all' in scan_types:
+            scan_types = None
+        if input_proctypes is not None and 'all' in input_proctypes:
+            input_proctypes = None
+        if self.input_scan_types is not None:
+            scan_types = set(self.input_scan_types)
+        if self.input_proctypes is not None:
+            input_proctypes = set(self.input_proctypes)
+        return scan_types, input_proctypes
+
+    def get_own_type_attrs(self):
+        """
+        Get the attributes describing the object the processor runs on
+         (not other inputs)
+
+        :return: list of attribute names
+        """
+        return []
+
+    def has_changed_inputs(self, changes, proctypes=None):
+        """
+        Check if scans or assessors used as inputs changed (see get_input_types)
+
+        :param changes: dictionary of changes from XnatUtils.diff_cached_sessions
+        :param proctypes: set of the proctypes of the processors of the project
+        :return: True if an input could have changed
+        """
+        scan_types, input_proctypes = self.get_input_types(proctypes)
+        if scan_types is None:
+            if changes['scans']:
+                return True
+        elif changes['scantypes'].intersection(scan_types):
+            return True
+        if input_proctypes is None:
+            # any assessor, but only when more than its job status changed
+            return len(changes['assessors'] - changes['status']) > 0
+        return any(is_proctype(proctype, changes['proctypes'])
+                   for proctype in input_proctypes)
+
     def build_cmds(self, cobj, dir):
 
         """
@@ -218,6 +310,30 @@ class ScanProcessor(Processor):
         else:
             return scan_dict['scan_type'] in self.scan_types
 
+    def get_own_type_attrs(self):
+        """
+        Get the attributes describing the object the processor runs on: the
+         scan types (the scan itself is checked by should_rebuild)
+
+        :return: list of attribute names
+        """
+        return ['scan_types']
+
+    def should_rebuild(self, cscan, changes, proctypes=None):
+        """
+        Check if the processor needs to be evaluated again for a scan after
+         a change in the session since the last build
+
+        :param cscan: CachedImageScan object from XnatUtils
+        :param changes: dictionary of changes from XnatUtils.diff_cached_sessions
+        :param proctypes: set of the proctypes of the processors of the project
+        :return: True if the inputs or the assessor could have changed
+        """
+        if changes['session'] or cscan.label() in changes['scans'] or \
+           self.get_assessor_name(cscan) in changes['assessors']:
+            return True
+        return self.has_changed_inputs(changes, proctypes)
+
 class SessionProcessor(Processor):
     """ Session Processor class for processor on a session on XNAT """
     def __init__(self, walltime_str, memreq_mb, spider_path, version=None, ppn=1, suffix_proc=''):
@@ -255,6 +371,21 @@ class SessionProcessor(Processor):
         """
         return True
 
+    def should_rebuild(self, csess, changes, proctypes=None):
+        """
+        Check if the processor needs to be evaluated again after a change
+         in the session since the last build
+
+        :param csess: CachedImageSession from XnatUtils
+        :param changes: dictionary of changes from XnatUtils.diff_cached_sessions
+        :param proctypes: set of the proctypes of the processors of the project
+        :return: True if the inputs or the assessor could have changed
+        """
+        if changes['session'] or \
+           self.get_assessor_name(csess) in changes['assessors']:
+            return True
+        return self.has_changed_inputs(changes, proctypes)
+
     def get_assessor_name(self, csess):
         """
         Get the name of the assessor
@@ -285,6 +416,18 @@ class SessionProcessor(Processor):
         assessor = session.assessor(assessor_name)
         return task.Task(self, assessor, upload_dir)
 
+def is_proctype(value, proctypes):
+    """
+    Check if a value is one of the proctypes, with or without its version
+     (e.g. 'fMRIQA' for 'fMRIQA_v2')
+
+    :param value: string to check
+    :param proctypes: set of proctypes
+    :return: True if the value is a proctype, False otherwise
+    """
+    return any(value == proctype or proctype.startswith(value+'_v')
+               for proctype in proctypes)
+
 def processors_by_type(proc_list):
     """
     Organize the processor types and return a list of session processors
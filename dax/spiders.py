@@ -27,9 +27,11 @@ from dax import XnatUtils
 from datetime import datetime
 import matplotlib.pyplot as plt
 from stat import S_IXUSR, ST_MODE
-from shutil import copyfile
-from shutil import copytree
 from string import Template
+from multiprocessing.pool import ThreadPool
+
+# Number of inputs staged at the same time by AutoSpider.copy_inputs
+STAGING_WORKERS = 4
 
 class Spider(object):
     """ Base class for spider """
@@ -185,7 +187,8 @@ class Spider(object):
                                        obj_label=obj_label,
                                        resource=resource)
         list_files = XnatUtils.download_files_from_obj(directory=folder,
-                                                       resource_obj=resource_obj)
+                                                       resource_obj=resource_obj,
+                                                       resume=True)
         # close connection
         xnat.disconnect()
         return list_files
@@ -812,6 +815,8 @@ class AutoSpider(Spider):
         self.input_dir = os.path.join(self.jobdir, 'INPUT')
         self.script_dir = os.path.join(self.jobdir, 'SCRIPT')
         self.run_inputs = {}
+        # Method used to stage each local input (reflink/copy)
+        self.staging_methods = {}
 
     def get_argparser(self):
         if self.datatype == 'scan':
@@ -858,24 +863,70 @@ class AutoSpider(Spider):
 
         os.mkdir(self.input_dir)
 
+        # Split the lists to handle each individual file/dir
+        staging_list = []
         for _input in self.copy_list:
-            # Split the list and handle each copy each individual file/dir
             src_list = self.src_inputs[_input].split(',')
-            dst_list = []
             for i, src in enumerate(src_list):
-                input_name = _input+'_'+str(i)
-                dst = self.copy_input(src, input_name)
-                if not dst:
-                    print('ERROR:copying inputs')
-                    return None
-                else:
-                    dst_list.append(dst)
+                staging_list.append((_input+'_'+str(i), src))
+
+        # Stage the inputs concurrently, each thread downloads the XNAT
+        # inputs with its own pooled connection
+        pool = ThreadPool(STAGING_WORKERS)
+        try:
+            staged = pool.map(self.timed_copy_input, staging_list)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.print_staging_report(staging_list, staged)
+        if not all(dst for dst, _ in staged):
+            print('ERROR:copying inputs')
+            return None
 
-            # Build new comma-separated list with local paths
+        # Build new comma-separated lists with local paths
+        staged = iter(staged)
+        for _input in self.copy_list:
+            nb_inputs = len(self.src_inputs[_input].split(','))
+            dst_list = [next(staged)[0] for _ in range(nb_inputs)]
             self.run_inputs[_input] = ','.join(dst_list)
 
         return self.run_inputs
 
+    def timed_copy_input(self, staging):
+        """
+        Copy an input and time it (run in the staging threads)
+
+        :param staging: tuple (input name, source)
+        :return: tuple (local path or None, time in seconds)
+        """
+        input_name, src = staging
+        start = time.time()
+        try:
+            dst = self.copy_input(src, input_name)
+        except Exception as err:
+            print('ERROR:copying input %s: %s' % (input_name, err))
+            dst = None
+        return dst, time.time() - start
+
+    def print_staging_report(self, staging_list, staged):
+        """
+        Print the time spent to stage each input in the job log
+
+        :param staging_list: list of tuples (input name, source)
+        :param staged: list of tuples (local path or None, time in seconds)
+        :return: None
+        """
+        print('INFO:inputs staging report:')
+        for (input_name, src), (dst, duration) in zip(staging_list, staged):
+            if not dst:
+                method = 'FAILED'
+            elif self.is_xnat_uri(src):
+                method = 'download'
+            else:
+                method = self.staging_methods.get(input_name, 'copy')
+            print('  %s: %s in %.1fs (%s)' % (input_name, method, duration, src))
+
     def go(self):
 
         self.pre_run()
@@ -1004,12 +1055,9 @@ class AutoSpider(Spider):
         dst_dir = os.path.join(self.input_dir, input_name)
         os.makedirs(dst_dir)
 
-        if os.path.isdir(src):
-            dst = os.path.join(dst_dir, os.path.basename(src))
-            copytree(src, dst)
-        elif os.path.isfile(src):
+        if os.path.isdir(src) or os.path.isfile(src):
             dst = os.path.join(dst_dir, os.path.basename(src))
-            copyfile(src, dst)
+            self.staging_methods[input_name] = XnatUtils.link_or_copy(src, dst)
         else:
             print('ERROR:input does not exist:'+src)
             dst = None
@@ -1020,18 +1068,18 @@ class AutoSpider(Spider):
         result = None
 
         try:
-            xnat = XnatUtils.get_interface(self.host, self.user, self.pwd)
+            # pyxnat is not thread safe: one connection per staging thread
+            xnat = XnatUtils.get_pooled_interface(self.host, self.user, self.pwd)
 
             try:
                 _res, _file = src.split('/files/')
                 res = xnat.select(_res)
-                result = res.file(_file).get(dst)
+                result = XnatUtils.download_file_from_obj(os.path.dirname(dst), res, _file,
+                                                           resume=True)
             except:
                 print('ERROR:downloading from XNAT')
         except:
             print('ERROR:FAILED to get XNAT connection')
-        finally:
-            xnat.disconnect()
 
         return result
 
@@ -1039,17 +1087,17 @@ class AutoSpider(Spider):
         result = None
 
         try:
-            xnat = XnatUtils.get_interface(self.host, self.user, self.pwd)
+            xnat = XnatUtils.get_pooled_interface(self.host, self.user, self.pwd)
             try:
                 res = xnat.select(src)
-                res.get(dst, extract=True)
+                if not os.path.isdir(dst):
+                    os.makedirs(dst)
+                XnatUtils.download_files_from_obj(dst, res)
                 result = dst
             except:
                 print('ERROR:downloading from XNAT')
         except:
             print('ERROR:FAILED to get XNAT connection')
-        finally:
-            xnat.disconnect()
 
         return result
 
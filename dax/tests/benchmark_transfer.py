@@ -0,0 +1,127 @@
+"""
+Benchmark of the transfer strategies of Xnatmirror (one zip or file by file)
+ on synthetic resources, to check the thresholds of choose_transfer_strategy
+ (pinned in test_xnatmirror.py) when they are changed.
+
+The files of each resource are generated in a temporary folder. The cost of
+ the zip (compression on the source XNAT, extraction on the destination) is
+ measured; the network is simulated: a round trip per request and the
+ bandwidth of one HTTP stream, the files being copied by --workers streams
+ sharing the bandwidth of the link.
+
+    python -m dax.tests.benchmark_transfer [--latency 0.05] [--workers 4]
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import string
+import zipfile
+import argparse
+import tempfile
+
+from dax.tests.utils import load_script
+
+# bytes limited to 16 values: deflate shrinks them by about half (DICOM/NIfTI)
+LOW_ENTROPY = string.maketrans(''.join(chr(i) for i in range(256)),
+                               ''.join(chr(i % 16) for i in range(256)))
+MB = 1024.0**2
+# name, number of files, size of a file, extension, compressible
+RESOURCES = [('DICOM series', 200, 200*1024, '.dcm', True),
+             ('DICOM few slices', 20, 500*1024, '.dcm', True),
+             ('FreeSurfer stats', 30, 20*1024, '.stats', True),
+             ('NIfTI', 2, 40*1024**2, '.nii', True),
+             ('NIfTI gzipped', 2, 40*1024**2, '.nii.gz', False),
+             ('gzipped volumes', 12, 4*1024**2, '.nii.gz', False),
+             ('PNG snapshots', 5, 2*1024**2, '.png', False)]
+
+
+def generate_files(directory, nb_files, size, ext, compressible):
+    """Write the files of a synthetic resource, return its catalog."""
+    files_list = list()
+    for index in range(nb_files):
+        data = os.urandom(size)
+        if compressible:
+            data = data.translate(LOW_ENTROPY)
+        path = 'file%d%s' % (index, ext)
+        with open(os.path.join(directory, path), 'wb') as f_obj:
+            f_obj.write(data)
+        files_list.append({'path': path, 'size': size, 'digest': ''})
+    return files_list
+
+
+def time_zip(directory, files_list, args):
+    """Time of the copy as one zip: one request streaming the zip, unzip."""
+    zip_path = directory+'.zip'
+    start = time.time()
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+        for file_dict in files_list:
+            f_zip.write(os.path.join(directory, file_dict['path']), file_dict['path'])
+    zip_time = time.time()-start
+    zip_size = os.path.getsize(zip_path)
+    start = time.time()
+    with zipfile.ZipFile(zip_path) as f_zip:
+        f_zip.extractall(directory+'_unzip')
+    unzip_time = time.time()-start
+    os.remove(zip_path)
+    shutil.rmtree(directory+'_unzip')
+    stream_bw = min(args.stream_bandwidth, args.bandwidth)*MB
+    # XNAT streams the zip while compressing it
+    return args.latency + max(zip_time, zip_size/stream_bw) + unzip_time
+
+
+def time_files(files_list, args):
+    """Time of the copy file by file by the workers (simulated)."""
+    stream_bw = min(args.stream_bandwidth, args.bandwidth)*MB
+    workers = [0.0]*args.workers
+    for file_dict in files_list:
+        index = workers.index(min(workers))
+        workers[index] += args.latency + file_dict['size']/stream_bw
+    total_size = sum(file_dict['size'] for file_dict in files_list)
+    return max(max(workers), total_size/(args.bandwidth*MB))
+
+
+def parse_args():
+    """Parse the arguments."""
+    argp = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('--latency', type=float, default=0.05,
+                      help='round trip of a request to XNAT in seconds. Default: 0.05')
+    argp.add_argument('--bandwidth', type=float, default=100,
+                      help='bandwidth of the link in MB/s. Default: 100')
+    argp.add_argument('--stream-bandwidth', dest='stream_bandwidth', type=float, default=25,
+                      help='bandwidth of one HTTP stream in MB/s. Default: 25')
+    argp.add_argument('--workers', type=int, default=4,
+                      help='number of files copied at the same time. Default: 4')
+    return argp.parse_args()
+
+
+def main():
+    """Run the benchmark and print the results."""
+    args = parse_args()
+    mirror = load_script(os.path.join('Xnat_tools', 'Xnatmirror'))
+    mirror['STRATEGY'] = 'auto'
+    tmp_dir = tempfile.mkdtemp()
+    print('%-18s %6s %8s %8s %8s  %-6s %s' % ('resource', 'files', 'MB', 'zip(s)',
+                                              'files(s)', 'chosen', ''))
+    try:
+        for index, (name, nb_files, size, ext, compressible) in enumerate(RESOURCES):
+            directory = os.path.join(tmp_dir, str(index))
+            os.makedirs(directory)
+            files_list = generate_files(directory, nb_files, size, ext, compressible)
+            zip_time = time_zip(directory, files_list, args)
+            files_time = time_files(files_list, args)
+            use_zip, reason = mirror['choose_transfer_strategy'](files_list)
+            best = 'OK' if use_zip == (zip_time < files_time) else 'SLOWER'
+            print('%-18s %6d %8.1f %8.2f %8.2f  %-6s %s: %s' % (
+                name, nb_files, nb_files*size/MB, zip_time, files_time,
+                'zip' if use_zip else 'files', best, reason))
+            shutil.rmtree(directory)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+from unittest import TestCase
+
+import threading
+import requests
+
+from dax import XnatUtils
+from dax.XnatUtils import ConcurrentInterface
+
+
+class MockXnat(object):
+    """In-memory XNAT shared by the mock interfaces"""
+    def __init__(self, listings=None, failures=None):
+        self.listings = listings or dict()
+        self.attrs = dict()
+        self.docs = dict()
+        # number of connection errors to raise for a URI before answering
+        self.failures = failures or dict()
+        self.calls = list()
+        self.interfaces = list()
+        self.lock = threading.Lock()
+
+    def interface(self):
+        intf = MockInterface(self)
+        with self.lock:
+            self.interfaces.append(intf)
+        return intf
+
+
+class MockAttrs(object):
+    def __init__(self, xnat, uri):
+        self.xnat = xnat
+        self.uri = uri
+
+    def get(self, path):
+        return self.xnat.attrs.get((self.uri, path))
+
+    def set(self, path, value):
+        self.xnat.attrs[(self.uri, path)] = value
+
+
+class MockObject(object):
+    def __init__(self, xnat, uri):
+        self.xnat = xnat
+        self.uri = uri
+        self.attrs = MockAttrs(xnat, uri)
+
+    def get(self):
+        return self.xnat.docs[self.uri]
+
+
+class MockInterface(object):
+    def __init__(self, xnat):
+        self.xnat = xnat
+        self.closed = False
+
+    def _get_json(self, uri):
+        with self.xnat.lock:
+            self.xnat.calls.append(uri)
+            if self.xnat.failures.get(uri):
+                self.xnat.failures[uri] -= 1
+                raise requests.exceptions.ConnectionError('connection reset')
+        if uri not in self.xnat.listings:
+            raise ValueError('404 Not Found: %s' % uri)
+        return self.xnat.listings[uri]
+
+    def select(self, uri):
+        return MockObject(self.xnat, uri)
+
+    def disconnect(self):
+        self.closed = True
+
+
+class TestConcurrentInterface(TestCase):
+    def get_client(self, xnat, max_workers=4):
+        return ConcurrentInterface(max_workers=max_workers, retry_delay=0,
+                                   interface_factory=xnat.interface)
+
+    def test_get_json_keeps_order(self):
+        uris = ['/REST/projects/P/subjects/%d/resources' % i for i in range(20)]
+        xnat = MockXnat(listings=dict((uri, [{'label': uri}]) for uri in uris))
+        with self.get_client(xnat) as client:
+            results = client.get_json(uris)
+        self.assertEqual([res[0]['label'] for res in results], uris)
+
+    def test_retry_connection_errors(self):
+        xnat = MockXnat(listings={'/a': [1]}, failures={'/a': 2})
+        with self.get_client(xnat) as client:
+            self.assertEqual(client.get_json(['/a']), [[1]])
+        self.assertEqual(xnat.calls, ['/a', '/a', '/a'])
+
+    def test_no_retry_http_errors(self):
+        xnat = MockXnat()
+        with self.get_client(xnat) as client:
+            self.assertRaises(ValueError, client.get_json, ['/missing'])
+        self.assertEqual(xnat.calls, ['/missing'])
+
+    def test_attrs(self):
+        xnat = MockXnat()
+        with self.get_client(xnat) as client:
+            client.set_attrs([('/s/%d' % i, 'xnat:mrSessionData/note', str(i))
+                              for i in range(10)])
+            values = client.get_attrs([('/s/%d' % i, 'xnat:mrSessionData/note')
+                                       for i in range(10)])
+        self.assertEqual(values, [str(i) for i in range(10)])
+
+    def test_close_disconnects_interfaces(self):
+        xnat = MockXnat(listings={'/a': []})
+        client = self.get_client(xnat, max_workers=3)
+        client.get_json(['/a'] * 30)
+        client.close()
+        self.assertTrue(0 < len(xnat.interfaces) <= 3)
+        self.assertTrue(all(intf.closed for intf in xnat.interfaces))
+
+    def test_load_cached_sessions_with_client(self):
+        xnat = MockXnat()
+        sessions = list()
+        for i in range(5):
+            sess = {'project_label': 'P', 'subject_label': 'S', 'session_label': 'E%d' % i}
+            sessions.append(sess)
+            xnat.docs['/project/P/subject/S/experiment/E%d' % i] = \
+                '<xnat:MRSession xmlns:xnat="http://nrg.wustl.edu/xnat" label="E%d"/>' % i
+        sessions.append({'project_label': 'P', 'subject_label': 'S', 'session_label': 'E9'})
+        client = self.get_client(xnat, max_workers=2)
+        csess_list = XnatUtils.load_cached_sessions(None, sessions, client=client)
+        csess_list += XnatUtils.load_cached_sessions(None, sessions[:2], client=client)
+        # the client of the caller is reused and left open
+        self.assertTrue(0 < len(xnat.interfaces) <= 2)
+        self.assertFalse(any(intf.closed for intf in xnat.interfaces))
+        client.close()
+        self.assertEqual([csess.label() if csess else None for csess in csess_list],
+                         ['E0', 'E1', 'E2', 'E3', 'E4', None, 'E0', 'E1'])
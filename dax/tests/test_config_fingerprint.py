@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from dax import XnatUtils
+
+
+class Config(object):
+    """Object with a configuration like a processor"""
+    def __init__(self, **kwargs):
+        self.version = '1.0.0'
+        self.scan_types = ['T1', 'MPRAGE']
+        self.params = {'smoothing': 6, 'mask': True}
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class OtherConfig(Config):
+    pass
+
+
+def fingerprint(obj, exclude=None):
+    return XnatUtils.get_config_fingerprint(obj, exclude)
+
+
+class TestConfigFingerprint(TestCase):
+    def test_stable(self):
+        self.assertEqual(fingerprint(Config()), fingerprint(Config()))
+        # order of the attributes and of the dictionaries/sets
+        first = Config(params={'smoothing': 6, 'mask': True}, types=set(['T2', 'FLAIR']))
+        second = Config(params={'mask': True, 'smoothing': 6}, types=set(['FLAIR', 'T2']))
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        # only hex characters: stored with the build index
+        self.assertEqual(len(fingerprint(first)), 40)
+
+    def test_changes(self):
+        reference = fingerprint(Config())
+        self.assertNotEqual(fingerprint(Config(version='1.0.1')), reference)
+        self.assertNotEqual(fingerprint(Config(scan_types=['T1'])), reference)
+        self.assertNotEqual(fingerprint(Config(params={'smoothing': 8, 'mask': True})),
+                            reference)
+        self.assertNotEqual(fingerprint(Config(new_option=None)), reference)
+        self.assertNotEqual(fingerprint(OtherConfig()), reference)
+
+    def test_ignored(self):
+        reference = fingerprint(Config(text_report=''))
+        self.assertEqual(fingerprint(Config(text_report='report'), exclude=['text_report']),
+                         fingerprint(Config(), exclude=['text_report']))
+        self.assertNotEqual(fingerprint(Config(text_report='report')), reference)
+        # objects (e.g. interface, logger) are not part of the configuration
+        self.assertEqual(fingerprint(Config(xnat=object())), fingerprint(Config(xnat=object())))
@@ -0,0 +1,309 @@
+from unittest import TestCase
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+
+from dax.tests.utils import load_script
+
+LOGGER = logging.getLogger('test_dax_upload')
+LOGGER.addHandler(logging.NullHandler())
+
+
+class DaxUploadTestCase(TestCase):
+    def setUp(self):
+        self.upload = load_script(os.path.join('dax_tools', 'dax_upload'))
+        self.tmp_dir = tempfile.mkdtemp()
+        self.upload['RESULTS_DIR'] = self.tmp_dir
+        self.upload['LOGGER'] = LOGGER
+        for folder in self.upload['_UPLOAD_SKIP_LIST']:
+            os.makedirs(os.path.join(self.tmp_dir, folder))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestUploadJournal(DaxUploadTestCase):
+    label = 'PROJ-x-SUBJ-x-SESS-x-Test_v1'
+
+    def setUp(self):
+        super(TestUploadJournal, self).setUp()
+        self.assessor_path = os.path.join(self.tmp_dir, self.label)
+        os.makedirs(os.path.join(self.assessor_path, 'STATS', 'sub'))
+        for fname in ['stats.txt', os.path.join('sub', 'data.txt')]:
+            with open(os.path.join(self.assessor_path, 'STATS', fname), 'w') as f_obj:
+                f_obj.write('stats')
+        self.write_flag_file()
+        self.assessor_dict = {'label': self.label, 'path': self.assessor_path}
+
+    def write_flag_file(self, mtime=None):
+        flag_path = os.path.join(self.assessor_path, self.upload['_READY_FLAG_FILE'])
+        open(flag_path, 'w').close()
+        if mtime:
+            os.utime(flag_path, (mtime, mtime))
+
+    def test_round_trip(self):
+        journal = self.upload['load_upload_journal'](self.assessor_dict, quiet=True)
+        self.assertEqual(journal['resources'], dict())
+        journal['xml'] = True
+        self.upload['confirm_resource'](journal, 'STATS',
+                                        os.path.join(self.assessor_path, 'STATS'))
+        loaded = self.upload['load_upload_journal'](self.assessor_dict, quiet=True)
+        self.assertEqual(loaded, journal)
+        self.assertEqual(loaded['resources']['STATS'],
+                         sorted(['stats.txt', os.path.join('sub', 'data.txt')]))
+        self.upload['remove_upload_journal'](self.label)
+        self.assertFalse(os.path.exists(self.upload['get_journal_path'](self.label)))
+
+    def test_new_results_invalidate_journal(self):
+        journal = self.upload['load_upload_journal'](self.assessor_dict, quiet=True)
+        self.upload['confirm_resource'](journal, 'STATS',
+                                        os.path.join(self.assessor_path, 'STATS'))
+        # the job ran again and wrote a new flag file
+        self.write_flag_file(time.time()+10)
+        loaded = self.upload['load_upload_journal'](self.assessor_dict, quiet=True)
+        self.assertEqual(loaded['resources'], dict())
+
+    def test_corrupted_journal(self):
+        with open(self.upload['get_journal_path'](self.label), 'w') as f_obj:
+            f_obj.write('{"label": ')
+        journal = self.upload['load_upload_journal'](self.assessor_dict, quiet=True)
+        self.assertEqual(journal['resources'], dict())
+
+
+class TestFlagFile(DaxUploadTestCase):
+    def setUp(self):
+        super(TestFlagFile, self).setUp()
+        self.flagfile = os.path.join(self.tmp_dir, 'Process_Upload_running.txt')
+        self.upload['DAX_UPLOAD_FLAGFILE'] = self.flagfile
+
+    def tearDown(self):
+        if self.upload['FLAGFILE_FD'] is not None:
+            os.close(self.upload['FLAGFILE_FD'])
+        super(TestFlagFile, self).tearDown()
+
+    def write_flagfile(self, content):
+        with open(self.flagfile, 'w') as f_obj:
+            f_obj.write(content)
+
+    def read_pid(self):
+        return self.upload['read_flagfile_pid'](self.flagfile)
+
+    def test_lock(self):
+        self.assertFalse(self.upload['is_dax_upload_running']())
+        self.assertEqual(self.read_pid(), os.getpid())
+        fd_lock = self.upload['FLAGFILE_FD']
+        # a second dax_upload can't lock the flag file
+        self.assertTrue(self.upload['is_dax_upload_running']())
+        self.assertEqual(self.upload['FLAGFILE_FD'], fd_lock)
+
+    def test_take_over_legacy_flagfile(self):
+        self.write_flagfile('Date: 2017101_10:00:00\n')
+        self.assertFalse(self.upload['is_dax_upload_running']())
+        self.assertEqual(self.read_pid(), os.getpid())
+
+    def test_take_over_stale_flagfile(self):
+        pid = os.fork()
+        if not pid:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.write_flagfile('PID: %d\n' % pid)
+        self.assertFalse(self.upload['is_dax_upload_running']())
+        self.assertEqual(self.read_pid(), os.getpid())
+
+    def test_running_without_lock(self):
+        # flag file of a running dax_upload not using the lock
+        self.write_flagfile('PID: %d\n' % os.getppid())
+        self.assertTrue(self.upload['is_dax_upload_running']())
+        self.assertEqual(self.upload['FLAGFILE_FD'], None)
+
+
+class MockListings(object):
+    """list_project_assessors of XnatUtils counting the listings"""
+    def __init__(self, assessors):
+        self.assessors = assessors
+        self.listings = list()
+
+    def list_project_assessors(self, intf, project):
+        self.listings.append(project)
+        return [assessor for assessor in self.assessors
+                if assessor['label'].startswith(project+'-x-')]
+
+
+class TestPrefetch(DaxUploadTestCase):
+    def setUp(self):
+        super(TestPrefetch, self).setUp()
+        open(os.path.join(self.tmp_dir, 'PBS', 'P1-x-S-x-E-x-PBS_v1.pbs'), 'w').close()
+        open(os.path.join(self.tmp_dir, 'OUTLOG', 'P2-x-S-x-E-x-LOG_v1.output'), 'w').close()
+        self.xnat = MockListings([
+            {'label': 'P1-x-S-x-E-x-Done_v1', 'procstatus': 'COMPLETE', 'resources': []},
+            {'label': 'P1-x-S-x-E-x-New_v1', 'procstatus': 'JOB_RUNNING', 'resources': []},
+            {'label': 'P1-x-S-x-E-x-PBS_v1', 'procstatus': 'JOB_RUNNING', 'resources': []}])
+        self.upload['XnatUtils'] = self.xnat
+        self.upload['SNAPSHOTS_POOL'] = True
+
+    def test_one_listing_per_project(self):
+        assessors_list = ['P1-x-S-x-E-x-Done_v1', 'P1-x-S-x-E-x-New_v1']
+        prefetched = self.upload['prefetch_upload'](None, None, assessors_list)
+        self.assertEqual(sorted(self.xnat.listings), ['P1', 'P2'])
+        self.assertEqual(prefetched[1], set())
+        self.assertEqual(self.upload['get_snapshots_list'](None, assessors_list, prefetched),
+                         ['P1-x-S-x-E-x-New_v1'])
+        # the prefetched information is used, no new listing
+        self.assertEqual(len(self.xnat.listings), 2)
+
+    def test_no_assessors_without_snapshots_pool(self):
+        self.upload['SNAPSHOTS_POOL'] = None
+        self.upload['prefetch_upload'](None, ['P3'], ['P3-x-S-x-E-x-New_v1'])
+        self.assertEqual(self.xnat.listings, [])
+
+
+def host(name, projects):
+    return {'host': name, 'username': 'user', 'password': 'pwd', 'projects': projects}
+
+
+class TestUploadSettings(DaxUploadTestCase):
+    def get_groups(self, *upload_settings):
+        self.upload['UPLOAD_SETTINGS'] = list(upload_settings)
+        groups = self.upload['group_upload_settings']()
+        return sorted([upload_dict['host'] for upload_dict in group] for group in groups)
+
+    def test_separate_projects(self):
+        self.assertEqual(self.get_groups(host('A', 'P1,P2'), host('B', ['P3']), host('C', 'P4')),
+                         [['A'], ['B'], ['C']])
+
+    def test_shared_projects(self):
+        # hosts sharing a project are uploaded one after the other, in order
+        groups = self.get_groups(host('A', 'P1'), host('B', 'P2'), host('C', 'P2,P1'),
+                                 host('D', 'P3'))
+        self.assertEqual(groups, [['A', 'B', 'C'], ['D']])
+
+    def test_all_projects(self):
+        self.assertEqual(self.get_groups(host('A', 'P1'), host('B', None), host('C', 'P2')),
+                         [['A', 'B', 'C']])
+
+
+class MockAssessor(object):
+    def __init__(self, exists):
+        self._exists = exists
+
+    def exists(self):
+        return self._exists
+
+    def out_resource(self, resource):
+        return resource
+
+
+class TestUploadPbs(DaxUploadTestCase):
+    def setUp(self):
+        super(TestUploadPbs, self).setUp()
+        self.uploads = list()
+        self.created = set()
+        self.upload['select_assessor'] = lambda xnat, assessor_dict: \
+            MockAssessor(assessor_dict['label'] in self.created)
+        self.xnat = MockListings([
+            {'label': 'P1-x-S-x-E-x-New_v1', 'procstatus': 'JOB_FAILED', 'resources': []},
+            {'label': 'P1-x-S-x-E-x-Done_v1', 'procstatus': 'JOB_FAILED',
+             'resources': ['PBS', 'OUTLOG']}])
+        self.xnat.upload_file_to_obj = lambda fpath, resource: \
+            self.uploads.append((os.path.basename(fpath), resource)) or True
+        self.upload['XnatUtils'] = self.xnat
+
+    def add_file(self, folder, name):
+        open(os.path.join(self.tmp_dir, folder, name), 'w').close()
+
+    def get_files(self, folder):
+        return sorted(os.listdir(os.path.join(self.tmp_dir, folder)))
+
+    def test_pbs(self):
+        for label in ['P1-x-S-x-E-x-New_v1', 'P1-x-S-x-E-x-Done_v1',
+                      'P1-x-S-x-E-x-Missing_v1', 'P1-x-S-x-E-x-Created_v1']:
+            self.add_file('PBS', label+'.pbs')
+        self.created.add('P1-x-S-x-E-x-Created_v1')
+        self.upload['upload_pbs'](None, None)
+        self.assertEqual(self.xnat.listings, ['P1'])
+        self.assertEqual(self.uploads, [('P1-x-S-x-E-x-New_v1.pbs', 'PBS')])
+        self.assertEqual(self.get_files('TRASH'), ['P1-x-S-x-E-x-Done_v1.pbs',
+                                                   'P1-x-S-x-E-x-Missing_v1.pbs'])
+        # created since the listing: kept for the next upload
+        self.assertEqual(self.get_files('PBS'), ['P1-x-S-x-E-x-Created_v1.pbs'])
+
+    def test_outlog(self):
+        for label in ['P1-x-S-x-E-x-New_v1', 'P1-x-S-x-E-x-Done_v1', 'P1-x-S-x-E-x-Missing_v1']:
+            self.add_file('OUTLOG', label+'.output')
+        self.upload['upload_outlog'](None, None)
+        self.assertEqual(self.uploads, [('P1-x-S-x-E-x-New_v1.output', 'OUTLOG')])
+        self.assertEqual(self.get_files('TRASH'), ['P1-x-S-x-E-x-Missing_v1.output'])
+
+    def test_project_not_listed(self):
+        def list_project_assessors(intf, project):
+            raise IOError('connection refused')
+        self.xnat.list_project_assessors = list_project_assessors
+        self.add_file('PBS', 'P1-x-S-x-E-x-Missing_v1.pbs')
+        self.add_file('OUTLOG', 'P1-x-S-x-E-x-Missing_v1.output')
+        prefetched = self.upload['prefetch_upload'](None, None, [])
+        self.upload['upload_pbs'](None, None, prefetched)
+        self.upload['upload_outlog'](None, None, prefetched)
+        self.assertEqual(self.get_files('TRASH'), [])
+        self.assertEqual(self.uploads, [])
+
+
+class TestUploadBatch(DaxUploadTestCase):
+    def setUp(self):
+        super(TestUploadBatch, self).setUp()
+        self.calls = list()
+        self.failing = set()
+        self.upload['UPLOAD_SETTINGS'] = [host('A', 'P1'), host('B', None)]
+        self.upload['WARNING_LIST'] = list()
+        self.upload['send_warning_emails'] = lambda: None
+        self.upload['get_daemon_interface'] = self.get_daemon_interface
+        self.upload['prefetch_upload'] = lambda xnat, projects, labels, pbs_outlog: None
+        self.upload['upload_assessors'] = lambda xnat, projects, labels, prefetched: \
+            self.calls.append((xnat, 'assessors', labels))
+        self.upload['upload_pbs'] = lambda xnat, projects, prefetched: \
+            self.calls.append((xnat, 'pbs'))
+        self.upload['upload_outlog'] = lambda xnat, projects, prefetched: None
+        self.connections = dict()
+        self.passes = dict()
+
+    def get_daemon_interface(self, connections, index, upload_dict):
+        if upload_dict['host'] in self.failing:
+            raise IOError('connection refused')
+        connections[index] = upload_dict['host']
+        return upload_dict['host']
+
+    def upload_batch(self, assessors_list):
+        self.calls = list()
+        return self.upload['upload_batch'](self.connections, assessors_list, self.passes)
+
+    def test_first_host_wins(self):
+        retry_list = self.upload_batch(['P1-x-S-x-E-x-Test_v1', 'P2-x-S-x-E-x-Test_v1'])
+        self.assertEqual(retry_list, [])
+        self.assertEqual(self.calls, [('A', 'assessors', ['P1-x-S-x-E-x-Test_v1']),
+                                      ('B', 'assessors', ['P2-x-S-x-E-x-Test_v1'])])
+
+    def test_failed_host_retried(self):
+        self.connections[0] = 'A'
+        self.failing.add('A')
+        retry_list = self.upload_batch(['P1-x-S-x-E-x-Test_v1', 'P2-x-S-x-E-x-Test_v1'])
+        self.assertEqual(retry_list, ['P1-x-S-x-E-x-Test_v1'])
+        # reconnected on the next batch
+        self.assertNotIn(0, self.connections)
+        self.assertEqual(self.calls, [('B', 'assessors', ['P2-x-S-x-E-x-Test_v1'])])
+
+    def test_pbs_outlog_pass(self):
+        self.upload_batch([])
+        self.assertEqual(self.calls, [])
+        open(os.path.join(self.tmp_dir, 'PBS', 'P2-x-S-x-E-x-Test_v1.pbs'), 'w').close()
+        self.upload_batch([])
+        self.assertEqual(self.calls, [('B', 'pbs')])
+        # PBS folder not changed and no assessors uploaded to the host
+        self.upload_batch(['P1-x-S-x-E-x-Test_v1'])
+        self.assertEqual(self.calls, [('A', 'assessors', ['P1-x-S-x-E-x-Test_v1'])])
+        # rescan
+        stamp, last_time = self.passes[1]
+        self.passes[1] = (stamp, last_time-self.upload['DAEMON_RESCAN']-1)
+        self.upload_batch([])
+        self.assertEqual(self.calls, [('B', 'pbs')])
@@ -0,0 +1,113 @@
+from unittest import TestCase
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+import requests
+
+from dax import XnatUtils
+
+DATA = 'nifti'*100
+
+
+class MockResponse(object):
+    def __init__(self, status_code, data='', drop=False):
+        self.status_code = status_code
+        self.data = data
+        self.drop = drop
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError('%d error' % self.status_code, response=self)
+
+    def iter_content(self, chunk_size):
+        yield self.data[:len(self.data)/2]
+        if self.drop:
+            raise requests.exceptions.ConnectionError('connection dropped')
+        yield self.data[len(self.data)/2:]
+
+
+class MockHttp(object):
+    """HTTP session of a mock XNAT answering with the responses given"""
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = list()
+
+    def get(self, url, headers=None, stream=False):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+
+class MockInterface(object):
+    def __init__(self, responses):
+        self._server = 'https://xnat.test'
+        self._http = MockHttp(responses)
+
+
+class TestDownloadResume(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.tmp_dir, 'image.nii')
+        self.file_dict = {'path': 'image.nii', 'uri': '/data/files/image.nii',
+                          'size': len(DATA), 'digest': hashlib.md5(DATA).hexdigest()}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_part(self, data):
+        with open(self.fpath+'.part', 'wb') as f_part:
+            f_part.write(data)
+
+    def download(self, *responses):
+        intf = MockInterface(list(responses))
+        XnatUtils.download_file_resume(intf, self.file_dict, self.fpath, retry_delay=0)
+        with open(self.fpath, 'rb') as f_obj:
+            self.assertEqual(f_obj.read(), DATA)
+        self.assertFalse(os.path.exists(self.fpath+'.part'))
+        return intf._http.requests
+
+    def test_download(self):
+        requests_list = self.download(MockResponse(200, DATA))
+        self.assertEqual(requests_list, [('https://xnat.test/data/files/image.nii', {})])
+
+    def test_partial_content(self):
+        self.write_part(DATA[:100])
+        requests_list = self.download(MockResponse(206, DATA[100:]))
+        self.assertEqual(requests_list[0][1], {'Range': 'bytes=100-'})
+
+    def test_range_ignored(self):
+        # 200: the whole file is sent again, the part is overwritten
+        self.write_part('x'*100)
+        self.download(MockResponse(200, DATA))
+
+    def test_range_not_satisfiable(self):
+        # size unknown: the part was complete
+        self.file_dict['size'] = None
+        self.write_part(DATA)
+        self.download(MockResponse(416))
+
+    def test_complete_part(self):
+        self.write_part(DATA)
+        self.assertEqual(self.download(), [])
+
+    def test_resume_dropped_connection(self):
+        requests_list = self.download(MockResponse(200, DATA, drop=True),
+                                      MockResponse(206, DATA[len(DATA)/2:]))
+        self.assertEqual(requests_list[1][1], {'Range': 'bytes=%d-' % (len(DATA)/2)})
+
+    def test_client_error_not_retried(self):
+        intf = MockInterface([MockResponse(404), MockResponse(200, DATA)])
+        self.assertRaises(requests.exceptions.HTTPError, XnatUtils.download_file_resume,
+                          intf, self.file_dict, self.fpath, retry_delay=0)
+        self.assertEqual(len(intf._http.requests), 1)
+
+    def test_digest_mismatch(self):
+        self.file_dict['digest'] = hashlib.md5('other').hexdigest()
+        intf = MockInterface([MockResponse(200, DATA), MockResponse(200, DATA)])
+        self.assertRaises(IOError, XnatUtils.download_file_resume, intf, self.file_dict,
+                          self.fpath, retries=1, retry_delay=0)
+        self.assertEqual(len(intf._http.requests), 2)
+        self.assertFalse(os.path.exists(self.fpath+'.part'))
+        self.assertFalse(os.path.exists(self.fpath))
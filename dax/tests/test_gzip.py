@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+import os
+import gzip
+import stat
+import zlib
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from dax import XnatUtils
+
+
+class TestGzip(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.block_size = XnatUtils.GZIP_BLOCK_SIZE
+        # several blocks for small files
+        XnatUtils.GZIP_BLOCK_SIZE = 1024
+
+    def tearDown(self):
+        XnatUtils.GZIP_BLOCK_SIZE = self.block_size
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, data):
+        fpath = os.path.join(self.tmp_dir, name)
+        with open(fpath, 'wb') as f_obj:
+            f_obj.write(data)
+        return fpath
+
+    def check_round_trip(self, data, pool=None):
+        fpath = self.write_file('image.nii', data)
+        os.chmod(fpath, 0640)
+        gz_path = XnatUtils.compress_file(fpath, pool=pool)
+        self.assertEqual(gz_path, fpath+'.gz')
+        self.assertFalse(os.path.exists(fpath))
+        self.assertEqual(stat.S_IMODE(os.stat(gz_path).st_mode), 0640)
+        # readable by gzip (CRC and size checked at the end of the file)
+        with open(gz_path, 'rb') as f_obj:
+            self.assertEqual(zlib.decompress(f_obj.read(), 16+zlib.MAX_WBITS), data)
+        self.assertEqual(XnatUtils.decompress_file(gz_path), fpath)
+        self.assertFalse(os.path.exists(gz_path))
+        with open(fpath, 'rb') as f_obj:
+            self.assertEqual(f_obj.read(), data)
+
+    def test_round_trip(self):
+        self.check_round_trip('')
+        self.check_round_trip('nifti'*10)
+        # last block full: the end of the stream is in an empty block
+        self.check_round_trip(os.urandom(2048))
+        self.check_round_trip(os.urandom(5000))
+
+    def test_blocks_in_parallel(self):
+        pool = ThreadPool(3)
+        try:
+            self.check_round_trip(os.urandom(1024*10+7), pool)
+            self.check_round_trip(os.urandom(1024*6), pool)
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_concatenated_members(self):
+        data = list()
+        with open(os.path.join(self.tmp_dir, 'image.nii.gz'), 'wb') as f_out:
+            for index in range(2):
+                data.append(os.urandom(3000))
+                gz_path = XnatUtils.compress_file(self.write_file('part%d' % index, data[-1]))
+                with open(gz_path, 'rb') as f_in:
+                    f_out.write(f_in.read())
+        fpath = XnatUtils.decompress_file(os.path.join(self.tmp_dir, 'image.nii.gz'))
+        with open(fpath, 'rb') as f_obj:
+            self.assertEqual(f_obj.read(), ''.join(data))
+
+    def test_gzip_command_files(self):
+        gz_path = os.path.join(self.tmp_dir, 'image.nii.gz')
+        with gzip.open(gz_path, 'wb') as f_obj:
+            f_obj.write('nifti'*1000)
+        self.assertEqual(XnatUtils.gunzip_files([gz_path]),
+                         [os.path.join(self.tmp_dir, 'image.nii')])
+
+    def test_gzip_files(self):
+        files_list = [self.write_file('small.nii', 'small'),
+                      self.write_file('big.nii', os.urandom(4096))]
+        gz_paths = XnatUtils.gzip_files(files_list, max_workers=2)
+        self.assertEqual(gz_paths, [fpath+'.gz' for fpath in files_list])
+        self.assertEqual(XnatUtils.gunzip_files(gz_paths, max_workers=2), files_list)
+        with open(files_list[0]) as f_obj:
+            self.assertEqual(f_obj.read(), 'small')
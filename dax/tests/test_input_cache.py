@@ -0,0 +1,115 @@
+from unittest import TestCase
+
+import os
+import time
+import shutil
+import tempfile
+
+from dax import XnatUtils
+
+
+class MockInterface(object):
+    host = 'https://xnat.test'
+
+
+class MockResource(object):
+    def __init__(self, uri):
+        self._intf = MockInterface()
+        self._uri = uri
+
+
+def get_catalog(*files):
+    return [{'path': path, 'size': len(data), 'digest': str(hash(data)), 'data': data}
+            for path, data in files]
+
+
+class TestInputCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        os.makedirs(self.cache_dir)
+        self.downloads = list()
+        self.saved = dict((name, getattr(XnatUtils, name)) for name in
+                          ['INPUT_CACHE_DIR', 'INPUT_CACHE_SIZE', 'download_catalog_files',
+                           'evict_input_cache'])
+        XnatUtils.INPUT_CACHE_DIR = self.cache_dir
+        XnatUtils.INPUT_CACHE_SIZE = 100
+        XnatUtils.download_catalog_files = self.download_catalog_files
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(XnatUtils, name, value)
+        shutil.rmtree(self.tmp_dir)
+
+    def download_catalog_files(self, res_dir, resource_obj, files_list, resume=False):
+        fpaths = list()
+        for file_dict in files_list:
+            self.downloads.append((resource_obj._uri, file_dict['path']))
+            fpath = os.path.join(res_dir, file_dict['path'])
+            if not os.path.isdir(os.path.dirname(fpath)):
+                os.makedirs(os.path.dirname(fpath))
+            with open(fpath, 'w') as f_obj:
+                f_obj.write(file_dict['data'])
+            fpaths.append(fpath)
+        return fpaths
+
+    def get_files(self, uri, files_list, name):
+        targets = [(file_dict, os.path.join(self.tmp_dir, name, file_dict['path']))
+                   for file_dict in files_list]
+        return XnatUtils.download_cached_files(MockResource(uri), files_list, targets)
+
+    def get_entries(self):
+        return sorted(name for name in os.listdir(self.cache_dir)
+                      if os.path.isdir(os.path.join(self.cache_dir, name)))
+
+    def test_miss_then_hit(self):
+        files_list = get_catalog(('a.nii', 'aaaa'), ('sub/b.txt', 'bb'))
+        fpaths = self.get_files('/res/1', files_list, 'job1')
+        self.assertEqual(len(self.downloads), 2)
+        with open(fpaths[1]) as f_obj:
+            self.assertEqual(f_obj.read(), 'bb')
+        fpaths = self.get_files('/res/1', files_list, 'job2')
+        # hit: nothing downloaded again
+        self.assertEqual(len(self.downloads), 2)
+        self.assertTrue(os.path.isfile(fpaths[0]))
+        self.assertEqual(len(self.get_entries()), 1)
+
+    def test_new_catalog_is_a_miss(self):
+        self.get_files('/res/1', get_catalog(('a.nii', 'aaaa')), 'job1')
+        self.get_files('/res/1', get_catalog(('a.nii', 'AAAA')), 'job2')
+        self.assertEqual(len(self.downloads), 2)
+        self.assertEqual(len(self.get_entries()), 2)
+
+    def test_use_input_cache(self):
+        files_list = get_catalog(('a.nii', 'aaaa'))
+        self.assertTrue(XnatUtils.use_input_cache(files_list))
+        files_list[0]['digest'] = ''
+        self.assertFalse(XnatUtils.use_input_cache(files_list))
+        XnatUtils.INPUT_CACHE_DIR = None
+        self.assertFalse(XnatUtils.use_input_cache(get_catalog(('a.nii', 'aaaa'))))
+
+    def test_eviction(self):
+        self.get_files('/res/1', get_catalog(('a.nii', 'a'*60)), 'job1')
+        old_entry = self.get_entries()[0]
+        past = time.time()-100
+        os.utime(os.path.join(self.cache_dir, old_entry), (past, past))
+        self.get_files('/res/2', get_catalog(('b.nii', 'b'*60)), 'job2')
+        # least recently used resource removed, with its lock
+        entries = self.get_entries()
+        self.assertEqual(len(entries), 1)
+        self.assertNotEqual(entries[0], old_entry)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, old_entry+'.lock')))
+        # the size measured is recorded for the next downloads
+        with open(os.path.join(self.cache_dir, '.size')) as f_size:
+            self.assertEqual(f_size.read(), '60')
+
+    def test_no_walk_under_the_limit(self):
+        evictions = list()
+        XnatUtils.evict_input_cache = lambda: evictions.append(1)
+        XnatUtils.set_input_cache_size(0)
+        self.get_files('/res/1', get_catalog(('a.nii', 'a'*30)), 'job1')
+        self.get_files('/res/2', get_catalog(('b.nii', 'b'*30)), 'job2')
+        self.get_files('/res/1', get_catalog(('a.nii', 'a'*30)), 'job3')
+        self.assertEqual(evictions, [])
+        self.get_files('/res/3', get_catalog(('c.nii', 'c'*60)), 'job4')
+        self.assertEqual(evictions, [1])
@@ -0,0 +1,149 @@
+from unittest import TestCase
+
+import os
+import json
+import stat
+import time
+import shutil
+import tempfile
+
+from dax import XnatUtils
+
+
+class MockInterface(object):
+    """Interface of a mock XNAT counting the requests"""
+    def __init__(self, user='user1', results=None):
+        self.host = 'https://xnat.test'
+        self.user = user
+        self.results = results if results is not None else [{'ID': 'PROJ1'}]
+        self.requests = list()
+        self.content = None
+
+    def _exec(self, uri, method):
+        self.requests.append(uri)
+        return self.content
+
+    def _get_json(self, uri):
+        self.requests.append(uri)
+        return [dict(row) for row in self.results]
+
+
+class TestListingCache(TestCase):
+    uri = '/REST/projects'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.saved = dict(XnatUtils.LISTING_CACHE)
+        self.intf = MockInterface()
+
+    def tearDown(self):
+        XnatUtils.disable_listing_cache()
+        XnatUtils.LISTING_CACHE.update(self.saved)
+        shutil.rmtree(self.tmp_dir)
+
+    def get_json(self, intf=None, endpoint='projects', **kwargs):
+        return XnatUtils.get_json(intf or self.intf, self.uri, endpoint, **kwargs)
+
+    def expire(self, seconds):
+        for entry in XnatUtils.LISTING_CACHE['responses'].values():
+            entry['time'] -= seconds
+
+    def test_disabled(self):
+        self.get_json()
+        self.get_json()
+        self.assertEqual(len(self.intf.requests), 2)
+
+    def test_cached_in_memory(self):
+        XnatUtils.enable_listing_cache(self.tmp_dir)
+        results = self.get_json()
+        results[0]['ID'] = 'modified'
+        self.assertEqual(self.get_json(), [{'ID': 'PROJ1'}])
+        self.assertEqual(len(self.intf.requests), 1)
+        self.get_json(nocache=True)
+        self.assertEqual(len(self.intf.requests), 2)
+
+    def test_key(self):
+        XnatUtils.enable_listing_cache(self.tmp_dir)
+        self.get_json()
+        # the listings depend on the access rights of the user
+        other = MockInterface(user='user2')
+        self.get_json(other)
+        self.assertEqual(len(other.requests), 1)
+        self.get_json(stamp='2-2017-01-01')
+        self.get_json(stamp='2-2017-01-01')
+        self.assertEqual(len(self.intf.requests), 2)
+
+    def test_ttl(self):
+        XnatUtils.enable_listing_cache(self.tmp_dir, ttl={'projects': 100})
+        self.get_json()
+        self.expire(99)
+        self.get_json()
+        self.assertEqual(len(self.intf.requests), 1)
+        self.expire(2)
+        self.get_json()
+        self.assertEqual(len(self.intf.requests), 2)
+        # TTL per endpoint
+        self.assertEqual(XnatUtils.LISTING_CACHE['ttl']['sessions'],
+                         XnatUtils.LISTING_CACHE_TTL['sessions'])
+
+    def test_shared_on_disk(self):
+        XnatUtils.enable_listing_cache(self.tmp_dir)
+        self.get_json()
+        cache_file = XnatUtils.get_listing_cache_file(('https://xnat.test', 'user1', self.uri))
+        self.assertTrue(os.path.isfile(cache_file))
+        self.assertEqual(stat.S_IMODE(os.stat(cache_file).st_mode), 0600)
+        # another process: nothing in memory
+        XnatUtils.disable_listing_cache()
+        XnatUtils.enable_listing_cache(self.tmp_dir)
+        self.assertEqual(self.get_json(), [{'ID': 'PROJ1'}])
+        self.assertEqual(len(self.intf.requests), 1)
+
+    def test_prune(self):
+        XnatUtils.enable_listing_cache(self.tmp_dir)
+        self.get_json()
+        cache_file = XnatUtils.get_listing_cache_file(('https://xnat.test', 'user1', self.uri))
+        past = time.time()-max(XnatUtils.LISTING_CACHE_TTL.values())-1
+        os.utime(cache_file, (past, past))
+        XnatUtils.enable_listing_cache(self.tmp_dir)
+        self.assertFalse(os.path.exists(cache_file))
+
+
+class TestIterJson(TestCase):
+    rows = [{'ID': 'XNAT_E001', 'label': 'SESS1'},
+            {'ID': 'XNAT_E002', 'label': 'SESS, "2" ]'}]
+
+    def setUp(self):
+        self.intf = MockInterface()
+
+    def iter_json(self, content, uri='/REST/experiments'):
+        self.intf.content = content
+        return list(XnatUtils.iter_json(self.intf, uri))
+
+    def test_rows(self):
+        content = json.dumps({'ResultSet': {'Result': self.rows, 'totalRecords': '2'}})
+        self.assertEqual(self.iter_json(content), self.rows)
+        self.assertEqual(self.intf.requests, ['/REST/experiments?format=json'])
+        self.iter_json(content, '/REST/experiments?columns=ID')
+        self.assertEqual(self.intf.requests[1], '/REST/experiments?columns=ID&format=json')
+
+    def test_layout(self):
+        content = '{"ResultSet": {"totalRecords": "2", "Result" : [\n %s ,\n\t%s\n] }}' % (
+            json.dumps(self.rows[0]), json.dumps(self.rows[1]))
+        # rows decoded from the response with the separators of XNAT
+        self.assertEqual(self.iter_json(content), self.rows)
+        self.assertEqual(self.iter_json('{"ResultSet": {"Result": []}}'), [])
+
+    def test_listing_cache(self):
+        saved = dict(XnatUtils.LISTING_CACHE)
+        tmp_dir = tempfile.mkdtemp()
+        XnatUtils.enable_listing_cache(tmp_dir)
+        try:
+            self.intf.results = self.rows
+            for _ in range(2):
+                rows = list(XnatUtils.iter_json(self.intf, '/REST/experiments', 'sessions'))
+                self.assertEqual(rows, self.rows)
+            self.assertEqual(len(self.intf.requests), 1)
+        finally:
+            XnatUtils.disable_listing_cache()
+            XnatUtils.LISTING_CACHE.update(saved)
+            shutil.rmtree(tmp_dir)
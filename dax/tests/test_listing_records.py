@@ -0,0 +1,117 @@
+from unittest import TestCase
+
+import json
+import pickle
+
+from dax import XnatUtils
+
+SESSION_INFO = ('right', 'female', '1980', '36', '2017-01-01 10:00:00.0',
+                '2017-01-02 10:00:00.0')
+SCAN_ROW = {'ID': 'XNAT_E001', 'label': 'SESS1', 'URI': '/data/experiments/XNAT_E001',
+            'subject_label': 'SUBJ1', 'xsiType': 'xnat:mrSessionData',
+            'xnat:imagesessiondata/subject_id': 'XNAT_S001',
+            'xnat:imagescandata/id': '301', 'xnat:imagescandata/quality': 'usable',
+            'xnat:imagescandata/note': '', 'xnat:imagescandata/frames': '176',
+            'xnat:imagescandata/series_description': 'T1 MPRAGE',
+            'xnat:imagescandata/type': 'T1', 'xnat:imagescandata/file/label': 'NIFTI'}
+ASSESSOR_ROW = {'ID': 'XNAT_E002', 'label': 'PROJ-x-SUBJ1-x-SESS1-x-301-x-Test_v1',
+                'URI': '/data/experiments/XNAT_E002', 'session_ID': 'XNAT_E001',
+                'session_label': 'SESS1', 'xsiType': 'proc:genProcData',
+                'xnat:imagesessiondata/subject_id': 'XNAT_S001',
+                'proc:genprocdata/procstatus': 'COMPLETE',
+                'proc:genprocdata/validation/status': 'Needs QA',
+                'proc:genprocdata/proctype': 'Test_v1',
+                'proc:genprocdata/procversion': '1.0.0',
+                'proc:genprocdata/jobid': '1234',
+                'proc:genprocdata/out/file/label': 'STATS'}
+
+
+def session_dict():
+    return dict(zip(XnatUtils.ListingRecord.SESSION_KEYS, SESSION_INFO))
+
+
+def get_scan_dict():
+    """Dictionary of the scan as built by list_project_scans before the records"""
+    scan = {'scan_id': '301', 'scan_label': '301', 'scan_quality': 'usable',
+            'scan_note': '', 'scan_frames': '176', 'scan_description': 'T1 MPRAGE',
+            'scan_type': 'T1', 'ID': '301', 'label': '301', 'quality': 'usable',
+            'note': '', 'frames': '176', 'series_description': 'T1 MPRAGE', 'type': 'T1',
+            'project_id': 'PROJ', 'project_label': 'PROJ', 'subject_id': 'XNAT_S001',
+            'subject_label': 'SUBJ1', 'session_type': 'MR', 'session_id': 'XNAT_E001',
+            'session_label': 'SESS1', 'session_uri': '/data/experiments/XNAT_E001',
+            'resources': ['NIFTI']}
+    scan.update(session_dict())
+    return scan
+
+
+def get_assessor_dict():
+    """Dictionary of the assessor as built by list_project_assessors before the records"""
+    assessor = {'ID': 'XNAT_E002', 'label': 'PROJ-x-SUBJ1-x-SESS1-x-301-x-Test_v1',
+                'uri': '/data/experiments/XNAT_E002', 'assessor_id': 'XNAT_E002',
+                'assessor_label': 'PROJ-x-SUBJ1-x-SESS1-x-301-x-Test_v1',
+                'assessor_uri': '/data/experiments/XNAT_E002', 'project_id': 'PROJ',
+                'project_label': 'PROJ', 'subject_id': 'XNAT_S001', 'subject_label': 'SUBJ1',
+                'session_type': 'MR', 'session_id': 'XNAT_E001', 'session_label': 'SESS1',
+                'procstatus': 'COMPLETE', 'qcstatus': 'Needs QA', 'proctype': 'Test_v1',
+                'version': '1.0.0', 'xsiType': 'proc:genProcData', 'jobid': '1234',
+                'jobstartdate': None, 'memused': None, 'walltimeused': None,
+                'jobnode': None, 'resources': ['STATS']}
+    assessor.update(session_dict())
+    return assessor
+
+
+class TestListingRecords(TestCase):
+    def setUp(self):
+        self.scan = XnatUtils.get_scan_row(SCAN_ROW, 'PROJ', {'XNAT_E001': SESSION_INFO})
+        self.assessor = XnatUtils.get_genproc_assessor_row(
+            ASSESSOR_ROW, 'PROJ', {'XNAT_E001': ('SUBJ1', 'MR', SESSION_INFO)})
+
+    def test_same_as_dictionaries(self):
+        self.assertEqual(self.scan, get_scan_dict())
+        self.assertEqual(dict(self.scan.items()), get_scan_dict())
+        self.assertEqual(sorted(self.scan.keys()), sorted(get_scan_dict().keys()))
+        self.assertEqual(self.assessor, get_assessor_dict())
+        self.assertEqual(len(self.assessor), len(get_assessor_dict()))
+        self.assertEqual(self.scan['scan_type'], 'T1')
+        self.assertEqual(self.scan.get('missing', 'default'), 'default')
+        self.assertRaises(KeyError, lambda: self.scan['missing'])
+
+    def test_pickle(self):
+        self.scan['extra'] = 1
+        del self.scan['yob']
+        loaded = pickle.loads(pickle.dumps(self.scan, pickle.HIGHEST_PROTOCOL))
+        self.assertIsInstance(loaded, XnatUtils.ScanRecord)
+        self.assertEqual(loaded, self.scan)
+        self.assertNotIn('yob', loaded)
+        self.assertEqual(loaded['extra'], 1)
+
+    def test_json(self):
+        expected = json.loads(json.dumps(get_scan_dict()))
+        self.assertEqual(json.loads(json.dumps(self.scan, default=XnatUtils.json_default)),
+                         expected)
+        self.assertEqual(json.loads(json.dumps([self.scan], cls=XnatUtils.ListingJSONEncoder)),
+                         [expected])
+
+    def test_modify(self):
+        other = XnatUtils.get_scan_row(SCAN_ROW, 'PROJ', {'XNAT_E001': SESSION_INFO})
+        scan_dict = get_scan_dict()
+        for row in [self.scan, scan_dict]:
+            row['scan_quality'] = 'unusable'
+            row['age'] = '37'
+            row.update({'gender': 'male'}, new_key='value')
+            del row['handedness']
+            self.assertEqual(row.pop('scan_note'), '')
+            self.assertEqual(row.pop('scan_note', 'default'), 'default')
+            self.assertEqual(row.setdefault('yob', '1990'), '1980')
+        # the field of an alias is shared with the other keys in a record
+        self.assertEqual(self.scan['quality'], 'unusable')
+        scan_dict['quality'] = 'unusable'
+        del scan_dict['note']
+        self.assertEqual(self.scan, scan_dict)
+        self.assertRaises(KeyError, self.scan.__delitem__, 'handedness')
+        # the session information shared with the other rows is not changed
+        self.assertEqual(other, get_scan_dict())
+        copy = self.scan.copy()
+        self.assertIsInstance(copy, dict)
+        copy['ID'] = '401'
+        self.assertEqual(self.scan['ID'], '301')
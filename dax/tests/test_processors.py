@@ -0,0 +1,167 @@
+from unittest import TestCase
+
+from dax import XnatUtils
+from dax.processors import ScanProcessor, SessionProcessor
+
+SESSION_XML = """<xnat:MRSession xmlns:xnat="http://nrg.wustl.edu/xnat" \
+xmlns:proc="http://nrg.wustl.edu/proc" \
+xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ID="E1" label="SESS1" project="PROJ">
+<xnat:subject_ID>SUBJ1</xnat:subject_ID>
+<xnat:scans>{scans}</xnat:scans>
+<xnat:assessors>{assessors}</xnat:assessors>
+</xnat:MRSession>"""
+SCAN_XML = """<xnat:scan ID="{scan_id}" type="{scan_type}" xsi:type="xnat:mrScanData">\
+<xnat:quality>{quality}</xnat:quality></xnat:scan>"""
+ASSESSOR_XML = """<xnat:assessor ID="{label}_ID" label="{label}" project="PROJ" \
+xsi:type="proc:genProcData"><proc:procstatus>{procstatus}</proc:procstatus>\
+<proc:proctype>{proctype}</proc:proctype><proc:jobid>{jobid}</proc:jobid>\
+<xnat:validation status="{qcstatus}"/></xnat:assessor>"""
+
+
+def get_csess(scans=None, assessors=None):
+    """
+    Build a CachedImageSession from lists of scans (id, type, quality) and
+     assessors (proctype, procstatus, jobid, qcstatus)
+    """
+    scans_xml = ''.join(SCAN_XML.format(scan_id=scan_id, scan_type=scan_type,
+                                        quality=quality)
+                        for scan_id, scan_type, quality in scans or [])
+    assrs_xml = ''.join(ASSESSOR_XML.format(label='PROJ-x-SUBJ1-x-SESS1-x-'+proctype,
+                                            proctype=proctype, procstatus=procstatus,
+                                            jobid=jobid, qcstatus=qcstatus)
+                        for proctype, procstatus, jobid, qcstatus in assessors or [])
+    return XnatUtils.CachedImageSession(None, 'PROJ', 'SUBJ1', 'SESS1',
+                                        xml_str=SESSION_XML.format(scans=scans_xml,
+                                                                   assessors=assrs_xml))
+
+
+class TestScanProc(ScanProcessor):
+    def __init__(self, scan_types='T1'):
+        super(TestScanProc, self).__init__(scan_types, '01:00:00', 1024,
+                                           '/tmp/Spider_ScanTest_v1_0_0.py')
+
+
+class TestSessionProc(SessionProcessor):
+    def __init__(self, **kwargs):
+        super(TestSessionProc, self).__init__('01:00:00', 1024,
+                                              '/tmp/Spider_SessTest_v1_0_0.py')
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class TestDiffCachedSessions(TestCase):
+    def test_no_changes(self):
+        csess = get_csess([('1', 'T1', 'usable')], [('FS_v1', 'COMPLETE', '1', 'Passed')])
+        changes = XnatUtils.diff_cached_sessions(csess, csess)
+        self.assertFalse(changes['session'])
+        self.assertEqual(changes['scans'], set())
+        self.assertEqual(changes['assessors'], set())
+
+    def test_scan_changes(self):
+        old = get_csess([('1', 'T1', 'usable'), ('2', 'DTI', 'usable')])
+        new = get_csess([('1', 'T1', 'unusable'), ('3', 'fMRI', 'usable')])
+        changes = XnatUtils.diff_cached_sessions(old, new)
+        self.assertEqual(changes['scans'], set(['1', '2', '3']))
+        self.assertEqual(changes['scantypes'], set(['T1', 'DTI', 'fMRI']))
+
+    def test_status_only_change(self):
+        old = get_csess(assessors=[('FS_v1', 'JOB_RUNNING', '1', 'Job Pending')])
+        new = get_csess(assessors=[('FS_v1', 'READY_TO_UPLOAD', '2', 'Job Pending')])
+        changes = XnatUtils.diff_cached_sessions(old, new)
+        label = 'PROJ-x-SUBJ1-x-SESS1-x-FS_v1'
+        self.assertEqual(changes['assessors'], set([label]))
+        self.assertEqual(changes['proctypes'], set(['FS_v1']))
+        self.assertEqual(changes['status'], set([label]))
+
+    def test_complete_and_qc_are_not_status_only(self):
+        old = get_csess(assessors=[('FS_v1', 'READY_TO_COMPLETE', '1', 'Needs QA')])
+        new = get_csess(assessors=[('FS_v1', 'COMPLETE', '1', 'Needs QA')])
+        self.assertEqual(XnatUtils.diff_cached_sessions(old, new)['status'], set())
+        old = get_csess(assessors=[('FS_v1', 'COMPLETE', '1', 'Needs QA')])
+        new = get_csess(assessors=[('FS_v1', 'COMPLETE', '1', 'Passed')])
+        changes = XnatUtils.diff_cached_sessions(old, new)
+        self.assertEqual(len(changes['assessors']), 1)
+        self.assertEqual(changes['status'], set())
+
+    def test_assessor_removed(self):
+        old = get_csess(assessors=[('FS_v1', 'COMPLETE', '1', 'Passed')])
+        changes = XnatUtils.diff_cached_sessions(old, get_csess())
+        self.assertEqual(changes['proctypes'], set(['FS_v1']))
+        self.assertEqual(changes['status'], set())
+
+    def test_update_cached_assessors(self):
+        old = get_csess(assessors=[('FS_v1', 'COMPLETE', '1', 'Passed')])
+        new = get_csess(assessors=[('FS_v1', 'COMPLETE', '1', 'Failed'),
+                                   ('SessTest_v1', 'NEED_TO_RUN', '', 'Job Pending')])
+        XnatUtils.update_cached_assessors(old, new, ['PROJ-x-SUBJ1-x-SESS1-x-SessTest_v1'])
+        changes = XnatUtils.diff_cached_sessions(old, new)
+        # only the assessor not built is still a change
+        self.assertEqual(changes['assessors'], set(['PROJ-x-SUBJ1-x-SESS1-x-FS_v1']))
+
+
+class TestShouldRebuild(TestCase):
+    proctypes = set(['FS_v1', 'ScanTest_v1', 'SessTest_v1'])
+
+    def get_changes(self, old, new):
+        return XnatUtils.diff_cached_sessions(get_csess(*old), get_csess(*new))
+
+    def test_input_types_from_attributes(self):
+        proc = TestSessionProc(scan_types='T1,MPRAGE', fs_proctype='FS')
+        self.assertEqual(proc.get_input_types(self.proctypes),
+                         (set(['T1', 'MPRAGE']), set(['FS'])))
+        proc = TestSessionProc(scantypes=['T1', 'FS_v1'])
+        self.assertEqual(proc.get_input_types(self.proctypes),
+                         (set(['T1']), set(['FS_v1'])))
+        proc = TestSessionProc(scan_types='all')
+        self.assertEqual(proc.get_input_types(self.proctypes), (None, set()))
+        # nothing describing the inputs: any scan/assessor
+        self.assertEqual(TestSessionProc().get_input_types(self.proctypes), (None, None))
+        # the scan types of a scan processor are not other inputs
+        self.assertEqual(TestScanProc().get_input_types(self.proctypes), (None, None))
+        proc = TestSessionProc(scan_types='T1')
+        proc.input_proctypes = ['FS_v1']
+        self.assertEqual(proc.get_input_types(self.proctypes), (set(['T1']), set(['FS_v1'])))
+
+    def test_session_processor_assessor_inputs(self):
+        proc = TestSessionProc(scan_types='T1', fs_proctype='FS')
+        csess = get_csess()
+        changes = self.get_changes([None, [('ScanTest_v1', 'JOB_RUNNING', '1', 'Job Pending')]],
+                                   [None, [('ScanTest_v1', 'COMPLETE', '1', 'Needs QA')]])
+        self.assertFalse(proc.should_rebuild(csess, changes, self.proctypes))
+        changes = self.get_changes([None, [('FS_v1', 'JOB_RUNNING', '1', 'Job Pending')]],
+                                   [None, [('FS_v1', 'READY_TO_UPLOAD', '1', 'Job Pending')]])
+        self.assertTrue(proc.should_rebuild(csess, changes, self.proctypes))
+
+    def test_session_processor_scan_inputs(self):
+        proc = TestSessionProc(scan_types='T1')
+        csess = get_csess()
+        changes = self.get_changes([[('1', 'DTI', 'usable')]], [[('1', 'DTI', 'unusable')]])
+        self.assertFalse(proc.should_rebuild(csess, changes, self.proctypes))
+        changes = self.get_changes([[]], [[('2', 'T1', 'usable')]])
+        self.assertTrue(proc.should_rebuild(csess, changes, self.proctypes))
+
+    def test_unknown_inputs_ignore_status_only_changes(self):
+        proc = TestSessionProc()
+        csess = get_csess()
+        changes = self.get_changes([None, [('FS_v1', 'JOB_RUNNING', '1', 'Job Pending')]],
+                                   [None, [('FS_v1', 'READY_TO_UPLOAD', '2', 'Job Pending')]])
+        self.assertFalse(proc.should_rebuild(csess, changes, self.proctypes))
+        changes = self.get_changes([None, [('FS_v1', 'READY_TO_COMPLETE', '1', 'Needs QA')]],
+                                   [None, [('FS_v1', 'COMPLETE', '1', 'Needs QA')]])
+        self.assertTrue(proc.should_rebuild(csess, changes, self.proctypes))
+
+    def test_own_assessor(self):
+        proc = TestSessionProc(scan_types='T1')
+        changes = self.get_changes([None, [('SessTest_v1', 'JOB_RUNNING', '1', 'Job Pending')]],
+                                   [None, [('SessTest_v1', 'JOB_FAILED', '1', 'Job Pending')]])
+        self.assertTrue(proc.should_rebuild(get_csess(), changes, self.proctypes))
+
+    def test_scan_processor(self):
+        proc = TestScanProc()
+        csess = get_csess([('1', 'T1', 'usable'), ('2', 'T1', 'usable')])
+        cscan = csess.scans()[0]
+        changes = self.get_changes([[('1', 'T1', 'usable')]], [[('1', 'T1', 'unusable')]])
+        self.assertTrue(proc.should_rebuild(cscan, changes, self.proctypes))
+        changes = self.get_changes([None, [('FS_v1', 'JOB_RUNNING', '1', 'Job Pending')]],
+                                   [None, [('FS_v1', 'READY_TO_UPLOAD', '2', 'Job Pending')]])
+        self.assertFalse(proc.should_rebuild(cscan, changes, self.proctypes))
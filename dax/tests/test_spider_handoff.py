@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+import os
+import shutil
+import tempfile
+
+from dax import XnatUtils
+
+
+class TestSpiderHandoff(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.job_dir = os.path.join(self.tmp_dir, 'job')
+        self.results_dir = os.path.join(self.tmp_dir, 'results')
+        os.makedirs(self.job_dir)
+        os.makedirs(self.results_dir)
+        # upload directory of the test
+        XnatUtils.DAX_SETTINGS.get_results_dir = lambda: self.results_dir
+
+    def tearDown(self):
+        del XnatUtils.DAX_SETTINGS.get_results_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def get_handler(self, **kwargs):
+        return XnatUtils.SpiderProcessHandler('Spider_Test_v1_0_0.py', '', 'PROJ',
+                                              'SUBJ', 'SESS', **kwargs)
+
+    def write_result(self, name, data='results'):
+        fpath = os.path.join(self.job_dir, name)
+        with open(fpath, 'w') as f_res:
+            f_res.write(data)
+        return fpath
+
+    def get_upload_path(self, resource, name):
+        return os.path.join(self.results_dir, 'PROJ-x-SUBJ-x-SESS-x-Test_v1', resource, name)
+
+    def test_default_moves_results(self):
+        fpath = self.write_result('stats.txt')
+        self.get_handler().add_file(fpath, 'STATS')
+        self.assertFalse(os.path.exists(fpath))
+        with open(self.get_upload_path('STATS', 'stats.txt')) as f_res:
+            self.assertEqual(f_res.read(), 'results')
+
+    def test_copy_does_not_share_data(self):
+        fpath = self.write_result('stats.txt')
+        self.get_handler(handoff='copy').add_file(fpath, 'STATS')
+        with open(fpath, 'w') as f_res:
+            f_res.write('changed')
+        with open(self.get_upload_path('STATS', 'stats.txt')) as f_res:
+            self.assertEqual(f_res.read(), 'results')
+
+    def test_link_is_opt_in(self):
+        fpath = self.write_result('stats.txt')
+        self.get_handler(handoff='link').add_file(fpath, 'STATS')
+        self.assertTrue(os.path.samefile(fpath, self.get_upload_path('STATS', 'stats.txt')))
+
+    def test_move_folder(self):
+        folder = os.path.join(self.job_dir, 'OUT')
+        os.makedirs(os.path.join(folder, 'sub'))
+        with open(os.path.join(folder, 'sub', 'data.txt'), 'w') as f_res:
+            f_res.write('data')
+        self.get_handler().add_folder(folder)
+        self.assertFalse(os.path.exists(folder))
+        self.assertTrue(os.path.isfile(self.get_upload_path('OUT', os.path.join('sub', 'data.txt'))))
@@ -0,0 +1,147 @@
+from unittest import TestCase
+
+import os
+
+from dax.tests.utils import load_script
+
+
+class MockListings(object):
+    """Listing functions of XnatUtils returning the objects of a mock XNAT"""
+    def __init__(self, subjects, sessions):
+        self.subjects = subjects
+        self.sessions = sessions
+
+    def list_subjects(self, intf, project, nocache=False):
+        return [subj for subj in self.subjects if subj['xnat'] == intf.name]
+
+    def list_sessions(self, intf, project, nocache=False):
+        return [sess for sess in self.sessions if sess['xnat'] == intf.name]
+
+
+class MockProject(object):
+    def exists(self):
+        return True
+
+
+class MockSelect(object):
+    def project(self, project):
+        return MockProject()
+
+
+class MockInterface(object):
+    def __init__(self, name):
+        self.name = name
+        self.select = MockSelect()
+
+
+def subj(xnat, label, last_modified):
+    return {'xnat': xnat, 'label': label, 'last_modified': last_modified}
+
+
+def sess(xnat, subject, label, last_modified):
+    return {'xnat': xnat, 'subject_label': subject, 'label': label,
+            'last_modified': last_modified}
+
+
+def assr(session, label, last_modified):
+    return {'session_label': session, 'label': label, 'last_modified': last_modified}
+
+
+class TestSyncChanges(TestCase):
+    def setUp(self):
+        self.mirror = load_script(os.path.join('Xnat_tools', 'Xnatmirror'))
+        subjects = [subj('src', 'S1', '2020-01-01 10:00:00.0'),
+                    subj('src', 'S2', '2020-03-01 10:00:00.0'),
+                    subj('dst', 'S1', '2020-01-01 10:00:00.0'),
+                    subj('dst', 'S2', '2020-01-01 10:00:00.0')]
+        sessions = [sess('src', 'S1', 'E1', '2020-01-01 10:00:00.0'),
+                    sess('src', 'S2', 'E2', '2020-03-01 10:00:00.0'),
+                    sess('src', 'S1', 'E3', '2020-01-01 10:00:00.0'),
+                    sess('dst', 'S1', 'E1', '2020-01-01 10:00:00.0'),
+                    sess('dst', 'S2', 'E2', '2020-01-01 10:00:00.0')]
+        assessors = [assr('E1', 'P-x-S1-x-E1-x-FS', '2020-03-02 10:00:00.0'),
+                     assr('E2', 'P-x-S2-x-E2-x-FS', '2020-01-01 10:00:00.0')]
+        self.mirror['XnatUtils'] = MockListings(subjects, sessions)
+        self.mirror['list_assessors_modified'] = lambda intf, project: assessors
+
+    def get_changes(self, watermark):
+        return self.mirror['get_sync_changes'](MockInterface('src'), MockInterface('dst'),
+                                               'P', watermark)
+
+    def test_changes_since_watermark(self):
+        changes = self.get_changes('2020-02-01 00:00:00.0')
+        self.assertEqual(changes['subjects'], set(['S2']))
+        # E3 is not on the destination, E1 only has an assessor modified
+        self.assertEqual(changes['sessions_modified'], set(['E2', 'E3']))
+        self.assertEqual(changes['assessors'], set(['P-x-S1-x-E1-x-FS']))
+        self.assertEqual(changes['sessions'], set([('S1', 'E1'), ('S2', 'E2'), ('S1', 'E3')]))
+        self.assertEqual(changes['watermark'], '2020-03-02 10:00:00.0')
+
+    def test_first_sync(self):
+        changes = self.get_changes(None)
+        self.assertEqual(changes['subjects'], set(['S1', 'S2']))
+        self.assertEqual(changes['sessions_modified'], set(['E1', 'E2', 'E3']))
+        self.assertEqual(len(changes['assessors']), 2)
+
+    def test_no_changes(self):
+        changes = self.get_changes('2020-03-02 10:00:00.0')
+        self.assertEqual(changes['subjects'], set())
+        self.assertEqual(changes['sessions'], set([('S1', 'E1'), ('S1', 'E3')]))
+        self.assertEqual(changes['watermark'], '2020-03-02 10:00:00.0')
+
+    def test_is_sync_modified(self):
+        is_sync_modified = self.mirror['is_sync_modified']
+        self.mirror['SYNC_CHANGES'] = None
+        self.assertFalse(is_sync_modified('assessors', 'P-x-S1-x-E1-x-FS'))
+        self.mirror['SYNC_CHANGES'] = self.get_changes('2020-02-01 00:00:00.0')
+        self.assertTrue(is_sync_modified('assessors', 'P-x-S1-x-E1-x-FS'))
+        self.assertFalse(is_sync_modified('assessors', 'P-x-S2-x-E2-x-FS'))
+        self.assertFalse(is_sync_modified('sessions_modified', 'E1'))
+
+
+def get_catalog(nb_files, size, ext):
+    return [{'path': 'file%d%s' % (index, ext), 'size': size, 'digest': ''}
+            for index in range(nb_files)]
+
+
+class TestTransferStrategy(TestCase):
+    def setUp(self):
+        self.mirror = load_script(os.path.join('Xnat_tools', 'Xnatmirror'))
+        self.mirror['STRATEGY'] = 'auto'
+
+    def use_zip(self, files_list):
+        return self.mirror['choose_transfer_strategy'](files_list)[0]
+
+    def test_thresholds(self):
+        # pinned: change them with the benchmark (dax/tests/benchmark_transfer.py)
+        self.assertEqual(self.mirror['ZIP_MIN_FILES'], 50)
+        self.assertEqual(self.mirror['ZIP_SMALL_FILE_SIZE'], 1024**2)
+        self.assertEqual(self.mirror['ZIP_MIN_COMPRESSIBLE'], 0.5)
+        self.assertEqual(self.mirror['ZIP_MAX_SIZE'], 10*1024**3)
+
+    def test_single_file(self):
+        self.assertFalse(self.use_zip(get_catalog(1, 1024, '.dcm')))
+
+    def test_many_files(self):
+        self.assertTrue(self.use_zip(get_catalog(50, 5*1024**2, '.nii.gz')))
+        self.assertFalse(self.use_zip(get_catalog(49, 5*1024**2, '.nii.gz')))
+
+    def test_small_files(self):
+        self.assertTrue(self.use_zip(get_catalog(2, 1024**2-1, '.nii.gz')))
+        self.assertFalse(self.use_zip(get_catalog(2, 1024**2, '.nii.gz')))
+
+    def test_compressible(self):
+        self.assertTrue(self.use_zip(get_catalog(3, 100*1024**2, '.nii')))
+        files_list = get_catalog(1, 100*1024**2, '.nii') + get_catalog(1, 100*1024**2, '.mgz')
+        self.assertTrue(self.use_zip(files_list))
+        files_list = get_catalog(1, 100*1024**2, '.nii') + get_catalog(2, 100*1024**2, '.mgz')
+        self.assertFalse(self.use_zip(files_list))
+
+    def test_too_big(self):
+        self.assertFalse(self.use_zip(get_catalog(100, 200*1024**2, '.dcm')))
+
+    def test_forced(self):
+        self.mirror['STRATEGY'] = 'files'
+        self.assertFalse(self.use_zip(get_catalog(100, 1024, '.dcm')))
+        self.mirror['STRATEGY'] = 'zip'
+        self.assertTrue(self.use_zip(get_catalog(1, 1024, '.dcm')))
@@ -0,0 +1,22 @@
+import os
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bin')
+
+
+def load_script(path):
+    """
+    Load the functions and variables of a script of bin/ in a dictionary
+     (the main code only runs or exits when the script is __main__)
+
+    :param path: path to the script relative to bin/
+    :return: dictionary of the globals of the script
+    """
+    path = os.path.join(BIN_DIR, path)
+    namespace = {'__name__': os.path.basename(path), '__file__': path}
+    with open(path) as f_script:
+        code = compile(f_script.read(), path, 'exec')
+    try:
+        exec(code, namespace)
+    except SystemExit:
+        pass
+    return namespace
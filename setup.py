@@ -43,6 +43,7 @@ if __name__ == '__main__':
                             'lxml',
                             'pyxnat',
                             'httplib2',
+                            'requests',
                             'matplotlib',
                             'numpy',
                             'nibabel',